@@ -0,0 +1,186 @@
+"""
+Feature cache
+
+Features of vector data sources (e.g. shapefiles) read once through fiona
+and kept in a local SQLite file, with geometries as WKB and properties as
+JSON, so later reads of an unchanged source skip fiona parsing.
+
+"""
+import json
+import os
+import sqlite3
+
+import fiona
+from shapely import wkb
+from shapely.geometry import shape, mapping
+
+# Files beside a shapefile holding its properties, index and projection
+SIDECAR_EXTENSIONS = ('.dbf', '.shx', '.prj')
+
+
+def read_features(path, cache_path):
+    """
+    Read the features of ``path``, through a FeatureCache at
+    ``cache_path``.
+
+    Returns
+    -------
+    list_of_dicts
+        GeoJSON-like features, with type, id, geometry and properties.
+
+    """
+    return FeatureCache(cache_path).read(path)
+
+
+class FeatureCache():
+    """
+    Features of vector data sources, held in an SQLite file.
+
+    Each source is keyed by its absolute path, and is read again through
+    fiona whenever the modification time or size of it, or of any
+    shapefile sidecar (.dbf, .shx, .prj), has changed since it was cached.
+
+    Properties are held as JSON, so a source with properties JSON cannot
+    represent (e.g. dates) raises TypeError rather than being cached with
+    changed types.
+
+    Parameters
+    ----------
+    cache_path : string
+        Path of the SQLite file, created along with its directory if it
+        does not exist.
+
+    """
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+
+    def _connect(self):
+        directory = os.path.dirname(os.path.abspath(self.cache_path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        connection = sqlite3.connect(self.cache_path)
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS sources ('
+            'path TEXT PRIMARY KEY, signature TEXT NOT NULL)')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS features ('
+            'path TEXT NOT NULL, position INTEGER NOT NULL, id TEXT, '
+            'geometry BLOB, properties TEXT NOT NULL, '
+            'PRIMARY KEY (path, position))')
+        return connection
+
+    def read(self, path):
+        """
+        Return the features of ``path``, from the cache if it is current,
+        otherwise read through fiona and cached.
+
+        Returns
+        -------
+        list_of_dicts
+            GeoJSON-like features, with type, id, geometry and properties,
+            in the order of the source.
+
+        """
+        key = os.path.abspath(path)
+        signature = _signature(key)
+
+        connection = self._connect()
+        try:
+            row = connection.execute(
+                'SELECT signature FROM sources WHERE path = ?', (key,)).fetchone()
+
+            if row is not None and row[0] == signature:
+                rows = connection.execute(
+                    'SELECT id, geometry, properties FROM features '
+                    'WHERE path = ? ORDER BY position', (key,))
+                return [_to_feature(*row) for row in rows]
+
+            features = _read_source(key)
+
+            with connection:
+                connection.execute('DELETE FROM features WHERE path = ?', (key,))
+                connection.executemany(
+                    'INSERT INTO features VALUES (?, ?, ?, ?, ?)',
+                    (
+                        (key, position) + _to_row(feature)
+                        for position, feature in enumerate(features)
+                    )
+                )
+                connection.execute(
+                    'INSERT OR REPLACE INTO sources VALUES (?, ?)',
+                    (key, signature))
+
+            return features
+
+        finally:
+            connection.close()
+
+    def invalidate(self, path=None):
+        """
+        Drop the cached features of ``path``, or of all sources.
+        """
+        connection = self._connect()
+        try:
+            with connection:
+                if path is None:
+                    connection.execute('DELETE FROM features')
+                    connection.execute('DELETE FROM sources')
+                else:
+                    key = os.path.abspath(path)
+                    connection.execute('DELETE FROM features WHERE path = ?', (key,))
+                    connection.execute('DELETE FROM sources WHERE path = ?', (key,))
+        finally:
+            connection.close()
+
+
+def _signature(path):
+    """
+    Modification time and size of ``path`` and any shapefile sidecars.
+    """
+    paths = [path] + [
+        os.path.splitext(path)[0] + extension
+        for extension in SIDECAR_EXTENSIONS
+    ]
+
+    stats = []
+    for file_path in paths:
+        if os.path.exists(file_path):
+            stat = os.stat(file_path)
+            stats.append([os.path.basename(file_path), stat.st_mtime_ns, stat.st_size])
+
+    return json.dumps(stats)
+
+
+def _read_source(path):
+    with fiona.open(path, 'r') as source:
+        return [
+            {
+                'type': 'Feature',
+                'id': feature['id'],
+                'geometry': (
+                    mapping(shape(feature['geometry']))
+                    if feature['geometry'] is not None else None
+                ),
+                'properties': dict(feature['properties']),
+            }
+            for feature in source
+        ]
+
+
+def _to_row(feature):
+    geometry = feature['geometry']
+    return (
+        feature['id'],
+        wkb.dumps(shape(geometry)) if geometry is not None else None,
+        json.dumps(feature['properties']),
+    )
+
+
+def _to_feature(feature_id, geometry, properties):
+    return {
+        'type': 'Feature',
+        'id': feature_id,
+        'geometry': mapping(wkb.loads(geometry)) if geometry is not None else None,
+        'properties': json.loads(properties),
+    }
@@ -0,0 +1,154 @@
+"""
+
+Aggregate fixed network results from exchanges to local authority districts
+
+"""
+import numpy as np
+from scipy import sparse
+
+TECHNOLOGIES = ('fttp', 'fttdp', 'fttc', 'adsl')
+
+
+class LadAggregator():
+    """
+
+    Area-weighted membership of exchanges in local authority districts
+    (LADs), held as a sparse LAD by exchange weight matrix.
+
+    Premises of an exchange are shared between the LADs it intersects in
+    proportion to the weight of each intersection, and coverage and
+    capacity are rolled up premises-weighted, with one sparse matrix
+    product per metric.
+
+    Arguments
+    ---------
+    memberships : list_of_dicts
+        Intersections of exchanges and LADs, as written by
+        scripts/fixed_preprocess.py:
+        * exchange_id: exchange id
+        * lad_id: LAD id
+        * weight: share of the exchange area falling in the LAD
+
+    Attributes
+    ----------
+    exchange_ids : list
+        Exchange ids, in matrix column order.
+    lad_ids : list
+        LAD ids, sorted, in matrix row order.
+    weights : scipy.sparse.csr_matrix
+        The LAD by exchange weight matrix.
+
+    """
+    def __init__(self, memberships):
+
+        self.exchange_ids = []
+        self._columns = {}
+        lad_ids = set()
+
+        rows = []
+        columns = []
+        weights = []
+        for membership in memberships:
+            exchange_id = membership['exchange_id']
+            if exchange_id not in self._columns:
+                self._columns[exchange_id] = len(self.exchange_ids)
+                self.exchange_ids.append(exchange_id)
+
+            lad_ids.add(membership['lad_id'])
+            rows.append(membership['lad_id'])
+            columns.append(self._columns[exchange_id])
+            weights.append(float(membership['weight']))
+
+        self.lad_ids = sorted(lad_ids)
+        lad_rows = {lad_id: row for row, lad_id in enumerate(self.lad_ids)}
+
+        # repeated exchange and LAD pairs are summed
+        self.weights = sparse.coo_matrix(
+            (weights, ([lad_rows[lad_id] for lad_id in rows], columns)),
+            shape=(len(self.lad_ids), len(self.exchange_ids))).tocsr()
+
+    def aggregate(self, system):
+        """
+
+        Roll up the coverage and capacity of a ``system`` to LADs.
+
+        Where exchange ids repeat only the first is counted.
+
+        Arguments
+        ---------
+        system : NetworkManager
+            The fixed network system.
+
+        Returns
+        -------
+        list_of_dicts
+            One row per LAD, sorted by id:
+            * id: LAD id
+            * percentage_of_premises_with_{technology}: premises-weighted
+              coverage
+            * average_capacity: premises-weighted capacity
+            * sum_of_premises: premises allocated to the LAD
+
+        Raises
+        ------
+        ValueError
+            If exchanges of the system have no LAD memberships.
+
+        """
+        coverage = system.coverage()
+        capacity = system.capacity()
+
+        # line up exchange results with the matrix columns
+        positions = []
+        columns = []
+        seen = set()
+        missing = []
+        for position, item in enumerate(coverage):
+            column = self._columns.get(item['id'])
+            if column is None:
+                missing.append(item['id'])
+            elif item['id'] not in seen:
+                seen.add(item['id'])
+                positions.append(position)
+                columns.append(column)
+
+        if missing:
+            raise ValueError('Exchanges missing from the LAD lookup: {}'.format(
+                ', '.join(str(exchange_id) for exchange_id in missing)))
+
+        def by_column(values):
+            values = np.asarray(values, dtype=float)
+            output = np.zeros(len(self.exchange_ids))
+            output[columns] = values[positions]
+            return output
+
+        premises = by_column([item['sum_of_premises'] for item in coverage])
+        lad_premises = self.weights.dot(premises)
+
+        shares = {}
+        for technology in TECHNOLOGIES:
+            key = 'percentage_of_premises_with_{}'.format(technology)
+            shares[key] = _weighted_mean(self.weights.dot(
+                premises * by_column([item[key] for item in coverage])),
+                lad_premises)
+        shares['average_capacity'] = _weighted_mean(self.weights.dot(
+            premises * by_column([item['average_capacity'] for item in capacity])),
+            lad_premises)
+
+        lad_premises = lad_premises.tolist()
+
+        output = []
+        for row, lad_id in enumerate(self.lad_ids):
+            result = {'id': lad_id}
+            for key, values in shares.items():
+                result[key] = values[row]
+            result['sum_of_premises'] = lad_premises[row]
+            output.append(result)
+
+        return output
+
+
+def _weighted_mean(weighted_totals, weights):
+    means = np.zeros(len(weights))
+    np.divide(weighted_totals, weights, out=means, where=weights > 0)
+    return means.tolist()
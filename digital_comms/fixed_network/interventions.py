@@ -3,13 +3,22 @@
 Decide on interventions
 
 """
-import math
+import heapq
+
+import numpy as np
+
+# Relative tolerance on budgets, so that float costs summing to a budget are
+# affordable despite rounding in their cumulative sum
+BUDGET_TOLERANCE = 1e-9
 
 def get_all_assets_ranked(system, technology, roll_out, percentile):
     """
 
     Specifically obtain and rank exchanges by technology and policy.
 
+    Exchanges come from the ranking index kept by the system, so are not
+    sorted again on each call.
+
     Parameters
     ----------
     distributions : list of digital_comms.fixed_network.model.Distribution
@@ -26,148 +35,313 @@ def get_all_assets_ranked(system, technology, roll_out, percentile):
         and reverse_value preference.
 
     """
-    if roll_out == 'insideout':
-        handle = '{}_unserved'.format(technology)
-        all_assets = sorted(
-            (exchange for exchange in system._exchanges \
-            if getattr(exchange, technology) != exchange.total_prems),
-                key=lambda item: getattr(item, handle), reverse=True)
+    assets = list(system.ranked_exchanges(technology, roll_out, percentile))
 
-    elif roll_out == 'rural':
-        handle = '{}_unserved'.format(technology)
-        all_assets = sorted(
-            (exchange for exchange in system._exchanges \
-            if getattr(exchange, technology) != exchange.total_prems),
-                key=lambda item: getattr(item, handle), reverse=False)
+    return assets
 
-    elif roll_out == 'outsidein':
-        handle = '{}_unserved'.format(technology)
 
-        all_assets = sorted(
-            (exchange for exchange in system._exchanges \
-            if getattr(exchange, technology) != exchange.total_prems),
-                key=lambda item: getattr(item, handle), reverse=False)
+def decide_interventions(system, technology, policy, parameters):
+    """
 
-    else:
-        raise ValueError('Did not recognise ranking preference variable')
+    Decide which exchanges to upgrade with ``technology`` under a ``policy``.
 
-    cutoff = math.floor(len(all_assets) * percentile)
+    The market spends the annual budget on exchanges in ranked order until
+    the next is unaffordable. Under a subsidy policy, exchanges beyond the
+    subsidy percentile which the market did not upgrade are then
+    subsidised in ranked order, until the next subsidy is unaffordable.
+    Both steps are found in one call to :func:`budget_feasible_interventions`.
 
-    assets = all_assets[cutoff:]
+    Given a list of technologies, they compete for the budgets in one pass,
+    as in :func:`decide_mixed_interventions`.
 
-    return assets
+    Parameters
+    ----------
+    system : NetworkManager
+    technology : str or list of str
+        The technology, or technologies, being deployed.
+    policy : str
+        Policy and roll out, e.g. 'market_insideout' or 'subsidy_rural'.
+    parameters : dict
+        Contains the annual budget and subsidy parameters.
 
+    Returns
+    -------
+    list_of_tuples
+        Asset id, technology, policy, capital investment type, total cost,
+        private sector spending and subsidy of each upgrade.
 
-def decide_interventions(system, technology, policy, parameters):
     """
-    ???
+    if not isinstance(technology, str):
+        return decide_mixed_interventions(system, technology, policy, parameters)
+
+    roll_out = policy.split('_')[1]
+    policy = policy.split('_')[0]
 
+    if policy not in ('market', 'subsidy'):
+        raise ValueError('Did not recognise stipulated policy')
+
+    assets = _unique_assets(system.ranked_exchanges(technology, roll_out, 0))
+    costs = np.array([asset.rollout_costs[technology] for asset in assets])
+
+    if policy == 'market':
+        number_of_market_upgrades, _, _, _ = budget_feasible_interventions(
+            costs, parameters['annual_budget'])
+
+        return [
+            (asset.id, technology, policy, 'private', cost, 0, 0)
+            for asset, cost in zip(
+                assets[:number_of_market_upgrades],
+                costs[:number_of_market_upgrades].tolist())
+        ]
+
+    percentile = parameters['subsidy_{}_percentile'.format(roll_out)]
+    max_market_investment_per_dwelling = parameters['max_market_investment_per_dwelling']
+
+    # exchanges beyond the percentile, and their position in the ranking
+    positions = {}
+    for position, asset in enumerate(assets):
+        positions[asset.id] = position
+
+    subsidised_assets = _unique_assets(
+        system.ranked_exchanges(technology, roll_out, percentile))
+    subsidised_positions = np.array(
+        [positions[asset.id] for asset in subsidised_assets], dtype=np.int64)
+    subsidised_costs = np.array(
+        [asset.rollout_costs[technology] for asset in subsidised_assets])
+
+    handle = '{}_unserved'.format(technology)
+    dwellings_to_upgrade = np.array(
+        [getattr(asset, handle) for asset in subsidised_assets], dtype=float)
+
+    number_of_market_upgrades, subsidised, private_investment, subsidy = \
+        budget_feasible_interventions(
+            costs, parameters['annual_budget'],
+            subsidised_positions, subsidised_costs,
+            dwellings_to_upgrade * max_market_investment_per_dwelling,
+            parameters['annual_subsidy'])
+
+    built_interventions = [
+        (asset.id, technology, policy, 'private', cost, cost, 0)
+        for asset, cost in zip(
+            assets[:number_of_market_upgrades],
+            costs[:number_of_market_upgrades].tolist())
+    ]
+
+    for index in np.flatnonzero(subsidised).tolist():
+        built_interventions.append(
+            (
+                subsidised_assets[index].id,
+                technology,
+                policy,
+                'public_private',
+                subsidised_costs[index].item(), #total cost
+                private_investment[index].item(), #private sector spending
+                subsidy[index].item(), #subsidy
+            )
+        )
+
+    return built_interventions
+
+
+def decide_mixed_interventions(system, technologies, policy, parameters):
     """
-    built_interventions = []
-    upgraded_ids = []
-    premises_passed = 0
 
-    annual_budget = parameters['annual_budget']
+    Decide which exchanges to upgrade, and with which of ``technologies``,
+    under a ``policy``, with all technologies competing for one budget.
 
+    Every unserved exchange is a candidate for each technology, valued by
+    its cost per premises passed, i.e. per premises without the technology.
+    The market buys candidates from a shared heap, cheapest per premises
+    first, until the next is unaffordable, and upgrades each exchange with
+    at most one technology. Under a subsidy policy, candidates beyond the
+    subsidy percentile of their technology which the market did not
+    upgrade are then subsidised from a second heap, by subsidy per premises
+    passed, until the next subsidy is unaffordable. Ties are broken by the
+    roll out ranking, then by the order of ``technologies``.
+
+    Parameters
+    ----------
+    system : NetworkManager
+    technologies : list of str
+        The technologies being deployed.
+    policy : str
+        Policy and roll out, e.g. 'market_insideout' or 'subsidy_rural'.
+    parameters : dict
+        Contains the annual budget and subsidy parameters.
+
+    Returns
+    -------
+    list_of_tuples
+        Asset id, technology, policy, capital investment type, total cost,
+        private sector spending and subsidy of each upgrade, as given by
+        :func:`decide_interventions`.
+
+    """
     roll_out = policy.split('_')[1]
     policy = policy.split('_')[0]
 
+    if policy not in ('market', 'subsidy'):
+        raise ValueError('Did not recognise stipulated policy')
+
+    candidates = []
+    for order, technology in enumerate(technologies):
+        ranked = _unique_assets(system.ranked_exchanges(technology, roll_out, 0))
+        for rank, asset in enumerate(ranked):
+            premises_passed = asset.total_prems - getattr(asset, technology)
+            if premises_passed > 0:
+                cost = asset.rollout_costs[technology]
+                candidates.append(
+                    (cost / premises_passed, rank, order, asset, technology))
+
+    heapq.heapify(candidates)
+
+    built_interventions = []
+    upgraded_ids = set()
+    budget = parameters['annual_budget']
+
+    while candidates:
+        _, _, _, asset, technology = heapq.heappop(candidates)
+        if asset.id in upgraded_ids:
+            continue
+
+        cost = asset.rollout_costs[technology]
+        if cost > budget:
+            break
+
+        budget -= cost
+        upgraded_ids.add(asset.id)
+        built_interventions.append((
+            asset.id, technology, policy, 'private', cost,
+            cost if policy == 'subsidy' else 0, 0
+        ))
+
     if policy == 'market':
+        return built_interventions
 
-        assets = get_all_assets_ranked(system, technology, roll_out, 0)
-
-        capital_investment_type= 'private'
-
-        for asset in assets:
-            if asset.id not in upgraded_ids:
-                if asset.rollout_costs[technology] <= annual_budget:
-                    annual_budget -= asset.rollout_costs[technology]
-                    built_interventions.append(
-                        (
-                            asset.id,
-                            technology,
-                            policy,
-                            capital_investment_type,
-                            asset.rollout_costs[technology],
-                            0,
-                            0,
-                        )
-                    )
-                    upgraded_ids.append(asset.id)
-                    premises_passed += asset.total_prems
-                else:
-                    break
-
-    elif policy == 'subsidy':
-
-        capital_investment_type = 'private'
-
-        assets = get_all_assets_ranked(system, technology, roll_out, 0)
-
-        for asset in assets:
-            if asset.id not in upgraded_ids:
-                if asset.rollout_costs[technology] <= annual_budget:
-                    annual_budget -= asset.rollout_costs[technology]
-                    built_interventions.append(
-                        (
-                            asset.id,
-                            technology,
-                            policy,
-                            capital_investment_type,
-                            asset.rollout_costs[technology], #total cost
-                            asset.rollout_costs[technology], #private sector spending
-                            0, #subsidy
-                        )
-                    )
-                    upgraded_ids.append(asset.id)
-                    premises_passed += asset.total_prems
-                else:
-                    break
-
-        capital_investment_type = 'public_private'
-        percentile = parameters['subsidy_{}_percentile'.format(roll_out)]
-        max_market_investment_per_dwelling = parameters['max_market_investment_per_dwelling']
-        annual_subsidy = parameters['annual_subsidy']
-        market_match_funding = parameters['market_match_funding']
-
-        subsidised_assets = get_all_assets_ranked(system, technology, roll_out, percentile)
-
-        for asset in subsidised_assets:
-            if asset.id not in upgraded_ids:
-
-                handle = '{}_unserved'.format(technology)
-                dwellings_to_upgrade = getattr(asset, handle)
-
-                total_private_investment = round(dwellings_to_upgrade *  max_market_investment_per_dwelling)
-
-                total_upgrade_cost = asset.rollout_costs[technology]
-
-                if total_upgrade_cost <= total_private_investment:
-                    total_subsidy = 0
-                else:
-                    total_subsidy = round(total_upgrade_cost - total_private_investment)
-
-                if total_subsidy <= annual_subsidy:
-
-                    annual_subsidy -= total_subsidy
-                    market_match_funding -= total_private_investment
-
-                    built_interventions.append(
-                        (
-                            asset.id,
-                            technology,
-                            policy,
-                            capital_investment_type,
-                            total_upgrade_cost, #total cost
-                            total_private_investment, #private sector spending
-                            total_subsidy, #subsidy
-                        )
-                    )
-                    upgraded_ids.append(asset.id)
-
-                else:
-                    break
-    else:
-        raise ValueError('Did not recognise stipulated policy')
+    percentile = parameters['subsidy_{}_percentile'.format(roll_out)]
+    max_market_investment_per_dwelling = parameters['max_market_investment_per_dwelling']
+
+    candidates = []
+    for order, technology in enumerate(technologies):
+        handle = '{}_unserved'.format(technology)
+        ranked = _unique_assets(
+            system.ranked_exchanges(technology, roll_out, percentile))
+        for rank, asset in enumerate(ranked):
+            premises_passed = asset.total_prems - getattr(asset, technology)
+            if asset.id in upgraded_ids or premises_passed <= 0:
+                continue
+
+            cost = asset.rollout_costs[technology]
+            private_investment = int(round(
+                getattr(asset, handle) * max_market_investment_per_dwelling))
+            if cost <= private_investment:
+                subsidy = 0
+            else:
+                subsidy = int(round(cost - private_investment))
+
+            candidates.append((subsidy / premises_passed, rank, order, asset,
+                technology, private_investment, subsidy))
+
+    heapq.heapify(candidates)
+
+    budget = parameters['annual_subsidy']
+
+    while candidates:
+        _, _, _, asset, technology, private_investment, subsidy = \
+            heapq.heappop(candidates)
+        if asset.id in upgraded_ids:
+            continue
+
+        if subsidy > budget:
+            break
+
+        budget -= subsidy
+        upgraded_ids.add(asset.id)
+        built_interventions.append((
+            asset.id, technology, policy, 'public_private',
+            asset.rollout_costs[technology], private_investment, subsidy
+        ))
 
     return built_interventions
+
+
+def budget_feasible_interventions(costs, annual_budget, subsidised_positions=None,
+                                  subsidised_costs=None, market_investment=None,
+                                  annual_subsidy=None):
+    """
+
+    Find the upgrades the market and a subsidy can afford, buying ranked
+    exchanges in order until the next is unaffordable.
+
+    The market buys the prefix of ``costs`` whose cumulative sum fits the
+    ``annual_budget``. Each subsidised exchange the market did not buy is
+    subsidised for the part of its cost above the (rounded) market
+    investment, and the subsidy buys these in order while the cumulative
+    subsidy fits the ``annual_subsidy``. Budgets are compared within a
+    relative BUDGET_TOLERANCE, as float costs, e.g. from a CostCurveTable,
+    can sum to a little over a budget they exactly meet.
+
+    Parameters
+    ----------
+    costs : numpy.ndarray
+        Upgrade costs of the ranked exchanges.
+    annual_budget : float
+    subsidised_positions : numpy.ndarray
+        Position in ``costs`` of each exchange eligible for subsidy, in the
+        order they are subsidised.
+    subsidised_costs : numpy.ndarray
+        Upgrade costs of the exchanges eligible for subsidy.
+    market_investment : numpy.ndarray
+        Market investment available for each exchange eligible for subsidy.
+    annual_subsidy : float
+
+    Returns
+    -------
+    number_of_market_upgrades : int
+        Length of the prefix of ``costs`` bought by the market.
+    subsidised : numpy.ndarray
+        Whether each exchange eligible for subsidy is subsidised, or None
+        without subsidy.
+    private_investment, subsidy : numpy.ndarray
+        Private investment and subsidy for each exchange eligible for
+        subsidy, or None without subsidy.
+
+    """
+    number_of_market_upgrades = int(np.searchsorted(
+        np.cumsum(costs), _with_tolerance(annual_budget), side='right'))
+
+    if subsidised_positions is None:
+        return number_of_market_upgrades, None, None, None
+
+    private_investment = np.round(market_investment).astype(np.int64)
+    subsidy = np.where(subsidised_costs <= private_investment, 0,
+        np.round(subsidised_costs - private_investment)).astype(np.int64)
+
+    # exchanges upgraded by the market are skipped, costing nothing
+    eligible = subsidised_positions >= number_of_market_upgrades
+    cumulative_subsidy = np.cumsum(np.where(eligible, subsidy, 0))
+    number_considered = np.searchsorted(
+        cumulative_subsidy, _with_tolerance(annual_subsidy), side='right')
+
+    subsidised = eligible & (np.arange(len(subsidy)) < number_considered)
+
+    return number_of_market_upgrades, subsidised, private_investment, subsidy
+
+
+def _with_tolerance(budget):
+    return budget + BUDGET_TOLERANCE * max(abs(budget), 1)
+
+
+def _unique_assets(assets):
+    """
+    Keep the first of any ranked exchanges sharing an id, as only the first
+    would be upgraded.
+    """
+    unique_assets = []
+    seen_ids = set()
+    for asset in assets:
+        if asset.id not in seen_ids:
+            seen_ids.add(asset.id)
+            unique_assets.append(asset)
+
+    return unique_assets
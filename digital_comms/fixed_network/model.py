@@ -1,10 +1,25 @@
 """Cambridge Communications Assessment Model
 """
 from collections import defaultdict
-from math import ceil
+from math import ceil, floor
+from types import MappingProxyType
 from abc import abstractmethod, abstractproperty, ABCMeta
 from typing import Dict
 
+import numpy as np
+
+# Roll-out cost of each technology for an exchange, shared by all exchanges
+# without a cost table
+ROLL_OUT_COSTS = {
+    'fttp': 100000,
+    'fttdp': 50000,
+    'fttc': 25000,
+}
+
+# Read-only view of ROLL_OUT_COSTS given to exchanges, so that no exchange
+# can change the costs shared by all of them
+_SHARED_ROLL_OUT_COSTS = MappingProxyType(ROLL_OUT_COSTS)
+
 #####################
 # MODEL
 #####################
@@ -22,6 +37,12 @@ class NetworkManager():
         Contains all links between Premises, Distribution Points, Cabinets and Exchanges.
     parameters : dict
         Contains all parameters from 'digital_comms.yml'.
+    columnar : bool
+        Hold exchange data in an ExchangeTable, finding coverage and
+        capacity for all exchanges in vectorised passes.
+    cost_table : CostCurveTable
+        Roll-out costs per dwelling, interpolated on exchange dwelling
+        density. Without one, exchanges share ROLL_OUT_COSTS.
 
     Attributes
     ----------
@@ -47,16 +68,190 @@ class NetworkManager():
         Calculates the average premises connection.
 
     """
-    def __init__(self, exchanges, simulation_parameters):
+    def __init__(self, exchanges, simulation_parameters, columnar=False,
+                 cost_table=None):
+
+        self._simulation_parameters = simulation_parameters
+        self._cost_table = cost_table
 
         self._exchanges = []
+        self._exchange_index = {}
+        self._exchanges_by_id = defaultdict(list)
+        self._record_index = {}
+        self._table = None
+        self._ranking = None
         for exchange in exchanges:
+            self.add_exchange(exchange)
 
-            exchange = Exchange(
-                exchange,
-                simulation_parameters
-            )
-            self._exchanges.append(exchange)
+        # find the costs of all exchanges in one pass, rather than as each
+        # is first ranked
+        if cost_table is not None:
+            cost_table.cache_roll_out_costs(self._exchanges)
+
+        # optionally hold exchange data as columns, so coverage and
+        # capacity are found for all exchanges at once
+        if columnar:
+            self._table = ExchangeTable(self._exchanges)
+
+
+    def add_exchange(self, data):
+        """
+
+        Add an exchange to the system, given its ``data`` as passed on
+        construction.
+
+        Returns
+        -------
+        Exchange
+            The exchange added.
+
+        """
+        exchange = Exchange(
+            data,
+            self._simulation_parameters,
+            self._cost_table
+        )
+        self._exchanges.append(exchange)
+        if self._table is not None:
+            self._table.append(exchange)
+        self._ranking = None
+
+        # as with a search of the exchange list, the first exchange with an
+        # id is the one found by it
+        self._exchange_index.setdefault(exchange.id, exchange)
+        self._exchanges_by_id[exchange.id].append(exchange)
+        self._record_index.setdefault((exchange.id, exchange.lad), exchange)
+
+        return exchange
+
+
+    def remove_exchange(self, exchange_id):
+        """
+
+        Remove the exchange with ``exchange_id`` from the system.
+
+        Returns
+        -------
+        Exchange
+            The exchange removed.
+
+        """
+        exchange = self._exchange_index.pop(exchange_id)
+        if self._table is not None:
+            self._table.remove(exchange)
+        self._exchanges.remove(exchange)
+        self._ranking = None
+
+        same_id = self._exchanges_by_id[exchange_id]
+        same_id.remove(exchange)
+        if same_id:
+            self._exchange_index[exchange_id] = same_id[0]
+        else:
+            del self._exchanges_by_id[exchange_id]
+
+        key = (exchange.id, exchange.lad)
+        del self._record_index[key]
+        for other in same_id:
+            if other.lad == exchange.lad:
+                self._record_index[key] = other
+                break
+
+        return exchange
+
+
+    def get_exchange(self, exchange_id):
+        """
+
+        Return the exchange with ``exchange_id``, or None if there is none.
+
+        """
+        return self._exchange_index.get(exchange_id)
+
+
+    def find_exchanges(self, key):
+        """
+
+        Return the exchanges matching ``key``: every exchange with an
+        exchange id, or the exchange of an (exchange id, LAD id) record.
+
+        """
+        if isinstance(key, tuple):
+            exchange = self._record_index.get(key)
+            return [exchange] if exchange is not None else []
+
+        return list(self._exchanges_by_id.get(key, ()))
+
+
+    def update_dwellings(self, dwellings):
+        """
+
+        Update the number of premises served by exchanges.
+
+        Exchange ids repeat where an exchange is split between LADs, so
+        dwellings can be given for each (exchange id, LAD id) record. An
+        exchange id alone sets the dwellings of every exchange with it.
+
+        Arguments
+        ---------
+        dwellings: dict
+            Number of dwellings, by exchange id or (exchange id, LAD id).
+            Keys matching no exchange in the system are ignored.
+
+        Returns
+        -------
+        list
+            Keys of the exchanges whose number of premises changed.
+
+        """
+        changed_ids = []
+        changed_exchanges = []
+
+        for key, exchange_dwellings in dwellings.items():
+            changed = False
+            for exchange in self.find_exchanges(key):
+                if exchange.update_dwellings(exchange_dwellings):
+                    changed = True
+                    changed_exchanges.append(exchange)
+                    if self._table is not None:
+                        self._table.update(exchange)
+
+            if changed:
+                changed_ids.append(key)
+
+        if self._cost_table is not None and changed_exchanges:
+            self._cost_table.cache_roll_out_costs(changed_exchanges)
+
+        # unserved densities have changed, so exchanges are ranked again
+        if changed_ids:
+            self._ranking = None
+
+        return changed_ids
+
+
+    def ranked_exchanges(self, technology, roll_out, percentile):
+        """
+
+        Iterate over the exchanges without full ``technology`` coverage,
+        ranked for a ``roll_out``, from the ``percentile`` cut-off onwards.
+
+        The ranking is built on first use and kept up to date as exchanges
+        are upgraded.
+
+        Arguments
+        ---------
+        technology : str
+            'fttp', 'fttdp' or 'fttc'
+        roll_out : str
+            'insideout' ranks by descending unserved premises density,
+            'rural' and 'outsidein' by ascending density.
+        percentile : float
+            Share of the ranked exchanges to skip.
+
+        """
+        if self._ranking is None:
+            self._ranking = RankingIndex(self._exchanges)
+
+        return self._ranking.ranked(technology, roll_out, percentile)
 
 
     def upgrade(self, interventions):
@@ -69,20 +264,44 @@ class NetworkManager():
         interventions: list of tuple
             A list of intervention tuples containing asset id and technology
 
+        Returns
+        -------
+        list
+            Ids of interventions which match no exchange in the system, and
+            so were not applied.
+
         """
+        unknown_ids = []
+
         for intervention in interventions:
 
             asset_id = intervention[0]
             technology = intervention[1]
 
-            exchange = [exchange for exchange in self._exchanges if exchange.id == asset_id][0]
+            exchange = self._exchange_index.get(asset_id)
+            if exchange is None:
+                unknown_ids.append(asset_id)
+                continue
+
             exchange.upgrade(technology)
+            if self._table is not None:
+                self._table.update(exchange)
+            if self._ranking is not None:
+                self._ranking.update(exchange)
+
+        if unknown_ids:
+            print('could not find exchanges to upgrade: {}'.format(unknown_ids))
+
+        return unknown_ids
 
 
     def coverage(self):
         """
         define coverage
         """
+        if self._table is not None:
+            return self._table.coverage()
+
         # run statistics on each lad
         coverage_results = []
 
@@ -120,6 +339,9 @@ class NetworkManager():
         Define capacity
 
         """
+        if self._table is not None:
+            return self._table.capacity()
+
         capacity_results = []
 
         for asset in self._exchanges:
@@ -192,6 +414,9 @@ class Exchange():
         Contains all assets (Cabinets) served by an Exchange.
     parameters : dict
         Contains all parameters from 'digital_comms.yml'.
+    cost_table : CostCurveTable
+        Roll-out costs per dwelling by dwelling density, shared by all
+        exchanges. Without one, ROLL_OUT_COSTS are used.
 
     self.fttp = raw number of unserved premises
     self.fttdp = raw number of unserved premises
@@ -203,7 +428,7 @@ class Exchange():
     self.fttc_unserved = number of unserved premises per km^2
 
     """
-    def __init__(self, data, simulation_parameters):
+    def __init__(self, data, simulation_parameters, cost_table=None):
         self.id = data["exchange_id"]
         self.lad = data["lad_id"]
         self.area = data['area']
@@ -219,18 +444,69 @@ class Exchange():
         self.fttdp_unserved = (100 - self.fttdp) / self.area
         self.fttc_unserved = (100 - self.fttc) / self.area
 
-        self.rollout_costs = self._calculate_roll_out_costs()
+        self.cost_table = cost_table
+        self._rollout_costs = None
 
+    @property
+    def rollout_costs(self):
+        """
+        Roll-out cost of each technology, found when first needed and kept
+        until dwellings change. Without a cost table this is a read-only
+        view of ROLL_OUT_COSTS.
+        """
+        if self._rollout_costs is None:
+            self._rollout_costs = self._calculate_roll_out_costs()
+        return self._rollout_costs
 
     def _calculate_roll_out_costs(self):
 
-        costs = {
-            'fttp': 100000,
-            'fttdp': 50000,
-            'fttc': 25000,
-        }
+        if self.cost_table is None:
+            return _SHARED_ROLL_OUT_COSTS
+
+        return self.cost_table.roll_out_costs([self])[0]
 
-        return costs
+    def update_dwellings(self, dwellings):
+        """
+
+        Update the number of premises served by the exchange.
+
+        The share of premises with each technology is kept, so premises
+        added to a fully upgraded exchange are also upgraded. Unserved
+        densities are found again.
+
+        Arguments
+        ---------
+        dwellings : int
+
+        Returns
+        -------
+        bool
+            Whether the number of premises changed.
+
+        """
+        dwellings = int(dwellings)
+        if dwellings == self.total_prems:
+            return False
+
+        if self.total_prems > 0:
+            growth = dwellings / self.total_prems
+            for technology in ('fttp', 'fttdp', 'fttc', 'adsl'):
+                quantity = getattr(self, technology)
+                if quantity == self.total_prems:
+                    setattr(self, technology, dwellings)
+                else:
+                    setattr(self, technology, quantity * growth)
+
+        self.total_prems = dwellings
+
+        self.fttp_unserved = (100 - self.fttp) / self.area
+        self.fttdp_unserved = (100 - self.fttdp) / self.area
+        self.fttc_unserved = (100 - self.fttc) / self.area
+
+        if self.cost_table is not None:
+            self._rollout_costs = None
+
+        return True
 
     def upgrade(self, action):
         """
@@ -260,6 +536,444 @@ class Exchange():
             # self._docsis3 = 0
             self.adsl = 100
 
+        elif action in ('fttc'):
+            self.fttc = self.total_prems
+            self.adsl = 100
+
+
+class ExchangeTable():
+    """
+
+    Exchange data held as NumPy columns, one row per exchange.
+
+    Gives the same coverage, capacity and unserved premises density results
+    as looping over :class:`Exchange` objects, rounded in the same way, but
+    found in vectorised passes over all exchanges.
+
+    Arguments
+    ---------
+    exchanges : list of Exchange
+        Exchanges to hold, in order.
+
+    """
+    TECHNOLOGIES = ('fttp', 'fttdp', 'fttc', 'adsl')
+
+    def __init__(self, exchanges):
+        self.ids = [exchange.id for exchange in exchanges]
+        self.dwellings = np.array(
+            [exchange.total_prems for exchange in exchanges], dtype=np.int64)
+        self.area = np.array(
+            [exchange.area for exchange in exchanges], dtype=float)
+        self.technologies = {
+            technology: np.array(
+                [getattr(exchange, technology) for exchange in exchanges],
+                dtype=float)
+            for technology in self.TECHNOLOGIES
+        }
+
+        # as on Exchange, unserved densities are found from the coverage
+        # on construction
+        self.unserved = {
+            technology: (100 - self.technologies[technology]) / self.area
+            for technology in ('fttp', 'fttdp', 'fttc')
+        }
+
+        self._positions = {
+            exchange: position for position, exchange in enumerate(exchanges)
+        }
+
+    def __len__(self):
+        return len(self.ids)
+
+    def append(self, exchange):
+        """
+        Add a row for a newly built ``exchange``.
+        """
+        self._positions[exchange] = len(self.ids)
+        self.ids.append(exchange.id)
+        self.dwellings = np.append(self.dwellings, exchange.total_prems)
+        self.area = np.append(self.area, float(exchange.area))
+        for technology in self.TECHNOLOGIES:
+            self.technologies[technology] = np.append(
+                self.technologies[technology], getattr(exchange, technology))
+        for technology in self.unserved:
+            self.unserved[technology] = np.append(
+                self.unserved[technology],
+                getattr(exchange, '{}_unserved'.format(technology)))
+
+    def remove(self, exchange):
+        """
+        Remove the row of ``exchange``.
+        """
+        position = self._positions.pop(exchange)
+        del self.ids[position]
+        self.dwellings = np.delete(self.dwellings, position)
+        self.area = np.delete(self.area, position)
+        for technology in self.TECHNOLOGIES:
+            self.technologies[technology] = np.delete(
+                self.technologies[technology], position)
+        for technology in self.unserved:
+            self.unserved[technology] = np.delete(
+                self.unserved[technology], position)
+
+        for other, other_position in self._positions.items():
+            if other_position > position:
+                self._positions[other] = other_position - 1
+
+    def update(self, exchange):
+        """
+        Refresh the row of ``exchange`` after it is upgraded or its
+        dwellings change.
+        """
+        position = self._positions[exchange]
+        self.dwellings[position] = exchange.total_prems
+        for technology in self.TECHNOLOGIES:
+            self.technologies[technology][position] = getattr(exchange, technology)
+        for technology in self.unserved:
+            self.unserved[technology][position] = getattr(
+                exchange, '{}_unserved'.format(technology))
+
+    def coverage(self):
+        """
+        Percentage of premises with each technology, by exchange, as given
+        by :meth:`NetworkManager.coverage`.
+        """
+        percentages = {
+            technology: _calculate_percentages(
+                self.technologies[technology], self.dwellings)
+            for technology in self.TECHNOLOGIES
+        }
+        dwellings = self.dwellings.tolist()
+
+        return [
+            {
+                'id': self.ids[position],
+                'percentage_of_premises_with_fttp': percentages['fttp'][position],
+                'percentage_of_premises_with_fttdp': percentages['fttdp'][position],
+                'percentage_of_premises_with_fttc': percentages['fttc'][position],
+                'percentage_of_premises_with_adsl': percentages['adsl'][position],
+                'sum_of_premises': dwellings[position],
+            }
+            for position in range(len(self.ids))
+        ]
+
+    def capacity(self):
+        """
+        Average premises connection capacity, by exchange, as given by
+        :meth:`NetworkManager.capacity`.
+        """
+        total_prems = self.dwellings
+        fttp = self.technologies['fttp']
+        fttdp = self.technologies['fttdp']
+        fttc = self.technologies['fttc']
+
+        prems_with_fttp = _get_prems_with_techs(fttp, total_prems)
+        prems_with_fttdp = _get_prems_with_techs(fttdp - fttp, total_prems)
+        prems_with_fttc = _get_prems_with_techs(fttc - fttdp, total_prems)
+
+        # each tier is only counted while the premises it adds fit in the
+        # exchange, summing in the same order as NetworkManager.capacity
+        cumulative_premises = prems_with_fttp
+        summed_capacity = np.where(cumulative_premises <= total_prems,
+            prems_with_fttp * _generic_connection_capacity('fttp'), 0.0)
+
+        cumulative_premises = cumulative_premises + prems_with_fttdp
+        summed_capacity = summed_capacity + np.where(
+            cumulative_premises <= total_prems,
+            prems_with_fttdp * _generic_connection_capacity('fttdp'), 0.0)
+
+        cumulative_premises = cumulative_premises + prems_with_fttc
+        fits = cumulative_premises <= total_prems
+        summed_capacity = summed_capacity + np.where(fits,
+            prems_with_fttc * _generic_connection_capacity('fttc'), 0.0)
+        summed_capacity = summed_capacity + np.where(fits,
+            (total_prems - cumulative_premises) *
+            _generic_connection_capacity('adsl'), 0.0)
+
+        average_capacity = np.zeros(len(self.ids))
+        served = (summed_capacity > 0) | (total_prems > 0)
+        average_capacity[served] = np.round(
+            summed_capacity[served] / total_prems[served])
+        average_capacity = average_capacity.astype(np.int64).tolist()
+
+        return [
+            {
+                'id': self.ids[position],
+                'average_capacity': average_capacity[position],
+            }
+            for position in range(len(self.ids))
+        ]
+
+
+class CostCurveTable():
+    """
+
+    Roll-out cost per dwelling of each technology, interpolated on dwelling
+    density.
+
+    Each technology has a cost curve through points of dwelling density and
+    cost, such as the mean density and cost of each geotype written to the
+    cost density lookup by scripts/arc_fixed.py. Costs are interpolated
+    between neighbouring points, and extrapolated from the two lowest or
+    two highest density points, as by ``lookup_cost`` there: costs above
+    the highest density are bounded below by ``lower_bound``.
+
+    There is no geotype axis. A geotype only places one point on a curve,
+    at its mean density, and ``lookup_cost`` interpolates on density alone
+    across geotypes, so a ``geotype`` key in ``cost_curves`` is ignored.
+
+    Technologies without a curve fall back to their ROLL_OUT_COSTS.
+
+    Curves are compiled to sorted NumPy arrays on construction, so costs
+    for many exchanges are found in one vectorised pass.
+
+    Arguments
+    ---------
+    cost_curves : list_of_dicts
+        Points on the cost curves:
+        * strategy: the technology
+        * dwelling_density: dwellings per km^2
+        * cost: cost per dwelling
+    lower_bound : float
+        Lowest cost per dwelling above the highest density point.
+
+    """
+    def __init__(self, cost_curves, lower_bound=500):
+
+        points = defaultdict(list)
+        for item in cost_curves:
+            points[item['strategy']].append(
+                (float(item['dwelling_density']), float(item['cost'])))
+
+        self.lower_bound = lower_bound
+        self._curves = {}
+        for technology, density_costs in points.items():
+            if len(density_costs) < 2:
+                raise ValueError(
+                    'Cost curve for {} needs at least two points'.format(technology))
+
+            density_costs = sorted(density_costs, key=lambda d: d[0])
+            self._curves[technology] = (
+                np.array([density for density, _ in density_costs]),
+                np.array([cost for _, cost in density_costs]),
+            )
+
+    @property
+    def technologies(self):
+        return list(self._curves)
+
+    def cost_per_dwelling(self, technology, dwelling_density):
+        """
+
+        Cost per dwelling of ``technology`` at each ``dwelling_density``.
+
+        Returns
+        -------
+        numpy.ndarray
+
+        """
+        densities, costs = self._curves[technology]
+        dwelling_density = np.asarray(dwelling_density, dtype=float)
+
+        # the segment starting at the highest density point at or below each
+        # density, using the first or last segment beyond the curve
+        segment = np.clip(
+            np.searchsorted(densities, dwelling_density, side='right') - 1,
+            0, len(densities) - 2)
+
+        x0, y0 = densities[segment], costs[segment]
+        x1, y1 = densities[segment + 1], costs[segment + 1]
+        cost = (y0 * (x1 - dwelling_density) + y1 * (dwelling_density - x0)) / (x1 - x0)
+
+        return np.where(dwelling_density >= densities[-1],
+            np.maximum(cost, self.lower_bound), cost)
+
+    def roll_out_costs(self, exchanges):
+        """
+
+        Roll-out cost of each technology for each of ``exchanges``, as the
+        cost per dwelling at its dwelling density times its dwellings, or
+        from ROLL_OUT_COSTS for technologies without a curve.
+
+        Returns
+        -------
+        list_of_dicts
+            Cost by technology, for each exchange.
+
+        """
+        dwellings = np.array(
+            [exchange.total_prems for exchange in exchanges], dtype=float)
+        area = np.array([exchange.area for exchange in exchanges], dtype=float)
+
+        costs = {
+            technology: (
+                self.cost_per_dwelling(technology, dwellings / area) * dwellings
+            ).tolist()
+            for technology in self._curves
+        }
+
+        return [
+            dict(ROLL_OUT_COSTS, **{
+                technology: costs[technology][position] for technology in costs
+            })
+            for position in range(len(exchanges))
+        ]
+
+    def cache_roll_out_costs(self, exchanges):
+        """
+        Find and keep the roll-out costs of ``exchanges`` in one pass.
+        """
+        for exchange, costs in zip(exchanges, self.roll_out_costs(exchanges)):
+            exchange._rollout_costs = costs
+
+
+class RankingIndex():
+    """
+
+    Exchanges ranked by unserved premises density, for each technology.
+
+    Upgrades do not change unserved densities, so each ranking is sorted
+    once. Exchanges which reach full coverage of a technology are marked
+    inactive in a Fenwick tree over the ranking, so that the exchange at a
+    percentile cut-off is found by position, and the ranking shrinks as
+    exchanges are upgraded without being sorted again.
+
+    Dwelling changes do move unserved densities (see
+    Exchange.update_dwellings), and so do exchanges being added or removed,
+    so the index is then stale: NetworkManager drops it on any of these,
+    and builds and sorts a new one when a ranking is next needed.
+
+    Arguments
+    ---------
+    exchanges : list of Exchange
+        Exchanges to rank. Ties keep this order.
+
+    """
+    TECHNOLOGIES = ('fttp', 'fttdp', 'fttc')
+
+    def __init__(self, exchanges):
+        self._exchanges = list(exchanges)
+        self._positions = {
+            exchange: position for position, exchange in enumerate(exchanges)
+        }
+
+        self._orders = {}
+        self._ranks = {}
+        self._active_counts = {}
+        self._active = {}
+
+        for technology in self.TECHNOLOGIES:
+            handle = '{}_unserved'.format(technology)
+            unserved = [getattr(exchange, handle) for exchange in self._exchanges]
+
+            self._active[technology] = [
+                _is_unserved(exchange, technology) for exchange in self._exchanges
+            ]
+
+            # a stable sort, as used in get_all_assets_ranked
+            for descending in (False, True):
+                order = sorted(range(len(unserved)), key=unserved.__getitem__,
+                    reverse=descending)
+                ranks = [0] * len(order)
+                for rank, position in enumerate(order):
+                    ranks[position] = rank
+
+                key = (technology, descending)
+                self._orders[key] = order
+                self._ranks[key] = ranks
+                self._active_counts[key] = _FenwickTree(
+                    [self._active[technology][position] for position in order])
+
+    def update(self, exchange):
+        """
+        Refresh whether ``exchange`` still lacks full coverage of each
+        technology, after it is upgraded.
+        """
+        position = self._positions[exchange]
+
+        for technology in self.TECHNOLOGIES:
+            active = _is_unserved(exchange, technology)
+            if active == self._active[technology][position]:
+                continue
+
+            self._active[technology][position] = active
+            for descending in (False, True):
+                key = (technology, descending)
+                self._active_counts[key].add(
+                    self._ranks[key][position], 1 if active else -1)
+
+    def ranked(self, technology, roll_out, percentile):
+        """
+        Iterate over the active exchanges for ``technology`` in ``roll_out``
+        order, skipping the first ``percentile`` share of them.
+        """
+        if roll_out == 'insideout':
+            descending = True
+        elif roll_out in ('rural', 'outsidein'):
+            descending = False
+        else:
+            raise ValueError('Did not recognise ranking preference variable')
+
+        key = (technology, descending)
+        order = self._orders[key]
+        active_counts = self._active_counts[key]
+        active = self._active[technology]
+
+        cutoff = floor(active_counts.total() * percentile)
+        start = active_counts.find(cutoff)
+
+        for rank in range(start, len(order)):
+            position = order[rank]
+            if active[position]:
+                yield self._exchanges[position]
+
+
+class _FenwickTree():
+    """
+    Binary indexed tree of counts, giving prefix sums and the position of
+    the nth counted item in logarithmic time.
+    """
+    def __init__(self, flags):
+        self._size = len(flags)
+        self._tree = [0] * (self._size + 1)
+        for index, flag in enumerate(flags):
+            if flag:
+                self.add(index, 1)
+
+    def add(self, index, delta):
+        index += 1
+        while index <= self._size:
+            self._tree[index] += delta
+            index += index & -index
+
+    def total(self):
+        total = 0
+        index = self._size
+        while index > 0:
+            total += self._tree[index]
+            index -= index & -index
+        return total
+
+    def find(self, count):
+        """
+        Return the smallest index with ``count`` counted items before it
+        and a counted item at it, or the size of the tree if there is none.
+        """
+        position = 0
+        step = 1
+        while step * 2 <= self._size:
+            step *= 2
+        while step > 0:
+            if position + step <= self._size and self._tree[position + step] <= count:
+                position += step
+                count -= self._tree[position]
+            step //= 2
+        return position
+
+
+def _is_unserved(exchange, technology):
+    return getattr(exchange, technology) != exchange.total_prems
+
 
 def _determine_technology(data, tech):
 
@@ -287,6 +1001,27 @@ def _get_prems_with_tech(tech_availability_percentage, total_prems):
     return result
 
 
+def _get_prems_with_techs(tech_availability_percentages, total_prems):
+    """Vectorised :func:`_get_prems_with_tech`
+    """
+    return np.where(tech_availability_percentages > 0,
+        (tech_availability_percentages / 100) * total_prems, 0.0)
+
+
+def _calculate_percentages(numerators, denominators):
+    """Vectorised :func:`_calculate_percentage`, returning a list of ints
+
+    NumPy rounds halves to even, as Python's round does.
+    """
+    undefined = (numerators == 0) | (denominators == 0)
+
+    result = np.zeros(len(numerators))
+    result[~undefined] = np.round(
+        numerators[~undefined] / denominators[~undefined] * 100)
+
+    return result.astype(np.int64).tolist()
+
+
 def _calculate_percentage(numerator, denominator):
 
     if numerator == 0 or denominator == 0:
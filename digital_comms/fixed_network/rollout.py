@@ -0,0 +1,201 @@
+"""
+
+Run the fixed network model over many timesteps
+
+"""
+from digital_comms.fixed_network.model import NetworkManager
+from digital_comms.fixed_network.interventions import decide_interventions
+
+# Budgets given per year in the simulation parameters, and drawn on by
+# decide_interventions. The private share of subsidised upgrades is not
+# drawn from any of them, so market_match_funding is passed on unchanged.
+BUDGETS = ('annual_budget', 'annual_subsidy')
+
+
+class RolloutEngine():
+    """
+
+    Owns the fixed network system across timesteps.
+
+    Dwelling growth is applied only to the exchanges whose dwellings change,
+    and upgrades persist in the system from one timestep to the next. By
+    default each timestep is given the budgets in ``parameters``, as in the
+    original runner script. Optionally, unspent budget is carried forward,
+    and, as timesteps need not be consecutive years, the annual budgets are
+    multiplied by the number of years each timestep covers.
+
+    Parameters
+    ----------
+    exchanges : list_of_dicts
+        Exchange data for the first timestep, as passed to NetworkManager.
+    dwellings : dict
+        Number of dwellings by timestep, then by exchange id or by
+        (exchange id, LAD id) record, as taken by
+        NetworkManager.update_dwellings. Exchanges without dwellings for a
+        timestep keep their previous number.
+    parameters : dict
+        Contains all simulation parameters, with annual budgets.
+    technology : str or list of str
+        The technology being deployed, or technologies competing for the
+        same budgets.
+    policy : str
+        The policy used to deploy it, e.g. 'market_insideout'.
+    carry_over : bool
+        Whether budget left unspent in a timestep is added to the next.
+    scale_budgets : bool
+        Whether the annual budgets are multiplied by the number of years
+        each timestep covers.
+    columnar : bool
+        Passed to NetworkManager.
+    cost_table : CostCurveTable
+        Passed to NetworkManager.
+
+    Attributes
+    ----------
+    system : NetworkManager
+        The system, as at the last timestep run.
+    upgraded : dict
+        The (timestep, technology) upgrades made to each exchange id.
+    history : list_of_dicts
+        The changes made in each timestep run, as returned by step.
+
+    """
+    def __init__(self, exchanges, dwellings, parameters, technology, policy,
+                 carry_over=False, scale_budgets=False, columnar=True,
+                 cost_table=None):
+
+        self.system = NetworkManager(exchanges, parameters, columnar=columnar,
+            cost_table=cost_table)
+
+        self.parameters = parameters
+        self.technology = technology
+        self.policy = policy
+        self.carry_over = carry_over
+        self.scale_budgets = scale_budgets
+
+        self.timestep = None
+        self.upgraded = {}
+        self.history = []
+
+        self._dwellings = dwellings
+        self._carried = {budget: 0 for budget in BUDGETS}
+
+
+    def run(self, timesteps):
+        """
+
+        Run each of ``timesteps`` in turn, returning the changes made in each.
+
+        """
+        return [self.step(timestep) for timestep in timesteps]
+
+
+    def step(self, timestep):
+        """
+
+        Apply dwelling growth, decide and apply interventions for a
+        ``timestep``.
+
+        Returns
+        -------
+        dict
+            The changes made in the timestep:
+            * timestep, years: the timestep and the number of years it covers
+            * changed_exchanges: keys of exchanges whose dwellings changed
+            * new_dwellings: net change in dwellings
+            * interventions: intervention tuples, as from decide_interventions
+            * premises_upgraded: premises at the upgraded exchanges
+            * market_spend: spend from the annual budget, on upgrades the
+              market makes alone
+            * private_spend: private sector spend, on upgrades the market
+              makes alone and as the private share of subsidised upgrades
+            * subsidy_spend: spend from the annual subsidy
+            * carried_budget, carried_subsidy: budget and subsidy carried
+              into the next timestep
+
+        """
+        if self.timestep is not None and timestep <= self.timestep:
+            raise ValueError('Timestep {} does not follow timestep {}'.format(
+                timestep, self.timestep))
+
+        if self.timestep is None:
+            years = 1
+        else:
+            years = timestep - self.timestep
+
+        # apply dwelling growth
+        dwellings = self._dwellings.get(timestep, {})
+        previous_dwellings = {
+            key: _total_prems(self.system, key) for key in dwellings
+        }
+
+        changed_ids = self.system.update_dwellings(dwellings)
+
+        new_dwellings = sum(
+            _total_prems(self.system, key) - previous_dwellings[key]
+            for key in changed_ids
+        )
+
+        # budgets for the timestep, or the years it covers, plus any
+        # carried over
+        parameters = dict(self.parameters)
+        for budget in BUDGETS:
+            parameters[budget] = self._carried[budget] + (
+                self.parameters[budget] * years if self.scale_budgets
+                else self.parameters[budget])
+
+        interventions = decide_interventions(
+            self.system, self.technology, self.policy, parameters)
+
+        self.system.upgrade(interventions)
+
+        market_spend = 0
+        private_spend = 0
+        subsidy_spend = 0
+        premises_upgraded = 0
+        for intervention in interventions:
+            asset_id = intervention[0]
+            capital_investment_type = intervention[3]
+
+            if capital_investment_type == 'private':
+                market_spend += intervention[4]
+                private_spend += intervention[4]
+            else:
+                # the private share is paid alongside the subsidy, not from
+                # the annual budget
+                private_spend += intervention[5]
+                subsidy_spend += intervention[6]
+
+            premises_upgraded += self.system.get_exchange(asset_id).total_prems
+
+            self.upgraded.setdefault(asset_id, []).append(
+                (timestep, intervention[1]))
+
+        if self.carry_over:
+            self._carried = {
+                'annual_budget': parameters['annual_budget'] - market_spend,
+                'annual_subsidy': parameters['annual_subsidy'] - subsidy_spend,
+            }
+
+        self.timestep = timestep
+
+        delta = {
+            'timestep': timestep,
+            'years': years,
+            'changed_exchanges': changed_ids,
+            'new_dwellings': new_dwellings,
+            'interventions': interventions,
+            'premises_upgraded': premises_upgraded,
+            'market_spend': market_spend,
+            'private_spend': private_spend,
+            'subsidy_spend': subsidy_spend,
+            'carried_budget': self._carried['annual_budget'],
+            'carried_subsidy': self._carried['annual_subsidy'],
+        }
+        self.history.append(delta)
+
+        return delta
+
+
+def _total_prems(system, key):
+    return sum(exchange.total_prems for exchange in system.find_exchanges(key))
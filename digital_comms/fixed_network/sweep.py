@@ -0,0 +1,309 @@
+"""
+
+Evaluate a fixed network policy over many parameter settings
+
+The exchange system is built and ranked once, and each parameter point is
+then found from the shared ranking with budget_feasible_interventions,
+without building or upgrading a system for each point.
+
+"""
+import copy
+import itertools
+import math
+import multiprocessing
+
+import numpy as np
+
+from digital_comms.fixed_network.model import NetworkManager, ExchangeTable
+from digital_comms.fixed_network.interventions import (
+    budget_feasible_interventions, _unique_assets
+    )
+
+TECHNOLOGIES = ('fttp', 'fttdp', 'fttc', 'adsl')
+
+
+def parameter_grid(parameters, **values):
+    """
+
+    Return a parameter dict for every combination of ``values``.
+
+    Parameters
+    ----------
+    parameters : dict
+        Parameters shared by all points.
+    **values
+        Values to sweep for each parameter, e.g.
+        annual_budget=[1e6, 1e7], annual_subsidy=[0, 1e7]
+
+    Returns
+    -------
+    list_of_dicts
+
+    """
+    names = list(values)
+
+    return [
+        dict(parameters, **dict(zip(names, combination)))
+        for combination in itertools.product(*[values[name] for name in names])
+    ]
+
+
+def run_sweep(exchanges, technology, policy, parameters, points, workers=1,
+              chunksize=None):
+    """
+
+    Evaluate a ``technology`` and ``policy`` at each of ``points``.
+
+    Parameters
+    ----------
+    exchanges : list_of_dicts or NetworkManager
+        Exchange data, as passed to NetworkManager, or a built system.
+    technology : str
+        The technology being deployed.
+    policy : str
+        Policy and roll out, e.g. 'subsidy_rural'.
+    parameters : dict
+        Parameters shared by all points.
+    points : list_of_dicts
+        Parameters to vary at each point, e.g. from parameter_grid.
+    workers : int
+        Number of processes to evaluate points with.
+    chunksize : int
+        Number of points sent to a process at a time.
+
+    Returns
+    -------
+    list_of_dicts
+        One row per point, as given by PolicySweep.evaluate.
+
+    """
+    return PolicySweep(exchanges, technology, policy, parameters).run(
+        points, workers, chunksize)
+
+
+class PolicySweep():
+    """
+
+    A fixed network system ranked once for a technology and policy, to be
+    evaluated at many parameter points.
+
+    Each point gives the interventions decide_interventions would make,
+    and the coverage and capacity of the system once they are applied.
+
+    Parameters
+    ----------
+    exchanges : list_of_dicts or NetworkManager
+        Exchange data, as passed to NetworkManager, or a built system.
+    technology : str
+        The technology being deployed.
+    policy : str
+        Policy and roll out, e.g. 'market_insideout' or 'subsidy_rural'.
+    parameters : dict
+        Parameters shared by all points.
+
+    """
+    def __init__(self, exchanges, technology, policy, parameters):
+
+        if isinstance(exchanges, NetworkManager):
+            system = exchanges
+        else:
+            system = NetworkManager(exchanges, parameters)
+
+        self.technology = technology
+        self.roll_out = policy.split('_')[1]
+        self.policy = policy.split('_')[0]
+        self.parameters = parameters
+
+        if self.policy not in ('market', 'subsidy'):
+            raise ValueError('Did not recognise stipulated policy')
+
+        # the ranking shared by all points
+        ranked = list(system.ranked_exchanges(technology, self.roll_out, 0))
+        assets = _unique_assets(ranked)
+
+        positions = {}
+        for position, asset in enumerate(assets):
+            positions[asset.id] = position
+
+        self._costs = np.array(
+            [asset.rollout_costs[technology] for asset in assets])
+
+        # exchanges past a percentile cut-off, as positions in the ranking;
+        # of those sharing an id only the first past the cut-off is kept
+        handle = '{}_unserved'.format(technology)
+        previous_position = {}
+        self._previous_same_id = np.zeros(len(ranked), dtype=np.int64)
+        for index, asset in enumerate(ranked):
+            self._previous_same_id[index] = previous_position.get(asset.id, -1)
+            previous_position[asset.id] = index
+
+        self._ranked_positions = np.array(
+            [positions[asset.id] for asset in ranked], dtype=np.int64)
+        self._ranked_costs = np.array(
+            [asset.rollout_costs[technology] for asset in ranked])
+        self._ranked_unserved = np.array(
+            [getattr(asset, handle) for asset in ranked], dtype=float)
+
+        # coverage and capacity of the system as it is, and the change each
+        # upgrade would make to them
+        table = ExchangeTable(system._exchanges)
+        coverage = table.coverage()
+        capacity = table.capacity()
+
+        premises = table.dwellings.astype(float)
+        self._total_premises = premises.sum()
+        self._premises_with = {
+            technology: np.dot(premises, [
+                item['percentage_of_premises_with_{}'.format(technology)]
+                for item in coverage])
+            for technology in TECHNOLOGIES
+        }
+        self._capacity = np.dot(
+            premises, [item['average_capacity'] for item in capacity])
+
+        upgraded_exchanges = [system.get_exchange(asset.id) for asset in assets]
+        upgrades = [copy.copy(exchange) for exchange in upgraded_exchanges]
+        for exchange in upgrades:
+            exchange.upgrade(technology)
+
+        before = ExchangeTable(upgraded_exchanges)
+        after = ExchangeTable(upgrades)
+        before_coverage, after_coverage = before.coverage(), after.coverage()
+
+        self._upgrade_premises = before.dwellings.astype(float)
+        self._coverage_gain = {}
+        for technology in TECHNOLOGIES:
+            key = 'percentage_of_premises_with_{}'.format(technology)
+            self._coverage_gain[technology] = self._upgrade_premises * (
+                np.array([item[key] for item in after_coverage], dtype=float) -
+                np.array([item[key] for item in before_coverage], dtype=float))
+
+        self._capacity_gain = self._upgrade_premises * (
+            np.array([item['average_capacity'] for item in after.capacity()],
+                dtype=float) -
+            np.array([item['average_capacity'] for item in before.capacity()],
+                dtype=float))
+
+
+    def evaluate(self, point):
+        """
+
+        Evaluate the policy with the parameters of ``point``.
+
+        Returns
+        -------
+        dict
+            The parameters of the point, and:
+            * upgrades: number of exchanges upgraded
+            * premises_upgraded: premises at the upgraded exchanges
+            * total_cost, total_private_investment, total_subsidy: spend,
+              as summed from the intervention tuples
+            * percentage_of_premises_with_{technology}: premises-weighted
+              coverage once upgraded
+            * average_capacity: premises-weighted capacity once upgraded
+
+        """
+        parameters = dict(self.parameters, **point)
+
+        if self.policy == 'market':
+            number_of_market_upgrades, _, _, _ = budget_feasible_interventions(
+                self._costs, parameters['annual_budget'])
+
+            upgraded = np.arange(number_of_market_upgrades)
+            total_private_investment = 0
+            total_subsidy = 0
+
+        else:
+            percentile = parameters['subsidy_{}_percentile'.format(self.roll_out)]
+            cutoff = math.floor(len(self._ranked_positions) * percentile)
+            eligible = cutoff + np.flatnonzero(
+                self._previous_same_id[cutoff:] < cutoff)
+
+            number_of_market_upgrades, subsidised, private_investment, subsidy = \
+                budget_feasible_interventions(
+                    self._costs, parameters['annual_budget'],
+                    self._ranked_positions[eligible],
+                    self._ranked_costs[eligible],
+                    self._ranked_unserved[eligible] *
+                    parameters['max_market_investment_per_dwelling'],
+                    parameters['annual_subsidy'])
+
+            upgraded = np.concatenate([
+                np.arange(number_of_market_upgrades),
+                self._ranked_positions[eligible][subsidised],
+            ])
+            total_private_investment = (
+                self._costs[:number_of_market_upgrades].sum() +
+                private_investment[subsidised].sum())
+            total_subsidy = subsidy[subsidised].sum()
+
+        row = dict(point)
+        row['upgrades'] = len(upgraded)
+        row['premises_upgraded'] = self._upgrade_premises[upgraded].sum()
+        row['total_cost'] = self._costs[upgraded].sum()
+        row['total_private_investment'] = total_private_investment
+        row['total_subsidy'] = total_subsidy
+
+        for technology in TECHNOLOGIES:
+            row['percentage_of_premises_with_{}'.format(technology)] = _share(
+                self._premises_with[technology] +
+                self._coverage_gain[technology][upgraded].sum(),
+                self._total_premises)
+
+        row['average_capacity'] = _share(
+            self._capacity + self._capacity_gain[upgraded].sum(),
+            self._total_premises)
+
+        return {
+            key: value.item() if isinstance(value, np.generic) else value
+            for key, value in row.items()
+        }
+
+
+    def run(self, points, workers=1, chunksize=None):
+        """
+
+        Evaluate each of ``points``, in chunks across ``workers`` processes.
+
+        Returns
+        -------
+        list_of_dicts
+            One row per point, in order.
+
+        """
+        points = list(points)
+
+        if workers == 1 or len(points) <= 1:
+            return [self.evaluate(point) for point in points]
+
+        if chunksize is None:
+            chunksize = max(1, int(math.ceil(len(points) / (workers * 4))))
+
+        chunks = [
+            points[start:start + chunksize]
+            for start in range(0, len(points), chunksize)
+        ]
+
+        with multiprocessing.Pool(workers, initializer=_init_worker,
+                initargs=(self,)) as pool:
+            results = pool.map(_evaluate_chunk, chunks)
+
+        return [row for chunk in results for row in chunk]
+
+
+_SWEEP = None
+
+
+def _init_worker(sweep):
+    global _SWEEP
+    _SWEEP = sweep
+
+
+def _evaluate_chunk(points):
+    return [_SWEEP.evaluate(point) for point in points]
+
+
+def _share(premises_weighted_total, total_premises):
+    if total_premises > 0:
+        return premises_weighted_total / total_premises
+    return 0
@@ -0,0 +1,76 @@
+"""
+Geometry cache
+
+Shapely geometries of GeoJSON-like features, converted once and prepared
+for repeated predicate tests, to share between overlay steps in
+preprocessing.
+
+"""
+from rtree import index
+from shapely.geometry import shape
+from shapely.prepared import prep
+
+
+class GeometryCache():
+    """
+    Shapes, prepared shapes and bounds of features, each found once.
+
+    Features are held by the identity of their geometry, so a feature given
+    again, or rebuilt around the same geometry by a later preprocessing
+    step, is not converted again. The cache keeps a reference to each
+    geometry it holds.
+
+    """
+    def __init__(self):
+        self._entries = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _entry(self, feature):
+        geometry = feature['geometry']
+        entry = self._entries.get(id(geometry))
+        if entry is None:
+            geometry_shape = shape(geometry)
+            # [geometry, shape, prepared shape, bounds]
+            entry = [geometry, geometry_shape, None, geometry_shape.bounds]
+            self._entries[id(geometry)] = entry
+        return entry
+
+    def shape(self, feature):
+        """
+        Return the shapely geometry of ``feature``.
+        """
+        return self._entry(feature)[1]
+
+    def prepared(self, feature):
+        """
+        Return the prepared shapely geometry of ``feature``, for fast
+        repeated predicates such as ``intersects``.
+        """
+        entry = self._entry(feature)
+        if entry[2] is None:
+            entry[2] = prep(entry[1])
+        return entry[2]
+
+    def bounds(self, feature):
+        """
+        Return the (minx, miny, maxx, maxy) bounds of ``feature``.
+        """
+        return self._entry(feature)[3]
+
+    def index(self, features):
+        """
+        Return an rtree index of the bounds of ``features``, giving the
+        position of each feature in ``features``.
+        """
+        return index.Index(
+            (i, self.bounds(feature), None)
+            for i, feature in enumerate(features)
+        )
+
+    def clear(self):
+        """
+        Drop all cached geometries.
+        """
+        self._entries = {}
@@ -6,13 +6,14 @@ August 2019
 
 """
 
+
 def calculate_costs(data, discount_rate, start_timestep, current_timestep):
     """
     Calculates the discounted cost for capex and opex, depending on timestep.
 
     Parameters
     ----------
-    data : list of dicts
+    data : list of dicts or Assets
         Contains a list of assets
     discount_rate : float
         Annual financial discount rate to account for the time value of money
@@ -29,6 +30,8 @@ def calculate_costs(data, discount_rate, start_timestep, current_timestep):
     """
     output = []
 
+    # Assets are read by key like the dicts they replace, without a
+    # dict being built for each
     for datum in data:
 
         output_datum = {}
@@ -49,7 +52,10 @@ def calculate_costs(data, discount_rate, start_timestep, current_timestep):
         output_datum['pcd_sector'] = datum['pcd_sector']
         output_datum['ran_type'] = datum['ran_type']
         output_datum['site_ngr'] = datum['site_ngr']
-        output_datum['frequency'] = datum['frequency']
+        output_datum['frequency'] = (
+            list(datum['frequency']) if isinstance(datum['frequency'], tuple)
+            else datum['frequency']
+            )
         output_datum['bandwidth'] = datum['bandwidth']
         output_datum['sectors'] = datum['sectors']
         output_datum['technology'] = datum['technology']
@@ -1,9 +1,12 @@
 """Decide on interventions
 """
 # pylint: disable=C0103
-from digital_comms.mobile_network.model import PostcodeSector
+from digital_comms.mobile_network.model import (
+    Asset, CapacityLookupTable, lookup_capacity
+    )
 
-import copy
+import heapq
+import itertools
 import math
 
 ################################################################
@@ -132,8 +135,12 @@ AVAILABLE_STRATEGY_INTERVENTIONS = {
 }
 
 
+PLANNING_MODES = ('sequential', 'priority')
+
+
 def decide_interventions(strategy, budget, service_obligation_capacity,
-                         system, timestep, simulation_parameters):
+                         system, timestep, simulation_parameters,
+                         mode='sequential'):
     """Given strategy parameters and a system return some next best intervention
 
     Params
@@ -146,19 +153,28 @@ def decide_interventions(strategy, budget, service_obligation_capacity,
         Threshold for universal mobile service, in Mbps/km^2
     system : NetworkManager
         Gives areas (postcode sectors) with population density, demand
+    mode : str
+        'sequential' spends on areas in descending population density
+        order, 'priority' spends on whichever intervention in any area
+        gives the largest capacity deficit reduction per GBP
     """
     available_interventions = AVAILABLE_STRATEGY_INTERVENTIONS[strategy]
 
+    if mode not in PLANNING_MODES:
+        raise ValueError('Did not recognise planning mode {}'.format(mode))
+
     if service_obligation_capacity > 0:
         service_built, budget, service_spend = meet_service_obligation(budget,
-            available_interventions, timestep, service_obligation_capacity, system, simulation_parameters)
+            available_interventions, timestep, service_obligation_capacity, system,
+            simulation_parameters, mode)
     else:
         service_built = []
         service_spend = []
 
     # Build to meet demand
     built, budget, spend = meet_demand(
-        budget, available_interventions, timestep, system, simulation_parameters)
+        budget, available_interventions, timestep, system, simulation_parameters,
+        mode)
 
     print("Service", len(service_built))
     print("Demand", len(built))
@@ -167,14 +183,22 @@ def decide_interventions(strategy, budget, service_obligation_capacity,
 
 
 def meet_service_obligation(budget, available_interventions, timestep,
-                            service_obligation_capacity, system, simulation_parameters):
+                            service_obligation_capacity, system, simulation_parameters,
+                            mode='sequential'):
     areas = _suggest_target_postcodes(system, service_obligation_capacity)
+    if mode == 'priority':
+        return _prioritise_interventions(budget, available_interventions,
+            areas, timestep, simulation_parameters, service_obligation_capacity)
     return _suggest_interventions(budget, available_interventions,
         areas, timestep, simulation_parameters, service_obligation_capacity)
 
 
-def meet_demand(budget, available_interventions, timestep, system, simulation_parameters):
+def meet_demand(budget, available_interventions, timestep, system, simulation_parameters,
+                mode='sequential'):
     areas = _suggest_target_postcodes(system)
+    if mode == 'priority':
+        return _prioritise_interventions(budget, available_interventions, areas,
+            timestep, simulation_parameters)
     return _suggest_interventions(budget, available_interventions, areas, timestep, simulation_parameters)
 
 
@@ -189,28 +213,22 @@ def _suggest_interventions(budget, available_interventions, areas, timestep, sim
         if _area_satisfied(area, area_interventions, threshold, simulation_parameters):
             continue
 
-        # group assets by site
-        assets_by_site = {}
-        for asset in area.assets:
-            if asset['site_ngr'] not in assets_by_site:
-                assets_by_site[asset['site_ngr']] = [asset]
-            else:
-                assets_by_site[asset['site_ngr']].append(asset)
+        # technologies and frequencies at each site
+        site_technologies = area.site_index.site_technologies
+        site_frequencies = area.site_index.site_frequencies
 
         # integrate_800 and integrate_2.6
         if 'upgrade_to_lte' in available_interventions:
             build_option = INTERVENTIONS['upgrade_to_lte']['assets_to_build']
             cost = INTERVENTIONS['upgrade_to_lte']['cost']
-            for site_ngr, site_assets in assets_by_site.items():
+            for site_ngr, technologies in site_technologies.items():
                 if site_ngr == 'small_cell_site':
                     continue
-                if 'LTE' not in [asset['technology'] for asset in site_assets]:
+                if 'LTE' not in technologies:
                     # set both assets to this site_ngr
                     for option in build_option:
-                        to_build = copy.copy(option)
-                        to_build['site_ngr'] = site_ngr
-                        to_build['pcd_sector'] = area.id
-                        to_build['build_date'] = timestep
+                        to_build = Asset.from_dict(option, site_ngr=site_ngr,
+                            pcd_sector=area.id, build_date=timestep)
                         area_interventions.append(to_build)
                         built_interventions.append(to_build)
 
@@ -229,17 +247,15 @@ def _suggest_interventions(budget, available_interventions, areas, timestep, sim
 
             build_option = INTERVENTIONS['carrier_700']['assets_to_build']
             cost = INTERVENTIONS['carrier_700']['cost']
-            for site_ngr, site_assets in assets_by_site.items():
+            for site_ngr, technologies in site_technologies.items():
                 if site_ngr == 'small_cell_site':
                     continue
-                if 'LTE' in [asset['technology'] for asset in site_assets] and \
-                        '700' not in [asset['frequency'] for asset in site_assets]:
+                if 'LTE' in technologies and \
+                        '700' not in site_frequencies[site_ngr]:
                     # set both assets to this site_ngr
                     for option in build_option:
-                        to_build = copy.copy(option)
-                        to_build['site_ngr'] = site_ngr
-                        to_build['pcd_sector'] = area.id
-                        to_build['build_date'] = timestep
+                        to_build = Asset.from_dict(option, site_ngr=site_ngr,
+                            pcd_sector=area.id, build_date=timestep)
                         area_interventions.append(to_build)
                         built_interventions.append(to_build)
 
@@ -258,17 +274,15 @@ def _suggest_interventions(budget, available_interventions, areas, timestep, sim
 
             build_option = INTERVENTIONS['carrier_3500']['assets_to_build']
             cost = INTERVENTIONS['carrier_3500']['cost']
-            for site_ngr, site_assets in assets_by_site.items():
+            for site_ngr, technologies in site_technologies.items():
                 if site_ngr == 'small_cell_site':
                     continue
-                if 'LTE' in [asset['technology'] for asset in site_assets] and \
-                        '3500' not in [asset['frequency'] for asset in site_assets]:
+                if 'LTE' in technologies and \
+                        '3500' not in site_frequencies[site_ngr]:
                     # set both assets to this site_ngr
                     for option in build_option:
-                        to_build = copy.copy(option)
-                        to_build['site_ngr'] = site_ngr
-                        to_build['pcd_sector'] = area.id
-                        to_build['build_date'] = timestep
+                        to_build = Asset.from_dict(option, site_ngr=site_ngr,
+                            pcd_sector=area.id, build_date=timestep)
                         area_interventions.append(to_build)
                         built_interventions.append(to_build)
 
@@ -292,29 +306,215 @@ def _suggest_interventions(budget, available_interventions, areas, timestep, sim
             build_option = INTERVENTIONS['small_cell']['assets_to_build']
             cost = INTERVENTIONS['small_cell']['cost']
 
-            loop_number = 0
-            while True:
+            # build up to the required density in one step, or for as
+            # long as the budget lasts
+            number_of_small_cells = min(
+                _small_cells_required(area, area_interventions, threshold,
+                    simulation_parameters),
+                int(math.ceil(budget / cost))
+            )
+
+            # identical small cells share one read-only asset
+            to_build = [
+                Asset.from_dict(option, pcd_sector=area.id, build_date=timestep)
+                for option in build_option
+            ] * number_of_small_cells
+
+            area_interventions += to_build
+            built_interventions += to_build
+            spend += [(area.id, area.lad_id, 'small_cells', cost)] * number_of_small_cells
+            budget -= cost * number_of_small_cells
+
+    return built_interventions, budget, spend
+
+
+def _prioritise_interventions(budget, available_interventions, areas, timestep,
+                              simulation_parameters, threshold=None):
+    """Spend the budget on whichever intervention, in any area, gives the
+    largest reduction in capacity deficit per GBP
+
+    Candidate interventions for every area are kept in a single heap. After
+    a purchase only the candidates of the area it was made in are evaluated
+    again; entries for that area already in the heap are discarded when
+    popped. Returns the same (built interventions, budget, spend) as
+    _suggest_interventions.
+    """
+    built_interventions = []
+    spend = []
+
+    area_interventions = {area.id: [] for area in areas}
+    area_versions = {area.id: 0 for area in areas}
+    areas_by_id = {area.id: area for area in areas}
+
+    queue = []
+    counter = itertools.count()
+
+    def push_candidates(area):
+        for candidate in _candidate_interventions(area, area_interventions[area.id],
+                available_interventions, timestep, threshold,
+                simulation_parameters, budget):
+            heapq.heappush(queue, (-candidate['value'], next(counter),
+                area.id, area_versions[area.id], candidate))
 
-                to_build = copy.deepcopy(build_option)
-                to_build[0]['build_date'] = timestep
-                to_build[0]['pcd_sector'] = area.id
+    for area in areas:
+        push_candidates(area)
+
+    while queue and budget > 0:
+        _, _, area_id, version, candidate = heapq.heappop(queue)
+        area = areas_by_id[area_id]
 
-                area_interventions += to_build
-                built_interventions += to_build
-                spend.append((area.id, area.lad_id, 'small_cells', cost))
-                budget -= cost
+        if version != area_versions[area_id]:
+            continue
 
-                loop_number += 1
+        if candidate['cost'] > budget:
+            # small cells can still be built up to the remaining budget
+            if candidate['intervention'] == 'small_cell':
+                area_versions[area_id] += 1
+                push_candidates(area)
+            continue
 
-                if _area_satisfied(area, area_interventions, threshold, simulation_parameters):
-                    break
+        area_interventions[area_id] += candidate['assets']
+        built_interventions += candidate['assets']
+        spend += [(area.id, area.lad_id, candidate['item'], candidate['unit_cost'])] * \
+            candidate['units']
+        budget -= candidate['cost']
 
-                if budget <= 0:
-                    break
+        area_versions[area_id] += 1
+        push_candidates(area)
 
     return built_interventions, budget, spend
 
 
+def _candidate_interventions(area, built_interventions, available_interventions,
+                             timestep, threshold, simulation_parameters, budget):
+    """Return the interventions which would reduce the capacity deficit of an
+    area, each with its total cost and deficit reduction per GBP
+    """
+    if threshold is None:
+        target_capacity = area.demand
+    else:
+        target_capacity = threshold
+
+    capacity = area.capacity_with(built_interventions)
+    if capacity >= target_capacity:
+        return []
+
+    def deficit_reduction(assets):
+        reached_capacity = area.capacity_with(built_interventions + assets)
+        return min(reached_capacity, target_capacity) - capacity
+
+    # technologies and frequencies at each site, including those built
+    site_technologies = dict(area.site_index.site_technologies)
+    site_frequencies = dict(area.site_index.site_frequencies)
+    for asset in built_interventions:
+        site_ngr = asset['site_ngr']
+        site_technologies[site_ngr] = \
+            site_technologies.get(site_ngr, set()) | {asset['technology']}
+        site_frequencies[site_ngr] = \
+            site_frequencies.get(site_ngr, []) + [asset['frequency']]
+
+    carriers = [
+        ('carrier_700', '700'),
+        ('carrier_3500', '3500'),
+    ]
+
+    candidates = []
+
+    for site_ngr, technologies in site_technologies.items():
+        if site_ngr == 'small_cell_site':
+            continue
+
+        has_lte = 'LTE' in technologies
+        frequencies = site_frequencies[site_ngr]
+
+        available_carriers = [
+            intervention for intervention, frequency in carriers
+            if intervention in available_interventions and timestep >= 2020
+            and frequency not in frequencies
+        ]
+
+        if not has_lte:
+            if 'upgrade_to_lte' not in available_interventions:
+                continue
+
+            assets = _build_assets('upgrade_to_lte', site_ngr, area, timestep)
+            cost = INTERVENTIONS['upgrade_to_lte']['cost']
+
+            # an upgrade is valued with the carriers it makes available
+            lookahead_assets = assets[:]
+            lookahead_cost = cost
+            for intervention in available_carriers:
+                lookahead_assets += _build_assets(intervention, site_ngr, area, timestep)
+                lookahead_cost += INTERVENTIONS[intervention]['cost']
+
+            reduction = deficit_reduction(lookahead_assets)
+            if reduction > 0:
+                candidates.append({
+                    'intervention': 'upgrade_to_lte',
+                    'item': 'upgrade_to_lte',
+                    'assets': assets,
+                    'units': 1,
+                    'unit_cost': cost,
+                    'cost': cost,
+                    'value': reduction / lookahead_cost,
+                })
+            continue
+
+        for intervention in available_carriers:
+            assets = _build_assets(intervention, site_ngr, area, timestep)
+            cost = INTERVENTIONS[intervention]['cost']
+            reduction = deficit_reduction(assets)
+            if reduction > 0:
+                candidates.append({
+                    'intervention': intervention,
+                    'item': intervention,
+                    'assets': assets,
+                    'units': 1,
+                    'unit_cost': cost,
+                    'cost': cost,
+                    'value': reduction / cost,
+                })
+
+    if 'small_cell' in available_interventions and timestep >= 2020 and \
+            area.clutter_environment != 'rural':
+        unit_cost = INTERVENTIONS['small_cell']['cost']
+        number_of_small_cells = min(
+            _small_cells_required(area, built_interventions, threshold,
+                simulation_parameters),
+            int(math.floor(budget / unit_cost))
+        )
+        if number_of_small_cells > 0:
+            assets = _build_assets('small_cell', None, area, timestep) * \
+                number_of_small_cells
+            cost = unit_cost * number_of_small_cells
+            reduction = deficit_reduction(assets)
+            if reduction > 0:
+                candidates.append({
+                    'intervention': 'small_cell',
+                    'item': 'small_cells',
+                    'assets': assets,
+                    'units': number_of_small_cells,
+                    'unit_cost': unit_cost,
+                    'cost': cost,
+                    'value': reduction / cost,
+                })
+
+    return candidates
+
+
+def _build_assets(intervention, site_ngr, area, timestep):
+    """Return the assets built by an intervention at a site in an area
+    """
+    fields = {'pcd_sector': area.id, 'build_date': timestep}
+    if site_ngr is not None:
+        fields['site_ngr'] = site_ngr
+
+    return [
+        Asset.from_dict(option, **fields)
+        for option in INTERVENTIONS[intervention]['assets_to_build']
+    ]
+
+
 def _suggest_target_postcodes(system, threshold=None):
     """Sort postcodes by population density (descending)
     - if considering threshold, filter out any with capacity above threshold
@@ -334,25 +534,57 @@ def _area_satisfied(area, built_interventions, threshold, simulation_parameters)
     else:
         target_capacity = threshold
 
-    data = {
-        "id": area.id,
-        "lad_id": area.lad_id,
-        "population": area.population,
-        "area_km2": area.area,
-        "user_throughput": area.user_throughput,
-    }
-
-    assets = area.assets + built_interventions
-
-    test_area = PostcodeSector(
-        data,
-        assets,
-        area._capacity_lookup_table,
-        area._clutter_lookup,
-        simulation_parameters,
-        1
-    )
-
-    reached_capacity = test_area.capacity
+    reached_capacity = area.capacity_with(built_interventions)
 
     return reached_capacity >= target_capacity
+
+
+def _small_cells_required(area, built_interventions, threshold,
+    simulation_parameters):
+    """Find the number of small cells to add to an area to meet its target
+    capacity, by inverting the small cell capacity curve
+
+    Returns at least one small cell, or infinity if no small cell density
+    meets the target.
+    """
+    if threshold is None:
+        target_capacity = area.demand
+    else:
+        target_capacity = threshold
+
+    lookup_table = area._capacity_lookup_table
+    if not isinstance(lookup_table, CapacityLookupTable):
+        lookup_table = CapacityLookupTable(lookup_table)
+
+    macrocell_capacity, _ = area._capacities_with(built_interventions)
+
+    existing_small_cells = area.site_index.num_small_cells + len([
+        asset for asset in built_interventions
+        if asset['type'] == 'small_cell'])
+
+    def satisfied(number_of_small_cells):
+        site_density = float(existing_small_cells + number_of_small_cells) / area.area
+        small_cell_capacity = lookup_capacity(lookup_table,
+            'small_cells', '3700', '25', '5G', site_density, 1)
+        return macrocell_capacity + small_cell_capacity >= target_capacity
+
+    site_density = lookup_table.minimum_density(
+        ('small_cells', '3700', '25', '5G'),
+        target_capacity - macrocell_capacity)
+
+    if site_density is None:
+        return math.inf
+
+    number_of_small_cells = max(
+        int(math.ceil(site_density * area.area)) - existing_small_cells, 1)
+
+    # correct for rounding in the inverted curve
+    while number_of_small_cells > 1 and satisfied(number_of_small_cells - 1):
+        number_of_small_cells -= 1
+    highest_density = lookup_table['small_cells', '3700', '25', '5G'][-1][0]
+    while not satisfied(number_of_small_cells):
+        if float(existing_small_cells + number_of_small_cells) / area.area > highest_density:
+            return math.inf
+        number_of_small_cells += 1
+
+    return number_of_small_cells
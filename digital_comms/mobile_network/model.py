@@ -1,8 +1,16 @@
 """Cambridge Communications Assessment Model
 """
+from bisect import bisect_left, bisect_right
 from collections import defaultdict
 from itertools import tee
 from pprint import pprint
+import sys
+
+import numpy as np
+
+# Macrocellular spectrum bands, in the order their capacities are summed
+MACROCELL_FREQUENCIES = ['700', '800', '1800', '2600', '3500', '26000']
+
 
 class NetworkManager(object):
     """
@@ -31,8 +39,8 @@ class NetworkManager(object):
             Areas size in square kilometers (km^2)
         * user_throughput: :obj:`int`
             Per user monthly data demand in gigabytes (GB)
-    assets: :obj:`list` of :obj:`dict`
-        List of assets
+    assets: :obj:`list` of :obj:`dict` or :obj:`Asset`
+        List of assets, held as :obj:`Asset` once added to the system
         * pcd_sector: :obj:`str`
             Code of the postcode sector
         * site_ngr: :obj:`int`
@@ -45,10 +53,12 @@ class NetworkManager(object):
             Downlink bandwith of the asset (10MHz, ..)
         * build_date: :obj:`int`
             Build year of the asset
-    capacity_lookup_table: dict
+    capacity_lookup_table: dict or :obj:`CapacityLookupTable`
         Dictionary that represents the clutter/asset type, spectrum
         frequency and channel bandwidth, and the consequential
         cellular capacity provided for different asset densities.
+        A dictionary is compiled to a :obj:`CapacityLookupTable` once,
+        on construction.
         * key: :obj:`tuple`
             * 0: :obj:`str`
                 Area type ('urban', 'suburban' or 'rural') or asset
@@ -94,31 +104,152 @@ class NetworkManager(object):
 
         self.postcode_sectors = {}
 
+        if not isinstance(capacity_lookup_table, CapacityLookupTable):
+            capacity_lookup_table = CapacityLookupTable(capacity_lookup_table)
+
+        self._capacity_lookup_table = capacity_lookup_table
+        self._simulation_parameters = simulation_parameters
+
         for lad_data in lads:
             lad_id = lad_data["id"]
             self.lads[lad_id] = LAD(lad_data, simulation_parameters)
 
         assets_by_pcd = defaultdict(list)
         for asset in assets:
-            assets_by_pcd[asset['pcd_sector']].append(asset)
+            asset = as_asset(asset)
+            assets_by_pcd[asset.pcd_sector].append(asset)
 
+        pcd_sectors_to_add = []
         for pcd_sector_data in pcd_sectors:
 
             try:
-                lad_id = pcd_sector_data["lad_id"]
                 pcd_sector_id = pcd_sector_data["id"]
                 assets = assets_by_pcd[pcd_sector_id]
                 pcd_sector = PostcodeSector(pcd_sector_data, assets,
-                capacity_lookup_table, clutter_lookup, simulation_parameters, 0)
-                self.postcode_sectors[pcd_sector_id] = pcd_sector
+                capacity_lookup_table, clutter_lookup, simulation_parameters, 0,
+                calculate_capacity=False)
 
-                lad_containing_pcd_sector = self.lads[lad_id]
-                lad_containing_pcd_sector.add_pcd_sector(pcd_sector)
+                if not has_capacity_curves(capacity_lookup_table,
+                    pcd_sector.clutter_environment, simulation_parameters):
+                    raise KeyError("Combination not found in lookup table")
+
+                pcd_sectors_to_add.append((pcd_sector, pcd_sector_data))
             except:
                 print('could not create object for {}'.format(pcd_sector_data["id"]))
                 print(pcd_sector_data)
                 pass
 
+        # find the capacity of all postcode sectors in one pass
+        capacities = calculate_capacities(
+            [pcd_sector for pcd_sector, _ in pcd_sectors_to_add],
+            capacity_lookup_table, simulation_parameters)
+
+        for (pcd_sector, pcd_sector_data), capacity in zip(
+            pcd_sectors_to_add, capacities.tolist()):
+
+            pcd_sector.capacity = capacity
+            self.postcode_sectors[pcd_sector.id] = pcd_sector
+
+            try:
+                lad_containing_pcd_sector = self.lads[pcd_sector.lad_id]
+                lad_containing_pcd_sector.add_pcd_sector(pcd_sector)
+            except:
+                print('could not create object for {}'.format(pcd_sector.id))
+                print(pcd_sector_data)
+                pass
+
+
+    def apply_interventions(self, assets):
+        """
+        Add newly built ``assets`` to the system.
+
+        Each asset is routed to its postcode sector, and site densities and
+        capacity are recomputed only for the sectors which gained assets.
+        Assets in postcode sectors outside the system are ignored, as when
+        building a new NetworkManager.
+
+        Arguments
+        ---------
+        assets: :obj:`list` of :obj:`dict` or :obj:`Asset`
+            List of assets, as passed on construction.
+
+        """
+        assets_by_pcd = defaultdict(list)
+        for asset in assets:
+            asset = as_asset(asset)
+            if asset.pcd_sector in self.postcode_sectors:
+                assets_by_pcd[asset.pcd_sector].append(asset)
+
+        changed_pcd_sectors = []
+        for pcd_sector_id, pcd_sector_assets in assets_by_pcd.items():
+            pcd_sector = self.postcode_sectors[pcd_sector_id]
+            pcd_sector.add_assets(pcd_sector_assets)
+            changed_pcd_sectors.append(pcd_sector)
+
+        self._update_capacities(changed_pcd_sectors)
+
+
+    def update_demand(self, pcd_sectors):
+        """
+        Refresh the population and user throughput of postcode sectors in
+        place.
+
+        Demand is recomputed for every sector whose population or user
+        throughput has changed. Capacity is only recomputed where a new
+        population density moves a sector into a different clutter
+        environment.
+
+        Arguments
+        ---------
+        pcd_sectors: :obj:`list` of :obj:`dict`
+            List of postcode sectors, as passed on construction.
+
+        """
+        changed_pcd_sectors = []
+        for pcd_sector_data in pcd_sectors:
+            pcd_sector = self.postcode_sectors.get(pcd_sector_data["id"])
+            if pcd_sector is None:
+                continue
+
+            clutter_environment = pcd_sector.clutter_environment
+            changed = pcd_sector.update_demand(pcd_sector_data["population"],
+                pcd_sector_data["user_throughput"],
+                self._simulation_parameters)
+
+            if changed:
+                self._invalidate_lad(pcd_sector)
+
+            if pcd_sector.clutter_environment != clutter_environment:
+                changed_pcd_sectors.append(pcd_sector)
+
+        self._update_capacities(changed_pcd_sectors)
+
+
+    def _update_capacities(self, pcd_sectors):
+        """
+        Recompute the capacity of the given postcode sectors in one pass.
+
+        """
+        if not pcd_sectors:
+            return
+
+        capacities = calculate_capacities(pcd_sectors,
+            self._capacity_lookup_table, self._simulation_parameters)
+
+        for pcd_sector, capacity in zip(pcd_sectors, capacities.tolist()):
+            pcd_sector.capacity = capacity
+            self._invalidate_lad(pcd_sector)
+
+
+    def _invalidate_lad(self, pcd_sector):
+        """
+        Mark the LAD aggregates containing a changed postcode sector as stale.
+
+        """
+        lad = self.lads.get(pcd_sector.lad_id)
+        if lad is not None:
+            lad.invalidate_aggregates()
+
 
 class LAD(object):
     """
@@ -156,27 +287,26 @@ class LAD(object):
         self.name = data["name"]
         self._pcd_sectors = {}
 
+        # Running totals over nested postcode sectors, rebuilt in a single
+        # pass after a nested postcode sector changes
+        self._aggregates = None
+        self._population_with_coverage = {}
+
     def __repr__(self):
         return "<LAD id:{} name:{}>".format(self.id, self.name)
 
 
     @property
     def population(self):
-        return sum([
-            pcd_sector.population
-            for pcd_sector in self._pcd_sectors.values()])
+        return self._get_aggregates()['population']
 
     @property
     def area(self):
-        return sum([
-            pcd_sector.area
-            for pcd_sector in self._pcd_sectors.values()])
+        return self._get_aggregates()['area']
 
     @property
     def population_density(self):
-        total_area = sum([
-            pcd_sector.area
-            for pcd_sector in self._pcd_sectors.values()])
+        total_area = self.area
         if total_area == 0:
             return 0
         else:
@@ -184,8 +314,50 @@ class LAD(object):
 
 
     def add_pcd_sector(self, pcd_sector):
+        if pcd_sector.id in self._pcd_sectors:
+            self._pcd_sectors[pcd_sector.id] = pcd_sector
+            self.invalidate_aggregates()
+            return
+
         self._pcd_sectors[pcd_sector.id] = pcd_sector
 
+        if self._aggregates is not None:
+            self._aggregates['population'] += pcd_sector.population
+            self._aggregates['area'] += pcd_sector.area
+            self._aggregates['capacity'] += pcd_sector.capacity
+            self._aggregates['demand'] += pcd_sector.demand * pcd_sector.area
+
+        for threshold in self._population_with_coverage:
+            if pcd_sector.capacity >= threshold:
+                self._population_with_coverage[threshold] += pcd_sector.population
+
+
+    def invalidate_aggregates(self):
+        """Mark the running totals as stale after a nested postcode sector
+        has changed
+        """
+        self._aggregates = None
+        self._population_with_coverage = {}
+
+
+    def _get_aggregates(self):
+        if self._aggregates is None:
+            aggregates = {
+                'population': 0,
+                'area': 0,
+                'capacity': 0,
+                'demand': 0,
+            }
+            for pcd_sector in self._pcd_sectors.values():
+                aggregates['population'] += pcd_sector.population
+                aggregates['area'] += pcd_sector.area
+                aggregates['capacity'] += pcd_sector.capacity
+                aggregates['demand'] += pcd_sector.demand * pcd_sector.area
+
+            self._aggregates = aggregates
+
+        return self._aggregates
+
 
     def capacity(self):
         """Return the mean capacity from all nested postcode sectors
@@ -193,9 +365,7 @@ class LAD(object):
         if not self._pcd_sectors:
             return 0
 
-        summed_capacity = sum([
-            pcd_sector.capacity
-            for pcd_sector in self._pcd_sectors.values()])
+        summed_capacity = self._get_aggregates()['capacity']
         return summed_capacity / len(self._pcd_sectors)
 
 
@@ -205,14 +375,8 @@ class LAD(object):
         if not self._pcd_sectors:
             return 0
 
-        summed_demand = sum(
-            pcd_sector.demand * pcd_sector.area
-            for pcd_sector in self._pcd_sectors.values()
-        )
-        summed_area = sum(
-            pcd_sector.area
-            for pcd_sector in self._pcd_sectors.values()
-        )
+        summed_demand = self._get_aggregates()['demand']
+        summed_area = self._get_aggregates()['area']
 
         return summed_demand / summed_area
 
@@ -225,14 +389,15 @@ class LAD(object):
 
         threshold = simulation_parameters['coverage_threshold']
 
-        population_with_coverage = sum([
-            pcd_sector.population
-            for pcd_sector in self._pcd_sectors.values()
-            if pcd_sector.capacity >= threshold])
+        if threshold not in self._population_with_coverage:
+            self._population_with_coverage[threshold] = sum([
+                pcd_sector.population
+                for pcd_sector in self._pcd_sectors.values()
+                if pcd_sector.capacity >= threshold])
+
+        population_with_coverage = self._population_with_coverage[threshold]
 
-        total_pop = sum([
-            pcd_sector.population
-            for pcd_sector in self._pcd_sectors.values()])
+        total_pop = self.population
 
         return float(population_with_coverage) / total_pop
 
@@ -241,7 +406,8 @@ class PostcodeSector(object):
     """Represents a pcd_sector to be modelled
     """
     def __init__(self, data, assets, capacity_lookup_table,
-        clutter_lookup, simulation_parameters, testing):
+        clutter_lookup, simulation_parameters, testing,
+        calculate_capacity=True):
 
         self.id = data["id"]
         self.lad_id = data["lad_id"]
@@ -265,39 +431,81 @@ class PostcodeSector(object):
         )
 
         self.assets = assets
+        self.site_index = SiteIndex(assets)
+        self._simulation_parameters = simulation_parameters
 
         self.site_density_macrocells = self._calculate_site_density_macrocells()
         self.site_density_small_cells = self._calculate_site_density_small_cells()
 
-        self.capacity = (
-            self._macrocell_site_capacity(simulation_parameters, testing) +
-            self.small_cell_capacity(simulation_parameters, testing)
-        )
+        # Per-band capacities, filled on first use by capacity_with
+        self._band_capacities = None
+
+        # Left unset when the NetworkManager computes all sector
+        # capacities at once with calculate_capacities
+        self.capacity = None
+        if calculate_capacity:
+            self.capacity = (
+                self._macrocell_site_capacity(simulation_parameters, testing) +
+                self.small_cell_capacity(simulation_parameters, testing)
+            )
 
 
     def __repr__(self):
         return "<PostcodeSector id:{}>".format(self.id)
 
-    def _calculate_site_density_macrocells(self):
+    def add_assets(self, assets):
+        """
+        Add newly built assets and update site densities.
 
-        unique_sites = set()
-        for asset in self.assets:
-            if asset['type'] == 'macrocell_site':
-                unique_sites.add(asset['site_ngr'])
+        Capacity is left to the caller, which recomputes it for all
+        changed postcode sectors together.
 
-        site_density = float(len(unique_sites)) / self.area
+        """
+        assets = list(assets)
+        self.assets = self.assets + assets
+        self.site_index.add(assets)
+
+        self.site_density_macrocells = self._calculate_site_density_macrocells()
+        self.site_density_small_cells = self._calculate_site_density_small_cells()
+
+        self._band_capacities = None
+
+    def update_demand(self, population, user_throughput, simulation_parameters):
+        """
+        Update population and user throughput, refreshing demand and the
+        clutter environment. Returns whether anything changed.
+
+        """
+        if (population == self.population and
+                user_throughput == self.user_throughput):
+            return False
+
+        self.population = population
+        self.user_throughput = user_throughput
+        self.user_demand = self._calculate_user_demand(
+            self.user_throughput, simulation_parameters)
+
+        self.demand_density = self.demand / self.area
+
+        self.clutter_environment = lookup_clutter_geotype(
+            self._clutter_lookup,
+            self.population_density
+        )
+
+        self._band_capacities = None
+
+        return True
+
+    def _calculate_site_density_macrocells(self):
+
+        site_density = float(len(self.site_index.macrocell_sites)) / self.area
 
         return site_density
 
 
     def _calculate_site_density_small_cells(self):
 
-        small_cells = []
-        for asset in self.assets:
-            if asset['type'] == 'small_cell':
-                small_cells.append(asset)
-
-        site_density = float(len(small_cells)) / self.area
+        site_density = float(self.site_index.num_small_cells) / self.area
 
         return site_density
 
@@ -361,23 +569,17 @@ class PostcodeSector(object):
         """
         capacity = 0
 
-        for frequency in ['700', '800', '1800', '2600', '3500', '26000']:
-            unique_sites = set()
-            for asset in self.assets:
-                for asset_frequency in asset['frequency']:
+        unique_sites_by_frequency = self._unique_sites_by_frequency()
 
-                    if asset_frequency == frequency:
-                        unique_sites.add(asset['site_ngr'])
+        for frequency in MACROCELL_FREQUENCIES:
+            unique_sites = unique_sites_by_frequency[frequency]
 
             site_density = float(len(unique_sites)) / self.area
 
             bandwidth = find_frequency_bandwidth(frequency,
                 simulation_parameters)
 
-            if frequency == '700' or frequency == '3500' or frequency == '26000':
-                generation = '5G'
-            else:
-                generation = '4G'
+            generation = find_frequency_generation(frequency)
 
             tech_capacity = lookup_capacity(
                 self._capacity_lookup_table,
@@ -393,19 +595,104 @@ class PostcodeSector(object):
         return capacity
 
 
+    def _unique_sites_by_frequency(self):
+        """
+        Find the unique sites operating at each macrocellular frequency.
+
+        """
+        return self.site_index.sites_by_frequency
+
+
+    def capacity_with(self, assets):
+        """
+        Find the capacity the postcode sector would have with extra assets.
+
+        Only the spectrum bands the extra assets add sites to are looked up
+        again; all other bands reuse the capacities found for the existing
+        assets.
+
+        Arguments
+        ---------
+        assets: :obj:`list` of :obj:`dict`
+            Assets to consider in addition to those already in the sector.
+
+        """
+        macrocell_capacity, small_cell_capacity = self._capacities_with(assets)
+
+        return macrocell_capacity + small_cell_capacity
+
+
+    def _capacities_with(self, assets):
+        """
+        Return the macrocell and small cell capacity with extra assets.
+
+        """
+        if self._band_capacities is None:
+            self._band_capacities = {
+                frequency: self._band_capacity(frequency,
+                    len(self.site_index.sites_by_frequency[frequency]))
+                for frequency in MACROCELL_FREQUENCIES
+            }
+            self._band_capacities['small_cells'] = self._band_capacity(
+                'small_cells', self.site_index.num_small_cells)
+
+        unique_sites = self.site_index.sites_by_frequency
+        new_sites = defaultdict(set)
+        new_small_cells = 0
+        for asset in assets:
+            if asset['type'] == "small_cell":
+                new_small_cells += 1
+            for asset_frequency in asset['frequency']:
+                if asset_frequency in unique_sites and \
+                        asset['site_ngr'] not in unique_sites[asset_frequency]:
+                    new_sites[asset_frequency].add(asset['site_ngr'])
+
+        macrocell_capacity = 0
+        for frequency in MACROCELL_FREQUENCIES:
+            if frequency in new_sites:
+                macrocell_capacity += self._band_capacity(frequency,
+                    len(unique_sites[frequency]) + len(new_sites[frequency]))
+            else:
+                macrocell_capacity += self._band_capacities[frequency]
+
+        if new_small_cells:
+            small_cell_capacity = self._band_capacity('small_cells',
+                self.site_index.num_small_cells + new_small_cells)
+        else:
+            small_cell_capacity = self._band_capacities['small_cells']
+
+        return macrocell_capacity, small_cell_capacity
+
+
+    def _band_capacity(self, frequency, num_sites):
+        """
+        Find the capacity of a single spectrum band, or of the small cell
+        layer, for a number of sites.
+
+        """
+        site_density = float(num_sites) / self.area
+
+        if frequency == 'small_cells':
+            return lookup_capacity(self._capacity_lookup_table,
+                "small_cells", "3700", "25", "5G", site_density, 1)
+
+        return lookup_capacity(
+            self._capacity_lookup_table,
+            self.clutter_environment,
+            frequency,
+            find_frequency_bandwidth(frequency, self._simulation_parameters),
+            find_frequency_generation(frequency),
+            site_density,
+            0)
+
+
     def small_cell_capacity(self, simulation_parameters, testing):
         """
         Find the small cell Radio Access Network capacity given the
         area assets and deployed frequency bands.
 
         """
-        num_small_cells = len([
-            asset
-            for asset in self.assets
-            if asset['type'] == "small_cell"
-        ])
-
-        site_density = float(num_small_cells) / self.area
+        site_density = float(self.site_index.num_small_cells) / self.area
 
         capacity = lookup_capacity(
             self._capacity_lookup_table,
@@ -419,6 +706,324 @@ class PostcodeSector(object):
         return capacity
 
 
+class SiteIndex(object):
+    """
+    Index of the sites and spectrum bands in a postcode sector.
+
+    Built in a single pass over the assets, and updated as assets are
+    added, so that site densities, capacities and intervention decisions
+    do not each scan every asset again.
+
+    Parameters
+    ----------
+    assets: :obj:`list` of :obj:`dict` or :obj:`Asset`
+        Assets in the postcode sector.
+
+    Attributes
+    ----------
+    site_technologies: :obj:`dict`
+        Set of technologies at each site, in order of first appearance.
+    site_frequencies: :obj:`dict`
+        List of asset frequency values at each site, as given.
+    macrocell_sites: :obj:`set`
+        Sites with a macrocell asset.
+    sites_by_frequency: :obj:`dict`
+        Set of sites operating at each macrocellular frequency.
+    num_small_cells: :obj:`int`
+        Number of small cell assets.
+
+    """
+    def __init__(self, assets=()):
+        self.site_technologies = {}
+        self.site_frequencies = {}
+        self.macrocell_sites = set()
+        self.sites_by_frequency = {
+            frequency: set() for frequency in MACROCELL_FREQUENCIES
+        }
+        self.num_small_cells = 0
+
+        self.add(assets)
+
+    def __repr__(self):
+        return "<SiteIndex sites:{} small_cells:{}>".format(
+            len(self.site_technologies), self.num_small_cells)
+
+    def add(self, assets):
+        """
+        Add assets to the index.
+
+        """
+        for asset in assets:
+            site_ngr = asset['site_ngr']
+
+            if site_ngr not in self.site_technologies:
+                self.site_technologies[site_ngr] = set()
+                self.site_frequencies[site_ngr] = []
+            self.site_technologies[site_ngr].add(asset['technology'])
+            self.site_frequencies[site_ngr].append(asset['frequency'])
+
+            if asset['type'] == 'macrocell_site':
+                self.macrocell_sites.add(site_ngr)
+            elif asset['type'] == 'small_cell':
+                self.num_small_cells += 1
+
+            for asset_frequency in asset['frequency']:
+                if asset_frequency in self.sites_by_frequency:
+                    self.sites_by_frequency[asset_frequency].add(site_ngr)
+
+
+class Asset(object):
+    """
+    Compact, read-only representation of a mobile network asset.
+
+    Assets are held with ``__slots__`` rather than as dicts, and repeated
+    strings (site, technology, type, bandwidth, postcode sector) are
+    interned, so that the many identical assets built over a long scenario
+    share their values. A list of frequencies is held as a shared tuple; a
+    single frequency string is kept as it is. Any other fields, such as
+    costs, are kept in an optional dict.
+
+    Assets can be indexed like the dicts they replace, and
+    :meth:`from_dict` and :meth:`to_dict` convert at the I/O boundaries.
+
+    Parameters
+    ----------
+    site_ngr: :obj:`str`
+        Site national grid reference ('small_cell_site' for small cells)
+    frequency: :obj:`str` or :obj:`list` of :obj:`str`
+        Frequency or frequencies deployed
+    technology: :obj:`str`
+        Technology deployed, e.g. 'LTE', '5G'
+    type: :obj:`str`
+        'macrocell_site' or 'small_cell'
+    bandwidth: :obj:`str`
+        Bandwidth deployed
+    build_date: :obj:`int`
+        Year the asset was built
+    pcd_sector: :obj:`str`
+        Postcode sector containing the asset
+    **extra
+        Any further fields
+
+    """
+    __slots__ = ('site_ngr', 'frequency', 'technology', 'type', 'bandwidth',
+        'build_date', 'pcd_sector', '_extra')
+
+    FIELDS = ('site_ngr', 'frequency', 'technology', 'type', 'bandwidth',
+        'build_date', 'pcd_sector')
+
+    # shared tuples for lists of frequencies
+    _frequencies = {}
+
+    def __init__(self, site_ngr, frequency, technology, type, bandwidth,
+                 build_date, pcd_sector, **extra):
+        set_field = object.__setattr__
+        set_field(self, 'site_ngr', _intern(site_ngr))
+        set_field(self, 'frequency', self._compact_frequency(frequency))
+        set_field(self, 'technology', _intern(technology))
+        set_field(self, 'type', _intern(type))
+        set_field(self, 'bandwidth', _intern(bandwidth))
+        set_field(self, 'build_date', build_date)
+        set_field(self, 'pcd_sector', _intern(pcd_sector))
+        set_field(self, '_extra', extra or None)
+
+    @classmethod
+    def _compact_frequency(cls, frequency):
+        if isinstance(frequency, (list, tuple)):
+            frequency = tuple(_intern(value) for value in frequency)
+            return cls._frequencies.setdefault(frequency, frequency)
+        return _intern(frequency)
+
+    @classmethod
+    def from_dict(cls, data, **fields):
+        """
+        Create an asset from its dict form. Keyword arguments override
+        fields of ``data``, and fields missing from both are None.
+
+        """
+        data = dict(data, **fields)
+        return cls(*[data.pop(field, None) for field in cls.FIELDS], **data)
+
+    def to_dict(self):
+        """
+        Return the dict form of the asset, with any list of frequencies
+        as a list again.
+
+        """
+        data = {field: getattr(self, field) for field in self.FIELDS}
+        if isinstance(self.frequency, tuple):
+            data['frequency'] = list(self.frequency)
+        if self._extra:
+            data.update(self._extra)
+        return data
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Asset is read-only")
+
+    def __getitem__(self, key):
+        if key in self.FIELDS:
+            return getattr(self, key)
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.FIELDS or bool(self._extra and key in self._extra)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return self.to_dict().keys()
+
+    def __eq__(self, other):
+        if isinstance(other, Asset):
+            other = other.to_dict()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return equal
+        return not equal
+
+    __hash__ = None
+
+    def __getstate__(self):
+        return tuple(getattr(self, field) for field in self.__slots__)
+
+    def __setstate__(self, state):
+        for field, value in zip(self.__slots__, state):
+            object.__setattr__(self, field, value)
+
+    def __repr__(self):
+        return "<Asset site_ngr:{} type:{} frequency:{}>".format(
+            self.site_ngr, self.type, self.frequency)
+
+
+def as_asset(asset):
+    """
+    Return ``asset`` as an :class:`Asset`, converting it from a dict if
+    needed.
+
+    """
+    if isinstance(asset, Asset):
+        return asset
+    return Asset.from_dict(asset)
+
+
+def _intern(value):
+    if isinstance(value, str):
+        return sys.intern(value)
+    return value
+
+
+def calculate_capacities(pcd_sectors, capacity_lookup_table,
+    simulation_parameters):
+    """
+    Find the Radio Access Network capacity of many postcode sectors at once.
+
+    Site densities are gathered into one array per spectrum band and passed
+    through :func:`lookup_capacities`, giving the same result as the
+    per-sector :meth:`PostcodeSector._macrocell_site_capacity` and
+    :meth:`PostcodeSector.small_cell_capacity` sum.
+
+    Parameters
+    ----------
+    pcd_sectors: :obj:`list` of :obj:`PostcodeSector`
+        Postcode sectors to assess.
+    capacity_lookup_table: dict or :obj:`CapacityLookupTable`
+        Capacity lookup table, as passed to the :obj:`NetworkManager`.
+    simulation_parameters: dict
+        Contains the channel bandwidth of each frequency.
+
+    Returns
+    -------
+    :obj:`numpy.ndarray`
+        Capacity in Mbps/km^2 of each postcode sector, in input order.
+
+    """
+    if not isinstance(capacity_lookup_table, CapacityLookupTable):
+        capacity_lookup_table = CapacityLookupTable(capacity_lookup_table)
+
+    areas = np.array([pcd_sector.area for pcd_sector in pcd_sectors],
+        dtype=float)
+    clutter_environments = np.array([
+        pcd_sector.clutter_environment for pcd_sector in pcd_sectors],
+        dtype=object)
+
+    unique_sites_by_frequency = [
+        pcd_sector._unique_sites_by_frequency() for pcd_sector in pcd_sectors
+    ]
+
+    capacity = np.zeros(len(pcd_sectors))
+
+    for frequency in MACROCELL_FREQUENCIES:
+        num_sites = np.array([
+            len(unique_sites[frequency])
+            for unique_sites in unique_sites_by_frequency], dtype=float)
+
+        capacity += lookup_capacities(
+            capacity_lookup_table,
+            clutter_environments,
+            frequency,
+            find_frequency_bandwidth(frequency, simulation_parameters),
+            find_frequency_generation(frequency),
+            num_sites / areas)
+
+    num_small_cells = np.array([
+        pcd_sector.site_index.num_small_cells
+        for pcd_sector in pcd_sectors], dtype=float)
+
+    capacity += lookup_capacities(
+        capacity_lookup_table,
+        np.full(len(pcd_sectors), "small_cells", dtype=object),
+        "3700",
+        "25",
+        "5G",
+        num_small_cells / areas)
+
+    return capacity
+
+
+def has_capacity_curves(lookup_table, clutter_environment,
+    simulation_parameters):
+    """
+    Check the lookup table holds every curve a postcode sector in the
+    given clutter environment needs to find its capacity.
+
+    """
+    for frequency in MACROCELL_FREQUENCIES:
+        key = (
+            clutter_environment,
+            frequency,
+            find_frequency_bandwidth(frequency, simulation_parameters),
+            find_frequency_generation(frequency)
+        )
+        if key not in lookup_table:
+            return False
+
+    return ("small_cells", "3700", "25", "5G") in lookup_table
+
+
+def find_frequency_generation(frequency):
+    """
+    Finds the generation of mobile technology deployed at a frequency.
+
+    """
+    if frequency == '700' or frequency == '3500' or frequency == '26000':
+        generation = '5G'
+    else:
+        generation = '4G'
+
+    return generation
+
+
 def find_frequency_bandwidth(frequency, simulation_parameters):
     """
     Finds the correct bandwidth for a specific frequency from the
@@ -468,6 +1073,143 @@ def lookup_clutter_geotype(clutter_lookup, population_density):
         return middle_geotype
 
 
+class CapacityLookupTable(object):
+    """
+    Capacity lookup table compiled for repeated interpolation.
+
+    Each capacity curve is held as sorted density and capacity sequences,
+    so a query is answered with a binary search rather than a walk along
+    the curve. Queries follow the :func:`lookup_capacity` rules: zero
+    capacity below the lowest density, linear interpolation within the
+    curve and the highest capacity at or beyond the highest density.
+
+    Parameters
+    ----------
+    lookup_table: dict
+        * key: :obj:`tuple`
+            (environment, frequency, bandwidth, generation)
+        * value: :obj:`list` of :obj:`tuple`
+            (site density per km^2, capacity in Mbps/km^2)
+
+    """
+    def __init__(self, lookup_table):
+        self._density_capacities = {}
+        self._densities = {}
+        self._capacities = {}
+        self._density_arrays = {}
+        self._capacity_arrays = {}
+
+        for key, density_capacities in lookup_table.items():
+            density_capacities = sorted(density_capacities, key=lambda tup: tup[0])
+            densities = [density for density, _ in density_capacities]
+            capacities = [capacity for _, capacity in density_capacities]
+
+            self._density_capacities[key] = density_capacities
+            self._densities[key] = densities
+            self._capacities[key] = capacities
+            self._density_arrays[key] = np.array(densities, dtype=float)
+            self._capacity_arrays[key] = np.array(capacities, dtype=float)
+
+    def __repr__(self):
+        return "<CapacityLookupTable curves:{}>".format(len(self._densities))
+
+    def __contains__(self, key):
+        return key in self._densities
+
+    def __getitem__(self, key):
+        return self._density_capacities[key]
+
+    def __len__(self):
+        return len(self._densities)
+
+    def __iter__(self):
+        return iter(self._density_capacities)
+
+    def keys(self):
+        return self._density_capacities.keys()
+
+    def items(self):
+        return self._density_capacities.items()
+
+    def lookup(self, key, site_density):
+        """
+        Find the capacity of a single site density on the curve for ``key``.
+
+        """
+        densities = self._densities[key]
+        capacities = self._capacities[key]
+
+        lower = bisect_right(densities, site_density) - 1
+
+        if lower < 0:
+            return 0
+
+        if lower >= len(densities) - 1:
+            return capacities[-1]
+
+        return interpolate(densities[lower], capacities[lower],
+            densities[lower + 1], capacities[lower + 1], site_density)
+
+    def minimum_density(self, key, capacity):
+        """
+        Find the lowest site density on the curve for ``key`` which
+        provides at least ``capacity``, inverting :meth:`lookup`.
+
+        Capacity curves rise with site density, so the first point reaching
+        ``capacity`` is found with a binary search.
+
+        Returns None if no density on the curve reaches ``capacity``.
+
+        """
+        densities = self._densities[key]
+        capacities = self._capacities[key]
+
+        if capacity <= 0:
+            return 0
+
+        if capacities[0] >= capacity:
+            return densities[0]
+
+        upper = bisect_left(capacities, capacity)
+
+        if upper == len(capacities):
+            return None
+
+        lower = upper - 1
+        if densities[lower] == densities[upper]:
+            return densities[upper]
+
+        return interpolate(capacities[lower], densities[lower],
+            capacities[upper], densities[upper], capacity)
+
+    def lookup_array(self, key, site_densities):
+        """
+        Find the capacity of an array of site densities on the curve for
+        ``key``.
+
+        """
+        densities = self._density_arrays[key]
+        capacities = self._capacity_arrays[key]
+        site_densities = np.asarray(site_densities, dtype=float)
+
+        # index of the last curve point at or below each density
+        lower = np.searchsorted(densities, site_densities, side='right') - 1
+        below_curve = lower < 0
+        beyond_curve = lower >= len(densities) - 1
+        within_curve = ~(below_curve | beyond_curve)
+
+        result = np.full(len(site_densities), capacities[-1])
+        result[below_curve] = 0
+
+        lower = lower[within_curve]
+        result[within_curve] = interpolate(
+            densities[lower], capacities[lower],
+            densities[lower + 1], capacities[lower + 1],
+            site_densities[within_curve])
+
+        return result
+
+
 def lookup_capacity(lookup_table, clutter_environment, frequency, bandwidth, generation, site_density, testing):
     """
     Use lookup table to find capacity by clutter environment geotype,
@@ -477,6 +1219,11 @@ def lookup_capacity(lookup_table, clutter_environment, frequency, bandwidth, gen
     if (clutter_environment, frequency, bandwidth, generation) not in lookup_table:
         raise KeyError("Combination %s not found in lookup table",
                        (clutter_environment, frequency, bandwidth, generation))
+
+    if isinstance(lookup_table, CapacityLookupTable):
+        return lookup_table.lookup(
+            (clutter_environment, frequency, bandwidth, generation), site_density)
+
     density_capacities = lookup_table[(clutter_environment, frequency, bandwidth, generation)]
 
     lowest_density, lowest_capacity = density_capacities[0]
@@ -495,6 +1242,40 @@ def lookup_capacity(lookup_table, clutter_environment, frequency, bandwidth, gen
     return highest_capacity
 
 
+def lookup_capacities(lookup_table, clutter_environments, frequency, bandwidth,
+    generation, site_densities):
+    """
+    Vectorised form of :func:`lookup_capacity`.
+
+    Finds the capacity for an array of site densities, each paired with
+    a clutter environment, with one piecewise-linear interpolation per
+    distinct environment. Densities below the lowest point of a curve
+    give zero capacity and densities at or beyond the highest point give
+    the highest capacity, as in :func:`lookup_capacity`. A dictionary
+    lookup table is compiled to a :obj:`CapacityLookupTable` first.
+
+    """
+    if not isinstance(lookup_table, CapacityLookupTable):
+        lookup_table = CapacityLookupTable(lookup_table)
+
+    clutter_environments = np.asarray(clutter_environments, dtype=object)
+    site_densities = np.asarray(site_densities, dtype=float)
+
+    capacities = np.zeros(len(site_densities))
+
+    for clutter_environment in set(clutter_environments.tolist()):
+        key = (clutter_environment, frequency, bandwidth, generation)
+        if key not in lookup_table:
+            raise KeyError("Combination %s not found in lookup table",
+                           key)
+
+        in_environment = clutter_environments == clutter_environment
+        capacities[in_environment] = lookup_table.lookup_array(
+            key, site_densities[in_environment])
+
+    return capacities
+
+
 def interpolate(x0, y0, x1, y1, x):
     """
     Linear interpolation between two values.
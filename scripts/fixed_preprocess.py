@@ -2,12 +2,13 @@ import os
 import sys
 import configparser
 import csv
-import fiona
 
 from collections import defaultdict, OrderedDict
 
 from shapely.geometry import shape, Polygon, MultiPolygon, mapping
-from rtree import index
+
+from digital_comms.feature_cache import read_features
+from digital_comms.geometry_cache import GeometryCache
 
 CONFIG = configparser.ConfigParser()
 CONFIG.read(os.path.join(os.path.dirname(__file__), 'script_config.ini'))
@@ -15,33 +16,49 @@ BASE_PATH = CONFIG['file_locations']['base_path']
 
 DATA_OUTPUT = os.path.join(BASE_PATH, 'intermediate')
 DATA_INPUT = os.path.join(BASE_PATH, 'raw', 'd_shapes')
+FEATURE_CACHE = os.path.join(DATA_OUTPUT, 'feature_cache.sqlite')
 
 
 def read_exchange_areas(path):
 
-    with fiona.open(path, 'r') as source:
-        return [feature for feature in source]
+    return read_features(path, FEATURE_CACHE)
 
 
 def read_lad_areas(path):
-    with fiona.open(path, 'r') as source:
-        return [area for area in source]
+    return read_features(path, FEATURE_CACHE)
+
 
+def intersect_lad_areas_and_exchanges(exchanges, areas, geometry_cache=None):
+    """
+    Find the local authority districts each exchange area intersects, with
+    the share of the exchange area falling in each, to be used as the
+    weights of a LadAggregator.
 
-def intersect_lad_areas_and_exchanges(exchanges, areas):
+    Exchanges are identified by their feature id, as read by
+    scripts/fixed_run.py. Shapes are taken from ``geometry_cache``, which
+    can be shared with other overlay steps.
+
+    """
+    if geometry_cache is None:
+        geometry_cache = GeometryCache()
 
-    exchange_to_lad_area_lut = defaultdict(list)
+    exchange_to_lad_area_lut = []
 
-    idx = index.Index()
-    [idx.insert(0, shape(exchange['geometry']).bounds, exchange) for exchange in exchanges]
+    idx = geometry_cache.index(exchanges)
 
     for area in areas:
-        for n in idx.intersection((shape(area['geometry']).bounds), objects=True):
-            area_shape = shape(area['geometry'])
-            exchange_shape = shape(n.object['geometry'])
-            if area_shape.intersects(exchange_shape):
-                exchange_to_lad_area_lut[n.object['properties']['id']].append({
-                    'lad': area['properties']['name'],
+        area_shape = geometry_cache.prepared(area)
+        for n in sorted(idx.intersection(geometry_cache.bounds(area))):
+            exchange = exchanges[n]
+            exchange_shape = geometry_cache.shape(exchange)
+            if area_shape.intersects(exchange_shape) and exchange_shape.area > 0:
+                exchange_to_lad_area_lut.append({
+                    'exchange_id': exchange['id'],
+                    'lad_id': area['properties']['name'],
+                    'weight': (
+                        geometry_cache.shape(area).intersection(exchange_shape).area /
+                        exchange_shape.area
+                    ),
                     })
 
     return exchange_to_lad_area_lut
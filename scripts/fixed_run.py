@@ -4,21 +4,25 @@ import glob
 import itertools
 import logging
 import os
-import fiona
+from collections import defaultdict, deque
+
 from rtree import index
 
 from shapely.geometry import shape
 
-from digital_comms.fixed_network.model import NetworkManager
-from digital_comms.fixed_network.interventions import decide_interventions
+from digital_comms.feature_cache import read_features
+from digital_comms.fixed_network.aggregation import LadAggregator
+from digital_comms.fixed_network.rollout import RolloutEngine
 
 CONFIG = configparser.ConfigParser()
 CONFIG.read(os.path.join(os.path.dirname(__file__), '..', 'scripts', 'script_config.ini'))
 BASE_PATH = CONFIG['file_locations']['base_path']
 
 SCENARIO_DATA = os.path.join(BASE_PATH, 'scenarios')
+DATA_INTERMEDIATE = os.path.join(BASE_PATH, 'intermediate')
 DATA_PROCESSED_INPUTS = os.path.join(BASE_PATH, 'processed')
 RESULTS_DIRECTORY = os.path.join(BASE_PATH, '..', 'results')
+FEATURE_CACHE = os.path.join(DATA_INTERMEDIATE, 'feature_cache.sqlite')
 
 
 def read_data(path):
@@ -55,29 +59,28 @@ def load_local_authority_districts(path):
     """
     lads = []
 
-    with fiona.open(path, 'r') as lad_shape:
-        for lad in lad_shape:
-            if not lad['properties']['name'].startswith((
-                'E06000053',
-                'S12000027',
-                'N09000001',
-                'N09000002',
-                'N09000003',
-                'N09000004',
-                'N09000005',
-                'N09000006',
-                'N09000007',
-                'N09000008',
-                'N09000009',
-                'N09000010',
-                'N09000011',
-                )):
-                geom_area = round(shape(lad['geometry']).area / 1e6, 1)
-                lads.append({
-                    'id': lad['properties']['name'],
-                    'name': lad['properties']['desc'],
-                    'area': geom_area
-                })
+    for lad in read_features(path, FEATURE_CACHE):
+        if not lad['properties']['name'].startswith((
+            'E06000053',
+            'S12000027',
+            'N09000001',
+            'N09000002',
+            'N09000003',
+            'N09000004',
+            'N09000005',
+            'N09000006',
+            'N09000007',
+            'N09000008',
+            'N09000009',
+            'N09000010',
+            'N09000011',
+            )):
+            geom_area = round(shape(lad['geometry']).area / 1e6, 1)
+            lads.append({
+                'id': lad['properties']['name'],
+                'name': lad['properties']['desc'],
+                'area': geom_area
+            })
 
     return lads
 
@@ -176,13 +179,12 @@ def read_exchange_areas(path):
     * id: 'string'
         Unique exchange id
     """
-    with fiona.open(path, 'r') as reader:
-        for item in reader:
-            geom_area = shape(item['geometry']).area / 1e6
-            yield {
-                'id': item['id'],
-                'area': geom_area,
-                }
+    for item in read_features(path, FEATURE_CACHE):
+        geom_area = shape(item['geometry']).area / 1e6
+        yield {
+            'id': item['id'],
+            'area': geom_area,
+            }
 
 
 def estimate_dwelling_density(exchanges, lads):
@@ -223,216 +225,287 @@ def estimate_dwelling_density(exchanges, lads):
     return output
 
 
-def write_decisions(decisions, path, year, technology, policy):
+def exchange_data_by_timestep(exchanges, lads, dwellings, timesteps):
     """
+    Estimate exchange dwellings and technology availability for each
+    timestep, reading the dwellings data once.
 
-    Write out the infrastructure decisions made annually for each technology and policy.
+    """
+    # dwellings may be a one-shot iterator, as from read_data, and are
+    # scanned once per timestep
+    dwellings = list(dwellings)
+
+    output = {}
+
+    for year in timesteps:
+        lad_dwellings = dwelling_density_by_lad(lads, dwellings, year)
+
+        #THIS DOES NOT CORRECTLY ALLOCATE - NEED TO GENERATE EX TO LAD LUT
+        output[year] = estimate_dwelling_density(exchanges, lad_dwellings)
+
+    return output
 
-    Parameters
-    ----------
-    decisions : list_of_tuples
-        Contains the upgraded assets with the deployed technology and affliated costs
-    year : int
-        The year of deployment.
-    technology : string
-        The new technology deployed.
-    policy : string
-        The policy used to encourage deployment.
 
+def exchange_dwellings_by_timestep(exchanges_by_timestep):
     """
-    decisions_filename = os.path.join(path,'decisions_{}_{}.csv'.format(technology, policy))
-
-    if year == BASE_YEAR:
-        decisions_file = open(decisions_filename, 'w', newline='')
-        decisions_writer = csv.writer(decisions_file)
-        decisions_writer.writerow(
-            ('year', 'asset_id', 'technology', 'policy', 'capital_investment_type'))
-    else:
-        decisions_file = open(decisions_filename, 'a', newline='')
-        decisions_writer = csv.writer(decisions_file)
-
-    # output and report results for this timestep
-    for intervention in decisions:
-        # Output decisions
-        year = year
-        asset_id = intervention[0]
-        technology = intervention[1]
-        policy = intervention[2]
-        capital_investment_type = intervention[3]
-
-        decisions_writer.writerow(
-            (
-                year, asset_id, technology, policy, capital_investment_type
-            )
-        )
+    Number of dwellings by timestep, then by (exchange id, LAD id), as
+    taken by RolloutEngine. Exchange ids repeat once per LAD, so each
+    record is keyed with its LAD to reach every exchange.
+
+    """
+    output = {}
+
+    for year, exchange_data in exchanges_by_timestep.items():
+        output[year] = {}
+        for exchange in exchange_data:
+            output[year][exchange['exchange_id'], exchange['lad_id']] = \
+                exchange['exchange_dwellings']
 
-    decisions_file.close()
+    return output
+
+
+def read_exchange_to_lad_lut(path):
+    """
+    Read the exchange to local authority district intersections written by
+    fixed_preprocess.py
+
+    Data Schema
+    -----------
+    * exchange_id: 'string'
+        Unique exchange id
+    * lad_id: 'string'
+        Unique local authority district id
+    * weight: 'float'
+        Share of the exchange area falling in the local authority district
+
+    """
+    with open(path, 'r') as source:
+        reader = csv.DictReader(source)
+        return [
+            {
+                'exchange_id': line['exchange_id'],
+                'lad_id': line['lad_id'],
+                'weight': float(line['weight']),
+            }
+            for line in reader
+        ]
 
 
-def write_spend(decisions, path, year, technology, policy):
-    """Write out spending decisions made annually for each technology and policy.
+class ResultSink():
+    """
+
+    Write the results of a run of one technology and policy to CSV files,
+    each opened once for all years.
+
+    Rows are buffered and written in bulk, once ``buffer_size`` rows are
+    held for a file and when the sink is flushed or closed. Use as a
+    context manager so the files are closed however the run ends.
 
     Parameters
     ----------
-    decisions : list_of_tuples
-        Contains the upgraded assets with the deployed technology and affliated costs
-    year : int
-        The year of deployment.
+    path : string
+        Directory to write results to.
     technology : string
         The new technology deployed.
     policy : string
         The policy used to encourage deployment.
-    spend_type : string
-        Whether the spent capital was purely market delivered, or subsidised.
-    spend : int
-        The amount of capital spent (£).
+    aggregator : LadAggregator
+        Exchange to local authority district weights. Without one, no
+        local authority district results are written.
+    buffer_size : int
+        Number of rows to hold for a file before writing them.
 
     """
-    decisions_filename = os.path.join(
-        path, 'spend_{}_{}.csv'.format(technology, policy))
-
-    if year == BASE_YEAR:
-        decisions_file = open(decisions_filename, 'w', newline='')
-        decisions_writer = csv.writer(decisions_file)
-        decisions_writer.writerow(
-            ('year', 'asset_id', 'technology', 'policy', 'capital_investment_type',
-            'total_upgrade_cost', 'total_private_investment', 'total_subsidy')
-        )
-
-    else:
-        decisions_file = open(decisions_filename, 'a', newline='')
-        decisions_writer = csv.writer(decisions_file)
-
-    # output and report results for this timestep
-    for intervention in decisions:
-        # Output decisions
-        year = year
-        asset_id = intervention[0]
-        technology = intervention[1]
-        policy = intervention[2]
-        capital_investment_type = intervention[3]
-        total_upgrade_cost = intervention[4]
-        total_private_investment = intervention[5]
-        total_subsidy = intervention[6]
-
-        decisions_writer.writerow(
-            (
-                asset_id, year, technology, policy, capital_investment_type,
-                total_upgrade_cost, total_private_investment, total_subsidy
-            )
-        )
-
-    decisions_file.close()
-
-
-def write_exchange_results(system, path, year, technology, policy):
-
-    results_filename = os.path.join(
-        path, 'exchange_{}_{}.csv'.format(technology, policy))
+    HEADERS = {
+        'decisions': (
+            'year', 'asset_id', 'technology', 'policy', 'capital_investment_type'
+        ),
+        'spend': (
+            'year', 'asset_id', 'technology', 'policy', 'capital_investment_type',
+            'total_upgrade_cost', 'total_private_investment', 'total_subsidy'
+        ),
+        'exchange': (
+            'exchange', 'year', 'technology', 'policy',
+            'average_capacity', 'fttp', 'fttdp', 'fttc',
+            'total_prems'
+        ),
+        'lad': (
+            'lad', 'year', 'technology', 'policy', 'average_capacity',
+            'fttp', 'fttdp', 'fttc', 'total_prems'
+        ), #'docsis3', 'adsl',
+    }
 
-    if year == BASE_YEAR:
-        results_file = open(results_filename, 'w', newline='')
-        results_writer = csv.writer(results_file)
-        results_writer.writerow(
+    def __init__(self, path, technology, policy, aggregator=None,
+                 buffer_size=10000):
+        self.path = path
+        self.technology = technology
+        self.policy = policy
+        self.aggregator = aggregator
+        self.buffer_size = buffer_size
+
+        self._files = {}
+        self._writers = {}
+        self._buffers = {}
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open(self):
+        """
+        Open each results file and write its header.
+        """
+        os.makedirs(self.path, exist_ok=True)
+
+        for name, header in self.HEADERS.items():
+            if name == 'lad' and self.aggregator is None:
+                continue
+
+            filename = os.path.join(self.path, '{}_{}_{}.csv'.format(
+                name, self.technology, self.policy))
+
+            self._files[name] = open(filename, 'w', newline='')
+            self._writers[name] = csv.writer(self._files[name])
+            self._writers[name].writerow(header)
+            self._buffers[name] = []
+
+    def flush(self):
+        """
+        Write all buffered rows.
+        """
+        for name, rows in self._buffers.items():
+            self._writers[name].writerows(rows)
+            del rows[:]
+            self._files[name].flush()
+
+    def close(self):
+        """
+        Write all buffered rows and close each results file.
+        """
+        try:
+            self.flush()
+        finally:
+            for results_file in self._files.values():
+                results_file.close()
+            self._files = {}
+            self._writers = {}
+            self._buffers = {}
+
+    def _add_rows(self, name, rows):
+        buffer = self._buffers[name]
+        buffer.extend(rows)
+        if len(buffer) >= self.buffer_size:
+            self._writers[name].writerows(buffer)
+            del buffer[:]
+
+    def write_decisions(self, decisions, year):
+        """
+
+        Write out the infrastructure decisions made in a year.
+
+        Parameters
+        ----------
+        decisions : list_of_tuples
+            Contains the upgraded assets with the deployed technology and
+            affliated costs
+        year : int
+            The year of deployment.
+
+        """
+        # asset_id, technology, policy, capital_investment_type
+        self._add_rows('decisions', (
+            (year, intervention[0], intervention[1], intervention[2],
+                intervention[3])
+            for intervention in decisions
+        ))
+
+    def write_spend(self, decisions, year):
+        """
+
+        Write out the spending decisions made in a year.
+
+        Parameters
+        ----------
+        decisions : list_of_tuples
+            Contains the upgraded assets with the deployed technology and
+            affliated costs
+        year : int
+            The year of deployment.
+
+        """
+        # asset_id, technology, policy, capital_investment_type,
+        # total_upgrade_cost, total_private_investment, total_subsidy
+        self._add_rows('spend', (
+            (intervention[0], year) + tuple(intervention[1:7])
+            for intervention in decisions
+        ))
+
+    def write_exchange_results(self, system, year):
+        """
+
+        Write out the coverage and capacity of each exchange in a year,
+        joining the two by exchange id.
+
+        One row is written per exchange record. Where records share an id,
+        each is joined to the capacity of the record in the same position
+        among them.
+
+        """
+        # {'id': '5390', 'average_capacity': 331},
+        capacity_by_id = defaultdict(deque)
+        for item in system.capacity():
+            capacity_by_id[item['id']].append(item)
+
+        #{'id': '5393', 'percentage_of_premises_with_fttp': 9,
+        # 'percentage_of_premises_with_fttdp': 9,
+        # 'percentage_of_premises_with_fttc': 9,
+        # 'sum_of_premises': 8924}
+        self._add_rows('exchange', (
             (
-                'exchange', 'year', 'technology', 'policy',
-                'average_capacity', 'fttp', 'fttdp', 'fttc',
-                'total_prems'
+                area_dict['id'],
+                year,
+                self.technology,
+                self.policy,
+                capacity_by_id[area_dict['id']].popleft()['average_capacity'],
+                area_dict['percentage_of_premises_with_fttp'],
+                area_dict['percentage_of_premises_with_fttdp'],
+                area_dict['percentage_of_premises_with_fttc'],
+                # area_dict['percentage_of_premises_with_docsis3'],
+                # area_dict['percentage_of_premises_with_adsl'],
+                area_dict['sum_of_premises'],
             )
-        )
-
-    else:
-        results_file = open(results_filename, 'a', newline='')
-        results_writer = csv.writer(results_file)
-
-    coverage = system.coverage()
-    #{'id': '5393', 'percentage_of_premises_with_fttp': 9,
-    # 'percentage_of_premises_with_fttdp': 9,
-    # 'percentage_of_premises_with_fttc': 9,
-    # 'sum_of_premises': 8924}
-    capacity = system.capacity()
-    # {'id': '5390', 'average_capacity': 331},
-
-    for area_dict in coverage:
-        for area_dict_2 in capacity:
-            if area_dict['id'] == area_dict_2['id']:
-                results_writer.writerow(
-                    (
-                        area_dict['id'],
-                        year,
-                        technology,
-                        policy,
-                        area_dict_2['average_capacity'],
-                        area_dict['percentage_of_premises_with_fttp'],
-                        area_dict['percentage_of_premises_with_fttdp'],
-                        area_dict['percentage_of_premises_with_fttc'],
-                        # area_dict['percentage_of_premises_with_docsis3'],
-                        # area_dict['percentage_of_premises_with_adsl'],
-                        area_dict['sum_of_premises'],
-                    )
-                )
-
-    results_file.close()
-
-
-def write_lad_results(system, exchange_to_lad_lut, path, year, technology, policy):
-
-    results_filename = os.path.join(
-        path, 'lad_{}_{}.csv'.format(technology, policy))
-
-    if year == BASE_YEAR:
-        results_file = open(results_filename, 'w', newline='')
-        results_writer = csv.writer(results_file)
-        results_writer.writerow(
+            for area_dict in system.coverage()
+        ))
+
+    def write_lad_results(self, system, year):
+        """
+
+        Write out the coverage and capacity of each local authority district
+        in a year.
+
+        """
+        # {'id': 'E06000031', 'percentage_of_premises_with_fttp': 9.2,
+        # 'percentage_of_premises_with_fttdp': 9.2,
+        # 'percentage_of_premises_with_fttc': 9.2,
+        # 'percentage_of_premises_with_adsl': 100.0,
+        # 'average_capacity': 331.6, 'sum_of_premises': 8924.0}
+        self._add_rows('lad', (
             (
-                'lad', 'year', 'technology', 'policy', 'average_capacity',
-                'fttp', 'fttdp', 'fttc', 'total_prems'
+                lad['id'],
+                year,
+                self.technology,
+                self.policy,
+                lad['average_capacity'],
+                lad['percentage_of_premises_with_fttp'],
+                lad['percentage_of_premises_with_fttdp'],
+                lad['percentage_of_premises_with_fttc'],
+                lad['sum_of_premises'],
             )
-        ) #'docsis3', 'adsl',
-
-    else:
-        results_file = open(results_filename, 'a', newline='')
-        results_writer = csv.writer(results_file)
-
-    coverage = system.coverage()
-    #{'id': '5393', 'percentage_of_premises_with_fttp': 9,
-    # 'percentage_of_premises_with_fttdp': 9,
-    # 'percentage_of_premises_with_fttc': 9,
-    # 'sum_of_premises': 8924}
-    capacity = system.capacity()
-    # {'id': '5390', 'average_capacity': 331},
-
-    # exchange_to_lad_lut
-    # {'exchange_id': '0', 'exchange_area': 6.033454232191916,
-    # 'proportion_of_lad_area': 0.01756975606345928,
-    # 'lad_id': 'E06000031', 'lad_name': 'Peterborough'}
-    unique_lads = set()
-    print(len(exchange_to_lad_lut))
-    for item in exchange_to_lad_lut:
-        print(item['lad_id'])
-        unique_lads.add(item['lad_id'])
-    print(unique_lads)
-
-    for area_dict in coverage:
-        for area_dict_2 in capacity:
-            if area_dict['id'] == area_dict_2['id']:
-                results_writer.writerow(
-                    (
-                        area_dict['id'],
-                        year,
-                        technology,
-                        policy,
-                        area_dict_2['average_capacity'],
-                        area_dict['percentage_of_premises_with_fttp'],
-                        area_dict['percentage_of_premises_with_fttdp'],
-                        area_dict['percentage_of_premises_with_fttc'],
-                        area_dict['percentage_of_premises_with_docsis3'],
-                        area_dict['percentage_of_premises_with_adsl'],
-                        area_dict['sum_of_premises'],
-                    )
-                )
-
-    results_file.close()
+            for lad in self.aggregator.aggregate(system)
+        ))
 
 
 if __name__ == "__main__":
@@ -462,7 +535,11 @@ if __name__ == "__main__":
 
     path = os.path.join('data', 'raw', 'd_shapes', 'all_exchange_areas', '_exchange_areas_fixed.shp')
     # {'id': , 'area': , }
-    exchanges = read_exchange_areas(path)
+    exchanges = list(read_exchange_areas(path))
+
+    path = os.path.join(BASE_PATH, 'intermediate', 'ex_to_lad_lut.csv')
+    # [{'exchange_id': , 'lad_id': , 'weight': }]
+    aggregator = LadAggregator(read_exchange_to_lad_lut(path))
 
     for scenario, technology, policy in [
         ('baseline', 'fttdp', 'market_insideout'),
@@ -499,35 +576,39 @@ if __name__ == "__main__":
 
         data_path = os.path.join('data','raw','e_dem_and_buildings','arc_dwellings','arc_dwellings__{}.csv'.format(scenario))
 
-        dwellings = read_data(data_path)
+        dwellings = list(read_data(data_path))
+
+        # derive exchange dwellings for every timestep once, and leave the
+        # rollout engine to apply the growth between timesteps
+        exchanges_by_timestep = exchange_data_by_timestep(
+            exchanges, lads, dwellings, TIMESTEPS)
 
-        for year in TIMESTEPS:
+        dwellings_by_timestep = exchange_dwellings_by_timestep(
+            exchanges_by_timestep)
 
-            print('Processing {}'.format(year))
+        engine = RolloutEngine(exchanges_by_timestep[BASE_YEAR],
+            dwellings_by_timestep, parameters, technology, policy)
 
-            lads = dwelling_density_by_lad(lads, dwellings, year)
+        path = os.path.join(RESULTS_DIRECTORY, 'fixed_outputs')
 
-            #THIS DOES NOT CORRECTLY ALLOCATE - NEED TO GENERATE EX TO LAD LUT
-            exchanges = estimate_dwelling_density(exchanges, lads)
+        with ResultSink(path, technology, policy, aggregator) as results:
 
-            # Simulate first year
-            if year == BASE_YEAR:
-                system = NetworkManager(exchanges, parameters)
+            for year in TIMESTEPS:
 
-            # actually decide which interventions to build
-            built_interventions = decide_interventions(system, technology, policy, parameters)
+                print('Processing {}'.format(year))
 
-            # give the interventions to the system model
-            system.upgrade(built_interventions)
+                # apply dwelling growth, decide which interventions to build
+                # and give them to the system model
+                delta = engine.step(year)
+                built_interventions = delta['interventions']
 
-            # write out the decisions
-            path = os.path.join(RESULTS_DIRECTORY, 'fixed_outputs')
-            write_decisions(built_interventions, path, year, technology, policy)
+                # write out the decisions
+                results.write_decisions(built_interventions, year)
 
-            write_spend(built_interventions, path, year, technology, policy)
+                results.write_spend(built_interventions, year)
 
-            write_exchange_results(system, path, year, technology, policy)
+                results.write_exchange_results(engine.system, year)
 
-            # # write_lad_results(system, exchange_to_lad_lut, path, year, technology, policy, roll_out)
+                results.write_lad_results(engine.system, year)
 
-            print('Completed {} for {}, {} and {}'.format(year, scenario, technology, policy))
+                print('Completed {} for {}, {} and {}'.format(year, scenario, technology, policy))
@@ -0,0 +1,173 @@
+"""
+Benchmark the intervention planning modes on a synthetic system
+- compare the sequential (densest area first) planner with the
+  priority (largest deficit reduction per GBP first) planner
+- report runtime, spend and remaining capacity deficit for each strategy
+
+"""
+import random
+import time
+
+from digital_comms.mobile_network.model import (
+    NetworkManager, CapacityLookupTable
+    )
+from digital_comms.mobile_network.interventions import (
+    decide_interventions, AVAILABLE_STRATEGY_INTERVENTIONS
+    )
+
+NUMBER_OF_LADS = 20
+SECTORS_PER_LAD = 50
+TIMESTEP = 2020
+ANNUAL_BUDGET = 50 * 10 ** 6
+SERVICE_OBLIGATION_CAPACITY = 0
+
+SIMULATION_PARAMETERS = {
+    'market_share': 0.30,
+    'annual_budget': ANNUAL_BUDGET,
+    'service_obligation_capacity': SERVICE_OBLIGATION_CAPACITY,
+    'busy_hour_traffic_percentage': 20,
+    'coverage_threshold': 2,
+    'penetration': 80,
+    'channel_bandwidth_700': '10',
+    'channel_bandwidth_800': '10',
+    'channel_bandwidth_1800': '10',
+    'channel_bandwidth_2600': '10',
+    'channel_bandwidth_3500': '40',
+    'channel_bandwidth_26000': '100',
+    'macro_sectors': 3,
+    'small-cell_sectors': 1,
+    'mast_height': 30,
+}
+
+CLUTTER_LOOKUP = [
+    (0.0, 'rural'),
+    (782.0, 'suburban'),
+    (7959.0, 'urban'),
+]
+
+
+def generate_capacity_lookup_table():
+    """
+    Build capacity curves for every environment and frequency used by the
+    model, with capacity rising with site density and frequency bandwidth.
+
+    """
+    bands = [
+        ('700', '10', '5G', 2),
+        ('800', '10', '4G', 2),
+        ('1800', '10', '4G', 2),
+        ('2600', '10', '4G', 3),
+        ('3500', '40', '5G', 10),
+        ('26000', '100', '5G', 20),
+    ]
+    environments = [
+        ('rural', 1),
+        ('suburban', 1.5),
+        ('urban', 2),
+    ]
+
+    capacity_lookup_table = {}
+    for environment, scale in environments:
+        for frequency, bandwidth, generation, capacity in bands:
+            capacity_lookup_table[(environment, frequency, bandwidth, generation)] = [
+                (density, density * capacity * scale)
+                for density in [0, 0.5, 1, 2, 4, 8]
+            ]
+
+    capacity_lookup_table[('small_cells', '3700', '25', '5G')] = [
+        (density, density * 40) for density in [0, 5, 10, 20, 40, 80]
+    ]
+
+    return CapacityLookupTable(capacity_lookup_table)
+
+
+def generate_system(seed):
+    """
+    Build a synthetic system of postcode sectors with a mix of 3G and
+    LTE macrocell sites.
+
+    """
+    rng = random.Random(seed)
+
+    lads = []
+    pcd_sectors = []
+    assets = []
+
+    for lad_id in range(NUMBER_OF_LADS):
+        lads.append({
+            'id': lad_id,
+            'name': 'lad_{}'.format(lad_id),
+        })
+
+        for sector in range(SECTORS_PER_LAD):
+            pcd_sector_id = 'S{}_{}'.format(lad_id, sector)
+            area = rng.uniform(0.5, 20)
+            population = int(area * 10 ** rng.uniform(1, 4.3))
+
+            pcd_sectors.append({
+                'id': pcd_sector_id,
+                'lad_id': lad_id,
+                'population': population,
+                'area_km2': area,
+                'user_throughput': rng.choice([2, 5, 10]),
+            })
+
+            for site in range(rng.randint(1, 6)):
+                technology = rng.choice(['3G', 'LTE'])
+                assets.append({
+                    'pcd_sector': pcd_sector_id,
+                    'site_ngr': '{}_site_{}'.format(pcd_sector_id, site),
+                    'technology': technology,
+                    'type': 'macrocell_site',
+                    'frequency': ['800', '2600'] if technology == 'LTE' else ['1800'],
+                    'bandwidth': '2x10MHz',
+                    'build_date': 2017,
+                })
+
+    return lads, pcd_sectors, assets
+
+
+def remaining_deficit(system, built_interventions):
+    """
+    Sum the capacity deficit (Mbps) left across all postcode sectors once
+    the built interventions are in place.
+
+    """
+    built_by_pcd_sector = {}
+    for asset in built_interventions:
+        built_by_pcd_sector.setdefault(asset['pcd_sector'], []).append(asset)
+
+    deficit = 0
+    for pcd_sector in system.postcode_sectors.values():
+        capacity = pcd_sector.capacity_with(
+            built_by_pcd_sector.get(pcd_sector.id, []))
+        deficit += max(pcd_sector.demand - capacity, 0) * pcd_sector.area
+
+    return deficit
+
+
+if __name__ == '__main__':
+
+    print('Generating synthetic system')
+    lads, pcd_sectors, assets = generate_system(seed=42)
+    capacity_lookup_table = generate_capacity_lookup_table()
+
+    system = NetworkManager(lads, pcd_sectors, assets, capacity_lookup_table,
+        CLUTTER_LOOKUP, SIMULATION_PARAMETERS)
+    print('{} postcode sectors, {} assets, initial deficit {:.0f} Mbps'.format(
+        len(system.postcode_sectors), len(assets), remaining_deficit(system, [])))
+
+    print('{:<25} {:<11} {:>9} {:>14} {:>14}'.format(
+        'strategy', 'mode', 'time (s)', 'spend (GBP)', 'deficit (Mbps)'))
+
+    for strategy in AVAILABLE_STRATEGY_INTERVENTIONS:
+        for mode in ['sequential', 'priority']:
+            start = time.time()
+            built, budget, spend = decide_interventions(strategy, ANNUAL_BUDGET,
+                SERVICE_OBLIGATION_CAPACITY, system, TIMESTEP,
+                SIMULATION_PARAMETERS, mode=mode)
+            elapsed = time.time() - start
+
+            print('{:<25} {:<11} {:>9.3f} {:>14.0f} {:>14.0f}'.format(
+                strategy, mode, elapsed, ANNUAL_BUDGET - budget,
+                remaining_deficit(system, built)))
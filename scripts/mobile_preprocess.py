@@ -2,15 +2,19 @@ import os
 import sys
 import configparser
 import csv
-import fiona
+import math
 import time
 
+import numpy as np
 from shapely.geometry import shape, Point, LineString, mapping
-from shapely.ops import  cascaded_union
+from shapely.ops import unary_union
 
 from rtree import index
 
-from collections import OrderedDict
+from digital_comms.feature_cache import read_features
+from digital_comms.geometry_cache import GeometryCache
+
+from collections import OrderedDict, defaultdict
 
 CONFIG = configparser.ConfigParser()
 CONFIG.read(os.path.join(os.path.dirname(__file__), 'script_config.ini'))
@@ -22,6 +26,7 @@ BASE_PATH = CONFIG['file_locations']['base_path']
 
 DATA_RAW = os.path.join(BASE_PATH, '..', 'data_raw')
 DATA_INTERMEDIATE = os.path.join(BASE_PATH, 'intermediate')
+FEATURE_CACHE = os.path.join(DATA_INTERMEDIATE, 'feature_cache.sqlite')
 
 #####################################
 # READ MAIN DATA
@@ -36,8 +41,7 @@ def read_lads():
         DATA_RAW, 'shapes', 'lad_uk_2016-12.shp'
         )
 
-    with fiona.open(lad_shapes, 'r') as lad_shape:
-        return [lad for lad in lad_shape if
+    return [lad for lad in read_features(lad_shapes, FEATURE_CACHE) if
         not lad['properties']['name'].startswith((
             'E06000053',
             'S12000027',
@@ -69,35 +73,36 @@ def read_postcode_sectors(path):
     Read all postcode sector shapes.
 
     """
-    with fiona.open(path, 'r') as pcd_sector_shapes:
-        return [pcd for pcd in pcd_sector_shapes]
+    return read_features(path, FEATURE_CACHE)
 
 
-def add_lad_to_postcode_sector(postcode_sectors, lads):
+def add_lad_to_postcode_sector(postcode_sectors, lads, geometry_cache=None):
     """
     Add the LAD indicator(s) to the relevant postcode sector.
 
+    Shapes are taken from ``geometry_cache``, which can be shared with
+    other overlay steps.
+
     """
+    if geometry_cache is None:
+        geometry_cache = GeometryCache()
+
     final_postcode_sectors = []
 
-    idx = index.Index(
-        (i, shape(lad['geometry']).bounds, lad)
-        for i, lad in enumerate(lads)
-    )
+    idx = geometry_cache.index(lads)
 
     for postcode_sector in postcode_sectors:
-        for n in idx.intersection(
-            (shape(postcode_sector['geometry']).bounds), objects=True):
-            postcode_sector_centroid = shape(postcode_sector['geometry']).centroid
-            postcode_sector_shape = shape(postcode_sector['geometry'])
-            lad_shape = shape(n.object['geometry'])
-            if postcode_sector_centroid.intersects(lad_shape):
+        postcode_sector_shape = geometry_cache.shape(postcode_sector)
+        postcode_sector_centroid = postcode_sector_shape.centroid
+        for n in sorted(idx.intersection(geometry_cache.bounds(postcode_sector))):
+            lad = lads[n]
+            if geometry_cache.prepared(lad).intersects(postcode_sector_centroid):
                 final_postcode_sectors.append({
                     'type': postcode_sector['type'],
                     'geometry': postcode_sector['geometry'],
                     'properties':{
                         'id': postcode_sector['properties']['RMSect'],
-                        'lad': n.object['properties']['name'],
+                        'lad': lad['properties']['name'],
                         'area': postcode_sector_shape.area,
                         },
                     })
@@ -156,24 +161,29 @@ def add_weights_to_postcode_sector(postcode_sectors, weights):
     """
     Add weights to postcode sector
 
+    Weights are indexed by postcode sector id, so each sector is joined to
+    its weights in one lookup.
+
     """
+    weights_by_id = defaultdict(list)
+    for weight in weights:
+        weights_by_id[weight['id'].replace(' ', '')].append(weight)
+
     output = []
 
     for postcode_sector in postcode_sectors:
         pcd_id = postcode_sector['properties']['id'].replace(' ', '')
-        for weight in weights:
-            weight_id = weight['id'].replace(' ', '')
-            if pcd_id == weight_id:
-                output.append({
-                    'type': postcode_sector['type'],
-                    'geometry': postcode_sector['geometry'],
-                    'properties': {
-                        'id': pcd_id,
-                        'lad': postcode_sector['properties']['lad'],
-                        'population_weight': weight['population'],
-                        'area_km2': (postcode_sector['properties']['area'] / 1e6),
-                    }
-                })
+        for weight in weights_by_id.get(pcd_id, []):
+            output.append({
+                'type': postcode_sector['type'],
+                'geometry': postcode_sector['geometry'],
+                'properties': {
+                    'id': pcd_id,
+                    'lad': postcode_sector['properties']['lad'],
+                    'population_weight': weight['population'],
+                    'area_km2': (postcode_sector['properties']['area'] / 1e6),
+                }
+            })
 
 
     return output
@@ -181,51 +191,44 @@ def add_weights_to_postcode_sector(postcode_sectors, weights):
 
 def calculate_lad_population(postcode_sectors):
     """
+    Add the population of its LAD, and its share of it, to each postcode
+    sector, summing LAD populations in one pass over the sectors.
 
     """
-    lad_ids = set()
+    lad_population = {}
 
     for pcd_sector in postcode_sectors:
-        lad_ids.add(pcd_sector['properties']['lad'])
-
-    lad_population = []
-
-    for lad_id in lad_ids:
-        population = 0
-        for pcd_sector in postcode_sectors:
-            if pcd_sector['properties']['lad'] == lad_id:
-                population += pcd_sector['properties']['population_weight']
-        lad_population.append({
-            'lad': lad_id,
-            'population': population,
-        })
+        lad_id = pcd_sector['properties']['lad']
+        lad_population[lad_id] = (
+            lad_population.get(lad_id, 0) +
+            pcd_sector['properties']['population_weight']
+        )
 
     output = []
 
     for pcd_sector in postcode_sectors:
-        for lad in lad_population:
-            if pcd_sector['properties']['lad'] == lad['lad']:
-
-                weight = (
-                    pcd_sector['properties']['population_weight'] /
-                    lad['population']
-                )
-
-                output.append({
-                    'type': pcd_sector['type'],
-                    'geometry': pcd_sector['geometry'],
-                    'properties': {
-                        'id': pcd_sector['properties']['id'],
-                        'lad': pcd_sector['properties']['lad'],
-                        'population': lad['population'] * weight,
-                        'weight': weight,
-                        'area_km2': pcd_sector['properties']['area_km2'],
-                        'pop_density_km2': (
-                            weight /
-                            (pcd_sector['properties']['area_km2'] / 1e6)
-                            ),
-                    },
-                })
+        population = lad_population[pcd_sector['properties']['lad']]
+
+        weight = (
+            pcd_sector['properties']['population_weight'] /
+            population
+        )
+
+        output.append({
+            'type': pcd_sector['type'],
+            'geometry': pcd_sector['geometry'],
+            'properties': {
+                'id': pcd_sector['properties']['id'],
+                'lad': pcd_sector['properties']['lad'],
+                'population': population * weight,
+                'weight': weight,
+                'area_km2': pcd_sector['properties']['area_km2'],
+                'pop_density_km2': (
+                    weight /
+                    (pcd_sector['properties']['area_km2'] / 1e6)
+                    ),
+            },
+        })
 
     return output
 
@@ -246,33 +249,105 @@ def get_forecast(filename):
             }
 
 
-def disaggregate(forecast, postcode_sectors):
+def index_sector_weights(postcode_sectors):
     """
+    Hold postcode sector ids and LAD population weights as columns, with
+    the sectors of each LAD in one contiguous slice.
+
+    Returns
+    -------
+    dict
+        * ids: postcode sector ids, grouped by LAD
+        * weights: population weight of each sector within its LAD
+        * lads: (start, stop) slice of the sectors of each LAD
 
     """
-    output = []
+    sectors_by_lad = OrderedDict()
+    for postcode_sector in postcode_sectors:
+        sectors_by_lad.setdefault(
+            postcode_sector['properties']['lad'], []).append(postcode_sector)
 
-    seen_lads = set()
+    ids = []
+    weights = []
+    lads = {}
+    for lad_id, sectors in sectors_by_lad.items():
+        lads[lad_id] = (len(ids), len(ids) + len(sectors))
+        for postcode_sector in sectors:
+            ids.append(postcode_sector['properties']['id'])
+            weights.append(float(postcode_sector['properties']['weight']))
 
-    for line in forecast:
-        forecast_lad_id = line['lad']
-        for postcode_sector in postcode_sectors:
-            pcd_sector_lad_id = postcode_sector['properties']['lad']
-            if forecast_lad_id == pcd_sector_lad_id:
-                # print(postcode_sector)
-                seen_lads.add(line['lad'])
-                seen_lads.add(postcode_sector['properties']['lad'])
-                output.append({
-                    'year': line['year'],
-                    'lad': line['lad'],
-                    'id': postcode_sector['properties']['id'],
-                    'population': int(
-                        float(line['population']) *
-                        float(postcode_sector['properties']['weight'])
-                        )
-                })
+    return {
+        'ids': np.array(ids, dtype=object),
+        'weights': np.array(weights, dtype=float),
+        'lads': lads,
+    }
 
-    return output
+
+def disaggregate(forecast, sector_weights):
+    """
+    Disaggregate LAD forecasts to postcode sectors by population weight,
+    broadcasting each forecast line to the sectors of its LAD at once.
+
+    Parameters
+    ----------
+    forecast : list_of_dicts
+        Forecast lines, as given by get_forecast.
+    sector_weights : dict
+        Postcode sector weights, as given by index_sector_weights.
+
+    Returns
+    -------
+    dict
+        Columns of year, lad, id and population, one row per forecast line
+        and postcode sector in its LAD.
+
+    """
+    no_sectors = (0, 0)
+    slices = np.array(
+        [sector_weights['lads'].get(line['lad'], no_sectors) for line in forecast],
+        dtype=np.int64).reshape(-1, 2)
+    starts = slices[:, 0]
+    counts = slices[:, 1] - starts
+
+    # the forecast line and sector of each output row
+    lines = np.repeat(np.arange(len(forecast)), counts)
+    offsets = np.cumsum(counts) - counts
+    sectors = np.repeat(starts - offsets, counts) + np.arange(counts.sum())
+
+    years = np.array([line['year'] for line in forecast], dtype=object)
+    lad_ids = np.array([line['lad'] for line in forecast], dtype=object)
+    population = np.array(
+        [float(line['population']) for line in forecast], dtype=float)
+
+    return {
+        'year': years[lines],
+        'lad': lad_ids[lines],
+        'id': sector_weights['ids'][sectors],
+        'population': np.trunc(
+            population[lines] * sector_weights['weights'][sectors]
+            ).astype(np.int64),
+    }
+
+
+def write_disaggregated_forecast(forecast, sector_weights, directory, filename,
+                                 chunk_size=10000):
+    """
+    Disaggregate a LAD ``forecast`` to postcode sectors and write it to
+    a CSV file, ``chunk_size`` forecast lines at a time.
+
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    fieldnames = ('year', 'lad', 'id', 'population')
+
+    with open(os.path.join(directory, filename), 'w') as csv_file:
+        writer = csv.writer(csv_file, lineterminator = '\n')
+        writer.writerow(fieldnames)
+
+        for start in range(0, len(forecast), chunk_size):
+            columns = disaggregate(
+                forecast[start:start + chunk_size], sector_weights)
+            writer.writerows(zip(*[columns[name].tolist() for name in fieldnames]))
 
 
 def generate_scenario_variants(postcode_sectors, directory):
@@ -295,30 +370,32 @@ def generate_scenario_variants(postcode_sectors, directory):
             'arc_population__4-expansion23.csv',
         ]
 
+        sector_weights = index_sector_weights(postcode_sectors)
+
         print('loaded luts')
         for scenario_file in files:
 
             print('running {}'.format(scenario_file))
-            forecast = get_forecast(scenario_file)
-
-            disaggregated_forecast = disaggregate(forecast, postcode_sectors)
+            forecast = list(get_forecast(scenario_file))
 
             filename = os.path.join('pcd_' + scenario_file)
 
             print('writing {}'.format(filename))
-            csv_writer(disaggregated_forecast, directory, filename)
+            write_disaggregated_forecast(
+                forecast, sector_weights, directory, filename)
 
 
 def allocate_4G_coverage(postcode_sectors, lad_lut):
 
     output = []
 
+    postcode_sectors_by_lad = group_postcode_sectors_by_lad(postcode_sectors)
+
     for lad_id in lad_lut:
 
-        sectors_in_lad = get_postcode_sectors_in_lad(postcode_sectors, lad_id)
+        sectors_in_lad = postcode_sectors_by_lad.get(lad_id, [])
 
-        total_area = sum([s['properties']['area_km2'] for s in \
-            get_postcode_sectors_in_lad(postcode_sectors, lad_id)])
+        total_area = sum([s['properties']['area_km2'] for s in sectors_in_lad])
 
         coverage_data = load_coverage_data(lad_id)
 
@@ -353,12 +430,19 @@ def allocate_4G_coverage(postcode_sectors, lad_lut):
     return output
 
 
-def get_postcode_sectors_in_lad(postcode_sectors, lad_id):
+def group_postcode_sectors_by_lad(postcode_sectors):
+    """
+    Group postcode sectors with a population density by LAD id, in one pass.
+
+    """
+    postcode_sectors_by_lad = defaultdict(list)
 
     for postcode_sector in postcode_sectors:
-        if postcode_sector['properties']['lad'] == lad_id:
-            if isinstance(postcode_sector['properties']['pop_density_km2'], float):
-                yield postcode_sector
+        if isinstance(postcode_sector['properties']['pop_density_km2'], float):
+            postcode_sectors_by_lad[postcode_sector['properties']['lad']].append(
+                postcode_sector)
+
+    return postcode_sectors_by_lad
 
 
 def import_sitefinder_data(path):
@@ -417,70 +501,111 @@ def import_sitefinder_data(path):
     return asset_data
 
 
-def process_asset_data(data):
+def process_asset_data(data, distance=100):
     """
-    Add buffer to each site, dissolve overlaps and take centroid.
+    Merge sites within ``distance`` metres of one another (i.e. whose 50 m
+    buffers overlap) and take the centroid of each group.
 
-    """
-    buffered_assets = []
+    Sites are hashed to a grid of ``distance`` sized cells, so only sites
+    in neighbouring cells are compared, and groups are joined transitively
+    with union-find. A group of several sites is placed at the centroid of
+    the union of their buffers, a single site where it stands, and each
+    group is named after its first site.
 
+    """
+    points = []
     for asset in data:
         asset_geom = shape(asset['geometry'])
-        buffered_geom = asset_geom.buffer(50)
-
-        asset['buffer'] = buffered_geom
-        buffered_assets.append(asset)
+        points.append((asset_geom.x, asset_geom.y))
 
     output = []
-    assets_seen = set()
-
-    for asset in buffered_assets:
-        if asset['properties']['Opref'] in assets_seen:
-            continue
-        assets_seen.add(asset['properties']['Opref'])
-        touching_assets = []
-        for other_asset in buffered_assets:
-            if asset['buffer'].intersects(other_asset['buffer']):
-                touching_assets.append(other_asset)
-                assets_seen.add(other_asset['properties']['Opref'])
-
-        dissolved_shape = cascaded_union([a['buffer'] for a in touching_assets])
-        final_centroid = dissolved_shape.centroid
+
+    for cluster in _cluster_points(points, distance):
+        if len(cluster) == 1:
+            x, y = points[cluster[0]]
+        else:
+            centroid = unary_union(
+                [Point(points[i]).buffer(distance / 2) for i in cluster]).centroid
+            x, y = centroid.x, centroid.y
         output.append({
             'type': "Feature",
             'geometry': {
                 "type": "Point",
-                "coordinates": [final_centroid.coords[0][0], final_centroid.coords[0][1]],
+                "coordinates": [x, y],
             },
             'properties':{
-                'name': asset['properties']['name'],
+                'name': data[cluster[0]]['properties']['name'],
             }
         })
 
     return output
 
 
-def add_coverage_to_sites(sitefinder_data, postcode_sectors):
+def _cluster_points(points, distance):
+    """
+    Group points lying within ``distance`` of each other, transitively.
+
+    Returns the indices of the points in each group, with groups ordered by
+    their first point.
+
+    """
+    parents = list(range(len(points)))
+
+    def find(i):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    grid = defaultdict(list)
+    for i, (x, y) in enumerate(points):
+        cell_x, cell_y = int(math.floor(x / distance)), int(math.floor(y / distance))
+
+        for neighbour_x in (cell_x - 1, cell_x, cell_x + 1):
+            for neighbour_y in (cell_y - 1, cell_y, cell_y + 1):
+                for j in grid.get((neighbour_x, neighbour_y), ()):
+                    other_x, other_y = points[j]
+                    if (x - other_x) ** 2 + (y - other_y) ** 2 <= distance ** 2:
+                        root_i, root_j = find(i), find(j)
+                        if root_i != root_j:
+                            # the earlier point stays the root of a group
+                            parents[max(root_i, root_j)] = min(root_i, root_j)
+
+        grid[cell_x, cell_y].append(i)
+
+    clusters = OrderedDict()
+    for i in range(len(points)):
+        clusters.setdefault(find(i), []).append(i)
+
+    return list(clusters.values())
+
+
+def add_coverage_to_sites(sitefinder_data, postcode_sectors, geometry_cache=None):
+    """
+    Add the postcode sector and its 4G coverage to each site within it.
+
+    Shapes are taken from ``geometry_cache``, which can be shared with
+    other overlay steps.
+
+    """
+    if geometry_cache is None:
+        geometry_cache = GeometryCache()
 
     final_sites = []
 
-    idx = index.Index(
-        (i, shape(site['geometry']).bounds, site)
-        for i, site in enumerate(sitefinder_data)
-    )
+    idx = geometry_cache.index(sitefinder_data)
 
     for postcode_sector in postcode_sectors:
-        for n in idx.intersection(
-            (shape(postcode_sector['geometry']).bounds), objects=True):
-            postcode_sector_shape = shape(postcode_sector['geometry'])
-            site_shape = shape(n.object['geometry'])
-            if postcode_sector_shape.intersects(site_shape):
+        postcode_sector_shape = geometry_cache.prepared(postcode_sector)
+        for n in sorted(idx.intersection(geometry_cache.bounds(postcode_sector))):
+            site = sitefinder_data[n]
+            if postcode_sector_shape.intersects(geometry_cache.shape(site)):
                 final_sites.append({
                     'type': 'Feature',
-                    'geometry': n.object['geometry'],
+                    'geometry': site['geometry'],
                     'properties':{
                         'id': postcode_sector['properties']['id'],
-                        'name': n.object['properties']['name'],
+                        'name': site['properties']['name'],
                         'lte_4G': postcode_sector['properties']['lte']
                         }
                     })
@@ -523,9 +648,8 @@ def read_exchange_areas():
         DATA_RAW, 'exchanges', '_exchange_areas_fixed.shp'
         )
 
-    with fiona.open(path, 'r') as source:
-        for area in source:
-            yield area
+    for area in read_features(path, FEATURE_CACHE):
+        yield area
 
 
 def return_object_coordinates(object):
@@ -748,8 +872,12 @@ if __name__ == "__main__":
     path = os.path.join(DATA_RAW, 'shapes', 'PostalSector.shp')
     postcode_sectors = read_postcode_sectors(path)
 
+    # shapes of postcode sectors are shared by the overlay steps below
+    geometry_cache = GeometryCache()
+
     print('Adding lad IDs to postcode sectors... might take a few minutes...')
-    postcode_sectors = add_lad_to_postcode_sector(postcode_sectors, lads)
+    postcode_sectors = add_lad_to_postcode_sector(
+        postcode_sectors, lads, geometry_cache)
 
     print('Loading in population weights' )
     weights = load_in_weights()
@@ -774,7 +902,8 @@ if __name__ == "__main__":
     sitefinder_data = process_asset_data(sitefinder_data)
 
     print('Allocate 4G coverage to sites from postcode sectors')
-    processed_sites = add_coverage_to_sites(sitefinder_data, postcode_sectors)
+    processed_sites = add_coverage_to_sites(
+        sitefinder_data, postcode_sectors, geometry_cache)
 
     print('Reading exchanges')
     exchanges = read_exchanges()
@@ -4,18 +4,21 @@ Model runner to use in place of smif for standalone modelruns
 - make rule-based intervention decisions at each timestep
 
 """
+import argparse
 import configparser
 import csv
 import itertools
+import multiprocessing
 import os
 import pprint
 import glob
 import pprint
+import queue
 
-import fiona
 from collections import defaultdict
 
-from digital_comms.mobile_network.model import NetworkManager
+from digital_comms.feature_cache import read_features
+from digital_comms.mobile_network.model import NetworkManager, CapacityLookupTable
 from digital_comms.mobile_network.interventions import decide_interventions
 
 CONFIG = configparser.ConfigParser()
@@ -25,6 +28,13 @@ BASE_PATH = CONFIG['file_locations']['base_path']
 INTERMEDIATE = os.path.join(BASE_PATH, 'intermediate')
 SHAPES_INPUT_PATH = os.path.join(BASE_PATH, 'raw', 'd_shapes')
 SYSTEM_OUTPUT_PATH = os.path.join(BASE_PATH, '..','results')
+FEATURE_CACHE = os.path.join(INTERMEDIATE, 'feature_cache.sqlite')
+
+# Set at module level so that scenario workers see them too
+BASE_YEAR = 2020
+END_YEAR = 2030
+TIMESTEP_INCREMENT = 1
+TIMESTEPS = range(BASE_YEAR, END_YEAR + 1, TIMESTEP_INCREMENT)
 
 
 def load_local_authority_districts():
@@ -38,27 +48,26 @@ def load_local_authority_districts():
         SHAPES_INPUT_PATH, 'lad_uk_2016-12', 'lad_uk_2016-12.shp'
         )
 
-    with fiona.open(lad_shapes, 'r') as lad_shape:
-        for lad in lad_shape:
-            if not lad['properties']['name'].startswith((
-                'E06000053',
-                'S12000027',
-                'N09000001',
-                'N09000002',
-                'N09000003',
-                'N09000004',
-                'N09000005',
-                'N09000006',
-                'N09000007',
-                'N09000008',
-                'N09000009',
-                'N09000010',
-                'N09000011',
-                )):
-                lads.append({
-                    "id": lad['properties']['name'],
-                    "name": lad['properties']['desc'],
-                })
+    for lad in read_features(lad_shapes, FEATURE_CACHE):
+        if not lad['properties']['name'].startswith((
+            'E06000053',
+            'S12000027',
+            'N09000001',
+            'N09000002',
+            'N09000003',
+            'N09000004',
+            'N09000005',
+            'N09000006',
+            'N09000007',
+            'N09000008',
+            'N09000009',
+            'N09000010',
+            'N09000011',
+            )):
+            lads.append({
+                "id": lad['properties']['name'],
+                "name": lad['properties']['desc'],
+            })
     return lads
 
 
@@ -238,10 +247,7 @@ def load_capacity_lookup_table():
                         density, capacity
                     ))
 
-            for key, value_list in capacity_lookup_table.items():
-                value_list.sort(key=lambda tup: tup[0])
-
-    return capacity_lookup_table
+    return CapacityLookupTable(capacity_lookup_table)
 
 
 def load_clutter_geotype_lookup_table():
@@ -272,10 +278,11 @@ def write_lad_results(network_manager, folder, year, pop_scenario,
     """
     Write LAD results to .csv file.
 
+    Returns the population written, for progress reporting.
+
     """
     suffix = _get_suffix(pop_scenario, throughput_scenario, intervention_strategy)
-    if not os.path.exists(folder):
-        os.mkdir(folder)
+    os.makedirs(folder, exist_ok=True)
     metrics_filename = os.path.join(folder, 'metrics_{}.csv'.format(suffix))
 
     if year == BASE_YEAR:
@@ -308,10 +315,10 @@ def write_lad_results(network_manager, folder, year, pop_scenario,
 
             population += lad.population
 
-    print('population written is {}'.format(round(population/1e6,1)))
-
     metrics_file.close()
 
+    return population
+
 
 def write_pcd_results(network_manager, folder, year, pop_scenario,
     throughput_scenario, intervention_strategy, cost_by_pcd, lad_areas):
@@ -320,8 +327,7 @@ def write_pcd_results(network_manager, folder, year, pop_scenario,
 
     """
     suffix = _get_suffix(pop_scenario, throughput_scenario, intervention_strategy)
-    if not os.path.exists(folder):
-        os.mkdir(folder)
+    os.makedirs(folder, exist_ok=True)
     metrics_filename = os.path.join(folder,
         'pcd_metrics_{}.csv'.format(suffix))
 
@@ -369,9 +375,7 @@ def write_decisions(decisions, folder, year, pop_scenario,
     """
     suffix = _get_suffix(pop_scenario, throughput_scenario, intervention_strategy)
     # folder = os.path.join(BASE_PATH, '..', 'results')
-    if not os.path.exists(folder):
-        os.mkdir(folder)
-        # os.mkdir(os.path.join(folder, 'mobile_model_1.0'))
+    os.makedirs(folder, exist_ok=True)
     decisions_filename =  os.path.join(folder, 'decisions_{}.csv'.format(suffix))
 
     if year == BASE_YEAR:
@@ -386,6 +390,8 @@ def write_decisions(decisions, folder, year, pop_scenario,
 
     for intervention in decisions:
 
+        intervention = intervention.to_dict()
+
         pcd_sector = intervention['pcd_sector']
         site_ngr = intervention['site_ngr']
         build_date = intervention['build_date']
@@ -408,8 +414,7 @@ def write_spend(spend, folder, year, pop_scenario,
 
     """
     suffix = _get_suffix(pop_scenario, throughput_scenario, intervention_strategy)
-    if not os.path.exists(folder):
-        os.mkdir(folder)
+    os.makedirs(folder, exist_ok=True)
     spend_filename = os.path.join(folder, 'spend_{}.csv'.format(suffix))
 
     if year == BASE_YEAR:
@@ -442,6 +447,198 @@ def _get_suffix(pop_scenario, throughput_scenario, intervention_strategy):
     return suffix
 
 
+def run_scenario(scenario):
+    """
+    Run one population scenario, throughput scenario and intervention
+    strategy combination over all timesteps, writing its results files.
+
+    Reads the inputs shared by all scenarios from _SHARED_INPUTS, and
+    reports each year through _report_year.
+
+    """
+    pop_scenario, throughput_scenario, intervention_strategy = scenario
+
+    lads = _SHARED_INPUTS['lads']
+    population_by_scenario_year_pcd = \
+        _SHARED_INPUTS['population_by_scenario_year_pcd']
+    user_throughput_by_scenario_year = \
+        _SHARED_INPUTS['user_throughput_by_scenario_year']
+    capacity_lookup_table = _SHARED_INPUTS['capacity_lookup_table']
+    clutter_lookup = _SHARED_INPUTS['clutter_lookup']
+    simulation_parameters = _SHARED_INPUTS['simulation_parameters']
+    folder = _SHARED_INPUTS['folder']
+    lad_areas = _SHARED_INPUTS['lad_areas']
+
+    # postcode sector data is updated each year, so each scenario
+    # works on its own copy
+    pcd_sectors = [
+        dict(pcd_sector) for pcd_sector in _SHARED_INPUTS['pcd_sectors']
+    ]
+    assets = _SHARED_INPUTS['initial_system'][:]
+
+    for year in TIMESTEPS:
+
+        for pcd_sector in pcd_sectors:
+            try:
+                pcd_sector_id = pcd_sector["id"]
+                pcd_sector["population"] = (
+                    population_by_scenario_year_pcd \
+                        [pop_scenario][year][pcd_sector_id])
+                pcd_sector["user_throughput"] = (
+                    user_throughput_by_scenario_year \
+                        [throughput_scenario][year])
+            except:
+                pass
+
+        budget = simulation_parameters['annual_budget']
+        service_obligation_capacity = (
+            simulation_parameters['service_obligation_capacity'])
+
+        if year == BASE_YEAR:
+            system = NetworkManager(lads, pcd_sectors, assets,
+                capacity_lookup_table, clutter_lookup,
+                simulation_parameters)
+
+        interventions_built, budget, spend = decide_interventions(
+            intervention_strategy, budget, service_obligation_capacity,
+            system, year, simulation_parameters)
+
+        system.apply_interventions(interventions_built)
+        system.update_demand(pcd_sectors)
+
+        cost_by_lad = defaultdict(int)
+        cost_by_pcd = defaultdict(int)
+        for pcd, lad, item, cost in spend:
+            cost_by_lad[lad] += cost
+            cost_by_pcd[pcd] += cost
+
+        population = write_lad_results(system, folder, year, pop_scenario,
+            throughput_scenario, intervention_strategy, cost_by_lad, lad_areas)
+        write_pcd_results(system, folder, year, pop_scenario, throughput_scenario,
+            intervention_strategy, cost_by_pcd, lad_areas)
+        # write_decisions(interventions_built, folder, year, pop_scenario,
+        #     throughput_scenario, intervention_strategy, lad_areas)
+        write_spend(spend, folder, year, pop_scenario, throughput_scenario,
+            intervention_strategy, lad_areas)
+
+        _report_year(scenario, year, population)
+
+    return scenario
+
+
+def _init_worker(shared_inputs, progress_queue=None):
+    """
+    Hold the inputs shared by all scenarios in each worker process, so they
+    are passed to a worker once rather than with every scenario, and the
+    queue through which it reports progress.
+
+    """
+    global _SHARED_INPUTS, _PROGRESS_QUEUE
+    _SHARED_INPUTS = shared_inputs
+    _PROGRESS_QUEUE = progress_queue
+
+
+def _report_year(scenario, year, population):
+    """
+    Report a year of a scenario as done, leaving worker processes to pass
+    it to the parent, so that only the parent prints progress.
+
+    """
+    if _PROGRESS_QUEUE is None:
+        _print_year(scenario, year, population)
+    else:
+        _PROGRESS_QUEUE.put((scenario, year, population))
+
+
+def run_scenarios(scenarios, shared_inputs, workers):
+    """
+    Run scenario combinations over a pool of worker processes.
+
+    Each scenario writes its own results files, named by _get_suffix, so
+    workers never write to the same file. Workers send their progress to
+    this process, which prints it.
+
+    """
+    os.makedirs(shared_inputs['folder'], exist_ok=True)
+
+    if workers == 1:
+        _init_worker(shared_inputs)
+        completed = map(run_scenario, scenarios)
+        _report_progress(completed, len(scenarios))
+        return
+
+    progress_queue = multiprocessing.Queue()
+
+    with multiprocessing.Pool(workers, initializer=_init_worker,
+            initargs=(shared_inputs, progress_queue)) as pool:
+        completed = pool.imap_unordered(run_scenario, scenarios)
+        _report_progress(completed, len(scenarios), progress_queue)
+
+
+def _report_progress(completed, total, progress_queue=None):
+    """
+    Print each completed scenario and, given the ``progress_queue`` of the
+    workers running them, each year they report as it arrives.
+
+    A scenario's years are all printed before its completion.
+
+    """
+    finished = set()
+
+    def print_queued_years(block_until=None):
+        while True:
+            try:
+                event = progress_queue.get(block=block_until is not None)
+            except queue.Empty:
+                return
+            _print_year(*event)
+            if event[1] == TIMESTEPS[-1]:
+                finished.add(event[0])
+            if block_until is not None and block_until in finished:
+                return
+
+    number = 0
+    while number < total:
+        if progress_queue is None:
+            scenario = next(completed)
+        else:
+            print_queued_years()
+            try:
+                scenario = completed.next(timeout=PROGRESS_INTERVAL)
+            except multiprocessing.TimeoutError:
+                continue
+            if scenario not in finished:
+                print_queued_years(block_until=scenario)
+
+        number += 1
+        print('Completed {} of {}: {}'.format(number, total, _get_suffix(*scenario)))
+
+
+def _print_year(scenario, year, population):
+    print('- {} {}: population written is {}'.format(
+        year, _get_suffix(*scenario), round(population / 1e6, 1)))
+
+
+def _workers(value):
+    """
+    Parse the number of worker processes, of which there must be at least
+    one.
+
+    """
+    workers = int(value)
+    if workers < 1:
+        raise argparse.ArgumentTypeError(
+            'must be at least 1, not {}'.format(value))
+    return workers
+
+
+_SHARED_INPUTS = {}
+_PROGRESS_QUEUE = None
+
+# Seconds to wait for a scenario to complete before printing progress again
+PROGRESS_INTERVAL = 1
+
+
 if __name__ == '__main__':
 
     ################################################################
@@ -453,12 +650,13 @@ if __name__ == '__main__':
     #   build costs per year
     ################################################################
 
-    folder = os.path.join(BASE_PATH, '..', 'results', 'mobile_outputs')
+    parser = argparse.ArgumentParser(description='Run the mobile model scenarios')
+    parser.add_argument('-w', '--workers', type=_workers,
+        default=multiprocessing.cpu_count(),
+        help='number of scenarios to run in parallel (default: one per CPU)')
+    args = parser.parse_args()
 
-    BASE_YEAR = 2020
-    END_YEAR = 2030
-    TIMESTEP_INCREMENT = 1
-    TIMESTEPS = range(BASE_YEAR, END_YEAR + 1, TIMESTEP_INCREMENT)
+    folder = os.path.join(BASE_PATH, '..', 'results', 'mobile_outputs')
 
     POPULATION_SCENARIOS = [
         'baseline',
@@ -556,100 +754,63 @@ if __name__ == '__main__':
     print('Loading lookup table')
     clutter_lookup = load_clutter_geotype_lookup_table()
 
-    for pop_scenario, throughput_scenario, intervention_strategy in [
-
-            ('baseline', 'low', 'minimal'),
-            ('0-unplanned', 'low', 'minimal'),
-            ('1-new-cities-from-dwellings', 'low', 'minimal'),
-            ('2-expansion', 'low', 'minimal'),
-            ('3-new-cities23-from-dwellings', 'low', 'minimal'),
-            ('4-expansion23', 'low', 'minimal'),
-
-            ('baseline', 'baseline', 'minimal'),
-            ('0-unplanned', 'baseline', 'minimal'),
-            ('1-new-cities-from-dwellings', 'baseline', 'minimal'),
-            ('2-expansion', 'baseline', 'minimal'),
-            ('3-new-cities23-from-dwellings', 'baseline', 'minimal'),
-            ('4-expansion23', 'baseline', 'minimal'),
-
-            ('baseline', 'high', 'minimal'),
-            ('0-unplanned', 'high', 'minimal'),
-            ('1-new-cities-from-dwellings', 'high', 'minimal'),
-            ('2-expansion', 'high', 'minimal'),
-            ('3-new-cities23-from-dwellings', 'high', 'minimal'),
-            ('4-expansion23', 'high', 'minimal'),
-
-            ('baseline', 'baseline', 'macrocell'),
-            ('0-unplanned', 'baseline', 'macrocell'),
-            ('1-new-cities-from-dwellings', 'baseline', 'macrocell'),
-            ('2-expansion', 'baseline', 'macrocell'),
-            ('3-new-cities23-from-dwellings', 'baseline', 'macrocell'),
-            ('4-expansion23', 'baseline', 'macrocell'),
-
-            ('baseline', 'baseline', 'small-cell'),
-            ('0-unplanned', 'baseline', 'small-cell'),
-            ('1-new-cities-from-dwellings', 'baseline', 'small-cell'),
-            ('2-expansion', 'baseline', 'small-cell'),
-            ('3-new-cities23-from-dwellings', 'baseline', 'small-cell'),
-            ('4-expansion23', 'baseline', 'small-cell'),
-
-            ('baseline', 'baseline', 'small-cell-and-spectrum'),
-            ('0-unplanned', 'baseline', 'small-cell-and-spectrum'),
-            ('1-new-cities-from-dwellings', 'baseline', 'small-cell-and-spectrum'),
-            ('2-expansion', 'baseline', 'small-cell-and-spectrum'),
-            ('3-new-cities23-from-dwellings', 'baseline', 'small-cell-and-spectrum'),
-            ('4-expansion23', 'baseline', 'small-cell-and-spectrum'),
-
-        ]:
-        print("Running:", pop_scenario, throughput_scenario, intervention_strategy)
-
-        assets = initial_system[:]
-
-        for year in TIMESTEPS:
-            print("-", year)
-
-            for pcd_sector in pcd_sectors:
-                try:
-                    pcd_sector_id = pcd_sector["id"]
-                    pcd_sector["population"] = (
-                        population_by_scenario_year_pcd \
-                            [pop_scenario][year][pcd_sector_id])
-                    pcd_sector["user_throughput"] = (
-                        user_throughput_by_scenario_year \
-                            [throughput_scenario][year])
-                except:
-                    pass
-
-            budget = simulation_parameters['annual_budget']
-            service_obligation_capacity = (
-                simulation_parameters['service_obligation_capacity'])
-
-            if year == BASE_YEAR:
-                system = NetworkManager(lads, pcd_sectors, assets,
-                    capacity_lookup_table, clutter_lookup,
-                    simulation_parameters)
-
-            interventions_built, budget, spend = decide_interventions(
-                intervention_strategy, budget, service_obligation_capacity,
-                system, year, simulation_parameters)
-
-            assets += interventions_built
+    SCENARIOS = [
+        ('baseline', 'low', 'minimal'),
+        ('0-unplanned', 'low', 'minimal'),
+        ('1-new-cities-from-dwellings', 'low', 'minimal'),
+        ('2-expansion', 'low', 'minimal'),
+        ('3-new-cities23-from-dwellings', 'low', 'minimal'),
+        ('4-expansion23', 'low', 'minimal'),
+
+        ('baseline', 'baseline', 'minimal'),
+        ('0-unplanned', 'baseline', 'minimal'),
+        ('1-new-cities-from-dwellings', 'baseline', 'minimal'),
+        ('2-expansion', 'baseline', 'minimal'),
+        ('3-new-cities23-from-dwellings', 'baseline', 'minimal'),
+        ('4-expansion23', 'baseline', 'minimal'),
+
+        ('baseline', 'high', 'minimal'),
+        ('0-unplanned', 'high', 'minimal'),
+        ('1-new-cities-from-dwellings', 'high', 'minimal'),
+        ('2-expansion', 'high', 'minimal'),
+        ('3-new-cities23-from-dwellings', 'high', 'minimal'),
+        ('4-expansion23', 'high', 'minimal'),
+
+        ('baseline', 'baseline', 'macrocell'),
+        ('0-unplanned', 'baseline', 'macrocell'),
+        ('1-new-cities-from-dwellings', 'baseline', 'macrocell'),
+        ('2-expansion', 'baseline', 'macrocell'),
+        ('3-new-cities23-from-dwellings', 'baseline', 'macrocell'),
+        ('4-expansion23', 'baseline', 'macrocell'),
+
+        ('baseline', 'baseline', 'small-cell'),
+        ('0-unplanned', 'baseline', 'small-cell'),
+        ('1-new-cities-from-dwellings', 'baseline', 'small-cell'),
+        ('2-expansion', 'baseline', 'small-cell'),
+        ('3-new-cities23-from-dwellings', 'baseline', 'small-cell'),
+        ('4-expansion23', 'baseline', 'small-cell'),
+
+        ('baseline', 'baseline', 'small-cell-and-spectrum'),
+        ('0-unplanned', 'baseline', 'small-cell-and-spectrum'),
+        ('1-new-cities-from-dwellings', 'baseline', 'small-cell-and-spectrum'),
+        ('2-expansion', 'baseline', 'small-cell-and-spectrum'),
+        ('3-new-cities23-from-dwellings', 'baseline', 'small-cell-and-spectrum'),
+        ('4-expansion23', 'baseline', 'small-cell-and-spectrum'),
+    ]
 
-            system = NetworkManager(lads, pcd_sectors, assets,
-                capacity_lookup_table, clutter_lookup,
-                simulation_parameters)
+    shared_inputs = {
+        'lads': lads,
+        'pcd_sectors': pcd_sectors,
+        'population_by_scenario_year_pcd': population_by_scenario_year_pcd,
+        'user_throughput_by_scenario_year': user_throughput_by_scenario_year,
+        'initial_system': initial_system,
+        'capacity_lookup_table': capacity_lookup_table,
+        'clutter_lookup': clutter_lookup,
+        'simulation_parameters': simulation_parameters,
+        'folder': folder,
+        'lad_areas': LAD_AREAS,
+    }
 
-            cost_by_lad = defaultdict(int)
-            cost_by_pcd = defaultdict(int)
-            for pcd, lad, item, cost in spend:
-                cost_by_lad[lad] += cost
-                cost_by_pcd[pcd] += cost
-
-            write_lad_results(system, folder, year, pop_scenario, throughput_scenario,
-                intervention_strategy, cost_by_lad, LAD_AREAS)
-            write_pcd_results(system, folder, year, pop_scenario, throughput_scenario,
-                intervention_strategy, cost_by_pcd, LAD_AREAS)
-            # write_decisions(interventions_built, folder, year, pop_scenario,
-            #     throughput_scenario, intervention_strategy, LAD_AREAS)
-            write_spend(spend, folder, year, pop_scenario, throughput_scenario,
-                intervention_strategy, LAD_AREAS)
+    print('Running {} scenarios on {} workers'.format(
+        len(SCENARIOS), args.workers))
+    run_scenarios(SCENARIOS, shared_inputs, args.workers)
@@ -63,3 +63,30 @@ def parameters():
 @pytest.fixture
 def setup_fixed_network(assets, links, parameters):
     return NetworkManager(assets, links, parameters)
+
+@pytest.fixture
+def exchanges():
+    return [
+        {
+        'exchange_id': exchange_id,
+        'area': 10,
+        'lad_id': 'ABC',
+        'fttp_availability': 10,
+        'fttdp_availability': 10,
+        'fttc_availability': 90,
+        'adsl_availability': 100,
+        'exchange_dwellings': dwellings,
+        }
+        for exchange_id, dwellings in [('A', 100), ('B', 200), ('C', 300), ('D', 400)]
+    ]
+
+@pytest.fixture
+def budget_parameters():
+    return {
+        'annual_budget': 1e5,
+        'max_market_investment_per_dwelling': 1000,
+        'annual_subsidy': 1e7,
+        'subsidy_rural_percentile': 0.5,
+        'subsidy_outsidein_percentile': 0.0,
+        'market_match_funding': 1e7,
+    }
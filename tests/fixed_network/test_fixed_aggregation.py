@@ -0,0 +1,74 @@
+import pytest
+
+from digital_comms.fixed_network.model import NetworkManager
+from digital_comms.fixed_network.aggregation import LadAggregator
+
+
+@pytest.fixture
+def system(exchanges):
+    return NetworkManager(exchanges, {})
+
+
+@pytest.fixture
+def memberships():
+    return [
+        {'exchange_id': 'A', 'lad_id': 'L1', 'weight': 1},
+        {'exchange_id': 'B', 'lad_id': 'L1', 'weight': 0.5},
+        {'exchange_id': 'B', 'lad_id': 'L2', 'weight': 0.5},
+        {'exchange_id': 'C', 'lad_id': 'L2', 'weight': 1},
+        {'exchange_id': 'D', 'lad_id': 'L2', 'weight': 0.25},
+        {'exchange_id': 'D', 'lad_id': 'L3', 'weight': 0.75},
+        {'exchange_id': 'E', 'lad_id': 'L3', 'weight': 1},
+    ]
+
+
+def test_aggregate(system, memberships):
+
+    aggregator = LadAggregator(memberships)
+    system.upgrade([('A', 'fttp')])
+
+    assert aggregator.weights.shape == (3, 5)
+
+    coverage = {item['id']: item for item in system.coverage()}
+    capacity = {item['id']: item for item in system.capacity()}
+
+    results = aggregator.aggregate(system)
+
+    assert [lad['id'] for lad in results] == ['L1', 'L2', 'L3']
+
+    # A and half of B
+    l1 = results[0]
+    assert l1['sum_of_premises'] == 200
+    assert l1['percentage_of_premises_with_fttp'] == pytest.approx(
+        (100 * coverage['A']['percentage_of_premises_with_fttp'] +
+         100 * coverage['B']['percentage_of_premises_with_fttp']) / 200)
+    assert l1['average_capacity'] == pytest.approx(
+        (100 * capacity['A']['average_capacity'] +
+         100 * capacity['B']['average_capacity']) / 200)
+
+    # half of B, C and a quarter of D
+    l2 = results[1]
+    assert l2['sum_of_premises'] == 500
+    assert l2['percentage_of_premises_with_fttc'] == pytest.approx(
+        (100 * coverage['B']['percentage_of_premises_with_fttc'] +
+         300 * coverage['C']['percentage_of_premises_with_fttc'] +
+         100 * coverage['D']['percentage_of_premises_with_fttc']) / 500)
+
+    # three quarters of D, with no exchange E in the system
+    l3 = results[2]
+    assert l3['sum_of_premises'] == 300
+    assert l3['average_capacity'] == pytest.approx(
+        capacity['D']['average_capacity'])
+
+
+def test_aggregate_missing_exchanges(system, memberships):
+
+    aggregator = LadAggregator([
+        membership for membership in memberships
+        if membership['exchange_id'] not in ('B', 'D')
+    ])
+
+    with pytest.raises(ValueError) as error:
+        aggregator.aggregate(system)
+
+    assert 'B, D' in str(error.value)
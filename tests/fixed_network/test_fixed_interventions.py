@@ -1,7 +1,10 @@
+import numpy as np
 import pytest
 from digital_comms.fixed_network.model import NetworkManager
 from digital_comms.fixed_network.interventions import get_all_assets_ranked
 from digital_comms.fixed_network.interventions import decide_interventions
+from digital_comms.fixed_network.interventions import decide_mixed_interventions
+from digital_comms.fixed_network.interventions import budget_feasible_interventions
 
 @pytest.fixture
 def parameters():
@@ -110,6 +113,27 @@ def test_get_all_assets_ranked(base_system, parameters):
     assert actual_ranking_ids == expected_ranking
 
 
+def test_ranking_after_upgrade(base_system):
+
+    # fttdp coverage of exchange 'A' reaches all of its 100 premises
+    base_system.upgrade([('A', 'fttp')])
+
+    actual_ranking = get_all_assets_ranked(
+        base_system, 'fttdp', 'insideout', 0
+    )
+
+    assert [e.id for e in actual_ranking] == ['B', 'C', 'D']
+
+    actual_ranking = get_all_assets_ranked(
+        base_system, 'fttdp', 'rural', 0.5
+    )
+
+    assert [e.id for e in actual_ranking] == ['C', 'B']
+
+    with pytest.raises(ValueError):
+        get_all_assets_ranked(base_system, 'fttdp', 'unknown', 0)
+
+
 def test_decide_interventions(base_system, parameters, constrained_parameters):
 
     built_interventions = decide_interventions(
@@ -213,3 +237,99 @@ def test_decide_interventions(base_system, parameters, constrained_parameters):
     ]
 
     assert built_interventions == expected_interventions
+
+
+def test_budget_feasible_interventions():
+
+    costs = np.array([50000, 50000, 100000, 50000])
+
+    # the market stops at the first unaffordable exchange
+    number_of_market_upgrades, subsidised, _, _ = budget_feasible_interventions(
+        costs, 150000)
+
+    assert number_of_market_upgrades == 2
+    assert subsidised is None
+
+    # exchanges bought by the market are skipped by the subsidy
+    number_of_market_upgrades, subsidised, private_investment, subsidy = \
+        budget_feasible_interventions(
+            costs, 100000,
+            subsidised_positions=np.array([1, 2, 3]),
+            subsidised_costs=np.array([50000, 100000, 50000]),
+            market_investment=np.array([9000.0, 8000.5, 60000.0]),
+            annual_subsidy=92000)
+
+    assert number_of_market_upgrades == 2
+    assert private_investment.tolist() == [9000, 8000, 60000]
+    assert subsidy.tolist() == [41000, 92000, 0]
+    assert subsidised.tolist() == [False, True, True]
+
+
+def test_budget_feasible_interventions_float_costs():
+
+    # 0.1 + 0.2 sums to just over 0.3 in floats, but meets the budget
+    costs = np.array([0.1, 0.2, 0.01])
+    assert np.cumsum(costs)[1] > 0.3
+
+    number_of_market_upgrades, _, _, _ = budget_feasible_interventions(
+        costs, 0.3)
+
+    assert number_of_market_upgrades == 2
+
+    # float costs, as from a cost curve, exactly meeting a large budget
+    costs = np.array([2345678.7, 100000.1, 0.5])
+    assert np.cumsum(costs)[1] > 2445678.8
+
+    number_of_market_upgrades, subsidised, _, _ = budget_feasible_interventions(
+        costs, 2445678.8,
+        subsidised_positions=np.array([2]),
+        subsidised_costs=np.array([250000.35]),
+        market_investment=np.array([0.0]),
+        annual_subsidy=250000)
+
+    assert number_of_market_upgrades == 2
+    assert subsidised.tolist() == [True]
+
+
+def test_decide_mixed_interventions(base_system, constrained_parameters):
+
+    # fttdp passes the same premises as fttp for half the cost, so wins each
+    # exchange, densest first
+    built_interventions = decide_interventions(
+        base_system, ['fttp', 'fttdp'], 'market_insideout', constrained_parameters
+    )
+
+    expected_interventions = [
+        ('D', 'fttdp', 'market', 'private', 50000, 0, 0),
+        ('C', 'fttdp', 'market', 'private', 50000, 0, 0)
+    ]
+
+    assert built_interventions == expected_interventions
+
+    constrained_parameters['annual_subsidy'] = 50000
+
+    built_interventions = decide_mixed_interventions(
+        base_system, ['fttp', 'fttdp'], 'subsidy_rural', constrained_parameters
+    )
+
+    expected_interventions = [
+        ('D', 'fttdp', 'subsidy', 'private', 50000, 50000, 0),
+        ('C', 'fttdp', 'subsidy', 'private', 50000, 50000, 0),
+        ('B', 'fttdp', 'subsidy', 'public_private', 50000, 8000, 42000),
+    ]
+
+    assert built_interventions == expected_interventions
+
+    # once upgraded with fttdp, only fttp is left to deploy at D
+    base_system.upgrade([('D', 'fttdp')])
+
+    built_interventions = decide_mixed_interventions(
+        base_system, ['fttp', 'fttdp'], 'market_insideout', constrained_parameters
+    )
+
+    expected_interventions = [
+        ('C', 'fttdp', 'market', 'private', 50000, 0, 0),
+        ('B', 'fttdp', 'market', 'private', 50000, 0, 0)
+    ]
+
+    assert built_interventions == expected_interventions
@@ -1,7 +1,8 @@
 import pytest
 import os
 
-from digital_comms.fixed_network.model import NetworkManager
+from digital_comms.fixed_network.model import NetworkManager, CostCurveTable
+from digital_comms.fixed_network.model import ROLL_OUT_COSTS
 from digital_comms.fixed_network.model import _generic_connection_capacity
 from digital_comms.fixed_network.interventions import decide_interventions
 
@@ -76,6 +77,68 @@ class TestUpgradeExchange:
         assert actual.total_prems == 100
 
 
+def test_add_and_remove_exchange(base_system, parameters):
+
+    exchange = base_system.add_exchange({
+        'exchange_id': 'exchange_EAARR',
+        'area': 5,
+        'lad_id': 'ABC',
+        'fttp_availability': 0,
+        'fttdp_availability': 0,
+        'fttc_availability': 50,
+        'adsl_availability': 100,
+        'exchange_dwellings': 200,
+    })
+
+    assert base_system.get_exchange('exchange_EAARR') is exchange
+    assert len(base_system._exchanges) == 2
+
+    unknown_ids = base_system.upgrade([
+        ('exchange_EAARR', 'fttp'),
+        ('exchange_missing', 'fttp'),
+    ])
+
+    assert unknown_ids == ['exchange_missing']
+    assert exchange.fttp == 200
+
+    assert base_system.remove_exchange('exchange_EAARR') is exchange
+    assert base_system.get_exchange('exchange_EAARR') is None
+    assert [exchange.id for exchange in base_system._exchanges] == \
+        ['exchange_EACAM']
+
+    assert base_system.upgrade([('exchange_EAARR', 'fttp')]) == \
+        ['exchange_EAARR']
+
+
+def test_update_dwellings_with_repeated_ids(exchanges, parameters):
+
+    # an exchange split between two LADs, as written by fixed_run
+    assets = [
+        dict(exchanges[0], lad_id='L1'),
+        dict(exchanges[0], lad_id='L2', exchange_dwellings=200),
+        dict(exchanges[1], lad_id='L1', exchange_dwellings=300),
+    ]
+
+    system = NetworkManager(assets, parameters, columnar=True)
+
+    # a record key reaches only its own exchange
+    assert system.update_dwellings({('A', 'L2'): 250}) == [('A', 'L2')]
+    assert [e.total_prems for e in system.find_exchanges('A')] == [100, 250]
+
+    # an exchange id reaches every exchange with it
+    assert system.update_dwellings({'A': 400, 'C': 10}) == ['A']
+    assert [e.total_prems for e in system.find_exchanges('A')] == [400, 400]
+    assert [item['sum_of_premises'] for item in system.coverage()] == [400, 400, 300]
+
+    # removing the first exchange with an id leaves the other reachable
+    system.remove_exchange('A')
+
+    assert system.get_exchange('A').lad == 'L2'
+    assert system.find_exchanges(('A', 'L1')) == []
+    assert system.update_dwellings({('A', 'L2'): 500}) == [('A', 'L2')]
+    assert system.get_exchange('A').total_prems == 500
+
+
 def test_coverage(base_system):
 
     # assets = [{
@@ -174,6 +237,66 @@ def test_capacity(base_system):
 
     assert expected_capacity == actual_capacity
 
+def test_columnar_exchanges(parameters):
+
+    assets = [
+        {
+            'exchange_id': 'exchange_EACAM',
+            'area': 10,
+            'lad_id': 'ABC',
+            'fttp_availability': 10,
+            'fttdp_availability': 10,
+            'fttc_availability': 90,
+            'adsl_availability': 100,
+            'exchange_dwellings': 100,
+        },
+        {
+            'exchange_id': 'exchange_EAARR',
+            'area': 3.7,
+            'lad_id': 'ABC',
+            'fttp_availability': 25,
+            'fttdp_availability': 5,
+            'fttc_availability': 60,
+            'adsl_availability': 100,
+            'exchange_dwellings': 1234,
+        },
+        {
+            'exchange_id': 'exchange_EAEMPTY',
+            'area': 1,
+            'lad_id': 'ABC',
+            'fttp_availability': 0,
+            'fttdp_availability': 0,
+            'fttc_availability': 50,
+            'adsl_availability': 100,
+            'exchange_dwellings': 0,
+        },
+    ]
+
+    system = NetworkManager(assets, parameters)
+    columnar_system = NetworkManager(assets, parameters, columnar=True)
+
+    for interventions in [[], [('exchange_EAARR', 'fttdp')],
+            [('exchange_EACAM', 'fttp'), ('exchange_EAARR', 'fttp')]]:
+
+        system.upgrade(interventions)
+        columnar_system.upgrade(interventions)
+
+        assert columnar_system.coverage() == system.coverage()
+        assert columnar_system.capacity() == system.capacity()
+
+    for technology in ['fttp', 'fttdp', 'fttc']:
+        assert columnar_system._table.unserved[technology].tolist() == [
+            getattr(exchange, '{}_unserved'.format(technology))
+            for exchange in system._exchanges
+        ]
+
+    columnar_system.remove_exchange('exchange_EACAM')
+    system.remove_exchange('exchange_EACAM')
+
+    assert columnar_system.coverage() == system.coverage()
+    assert columnar_system.capacity() == system.capacity()
+
+
 def test_fttp_costs(base_system):
 
     actual = base_system._exchanges[0]
@@ -184,6 +307,68 @@ def test_fttp_costs(base_system):
     assert actual_costs['fttdp'] == 50000
     assert actual_costs['fttc'] == 25000
 
+    # the costs shared by all exchanges cannot be changed through one
+    with pytest.raises(TypeError):
+        actual.rollout_costs['fttp'] = 0
+
+    assert ROLL_OUT_COSTS['fttp'] == 100000
+
+
+def test_cost_curve_table(exchanges, parameters):
+
+    cost_table = CostCurveTable([
+        {'strategy': 'fttp', 'geotype': 1, 'dwelling_density': 5000, 'cost': 600},
+        {'strategy': 'fttp', 'geotype': 2, 'dwelling_density': 100, 'cost': 2000},
+        {'strategy': 'fttp', 'geotype': 3, 'dwelling_density': 1000, 'cost': 1000},
+        {'strategy': 'fttdp', 'geotype': 1, 'dwelling_density': 100, 'cost': 800},
+        {'strategy': 'fttdp', 'geotype': 2, 'dwelling_density': 1000, 'cost': 800},
+    ])
+
+    # extrapolated below the lowest density, interpolated within the curve,
+    # and bounded below when extrapolated above the highest density
+    costs = cost_table.cost_per_dwelling('fttp', [50, 550, 1000, 10000])
+    assert costs.tolist() == pytest.approx([2055.5556, 1500, 1000, 500])
+
+    assets = [
+        dict(exchanges[0], exchange_dwellings=500),
+        dict(exchanges[1], exchange_dwellings=5500),
+    ]
+
+    system = NetworkManager(assets, parameters, cost_table=cost_table)
+
+    assert system.get_exchange('A').rollout_costs['fttp'] == pytest.approx(
+        2055.5556 * 500)
+    # fttc has no curve, so falls back to ROLL_OUT_COSTS
+    assert system.get_exchange('B').rollout_costs == {
+        'fttp': 1500 * 5500, 'fttdp': 800 * 5500, 'fttc': ROLL_OUT_COSTS['fttc']}
+
+    # costs are found again once dwellings change
+    system.update_dwellings({'A': 5500})
+
+    assert system.get_exchange('A').rollout_costs['fttp'] == 1500 * 5500
+
+
+def test_cost_curve_table_fallback(exchanges, parameters):
+
+    cost_table = CostCurveTable([
+        {'strategy': 'fttp', 'dwelling_density': 100, 'cost': 2000},
+        {'strategy': 'fttp', 'dwelling_density': 1000, 'cost': 1000},
+    ])
+
+    system = NetworkManager([dict(exchanges[0], exchange_dwellings=5500)],
+        parameters, cost_table=cost_table)
+
+    # a technology without a curve can still be ranked and decided on
+    exchange = system.get_exchange('A')
+    assert exchange.rollout_costs['fttp'] == 1500 * 5500
+    assert exchange.rollout_costs['fttdp'] == ROLL_OUT_COSTS['fttdp']
+    assert exchange.rollout_costs['fttc'] == ROLL_OUT_COSTS['fttc']
+
+    interventions = decide_interventions(
+        system, 'fttdp', 'market_insideout', parameters)
+
+    assert [intervention[0] for intervention in interventions] == ['A']
+
 
 # def test_fttp_upgrade_exchanges(base_system, parameters):
 
@@ -0,0 +1,31 @@
+import csv
+import os
+
+from digital_comms.fixed_network.model import NetworkManager
+
+
+def test_write_exchange_results(tmpdir, exchanges):
+
+    from scripts.fixed_run import ResultSink
+
+    # 'B' appears twice, with different dwellings
+    assets = exchanges[:2] + [dict(exchanges[1], exchange_dwellings=300)]
+    system = NetworkManager(assets, {})
+    system.upgrade([('A', 'fttp')])
+
+    with ResultSink(str(tmpdir), 'fttp', 'market_insideout') as results:
+        results.write_exchange_results(system, 2015)
+
+    with open(os.path.join(str(tmpdir), 'exchange_fttp_market_insideout.csv')) as source:
+        rows = list(csv.DictReader(source))
+
+    # one row per exchange record, each with its own capacity
+    expected = [
+        (coverage['id'], str(capacity['average_capacity']),
+            str(coverage['sum_of_premises']))
+        for coverage, capacity in zip(system.coverage(), system.capacity())
+    ]
+
+    assert [(row['exchange'], row['average_capacity'], row['total_prems'])
+        for row in rows] == expected
+    assert [row['total_prems'] for row in rows] == ['100', '200', '300']
@@ -0,0 +1,167 @@
+import pytest
+
+from digital_comms.fixed_network.rollout import RolloutEngine
+
+
+def test_rollout(exchanges, budget_parameters):
+
+    dwellings = {
+        2020: {'A': 100, 'B': 250},
+        2025: {'C': 330},
+    }
+
+    engine = RolloutEngine(exchanges, dwellings, budget_parameters,
+        'fttdp', 'market_insideout', carry_over=True, scale_budgets=True)
+
+    # one year of budget upgrades 'A' and 'B'
+    delta = engine.step(2015)
+
+    assert [i[0] for i in delta['interventions']] == ['A', 'B']
+    assert delta['changed_exchanges'] == []
+    assert delta['private_spend'] == 100000
+    assert delta['carried_budget'] == 0
+
+    # upgrades persist, and new dwellings at 'B' share its full coverage
+    delta = engine.step(2020)
+
+    assert delta['years'] == 5
+    assert delta['changed_exchanges'] == ['B']
+    assert delta['new_dwellings'] == 50
+    assert engine.system.get_exchange('B').fttdp == 250
+    assert [i[0] for i in delta['interventions']] == ['C', 'D']
+    assert delta['carried_budget'] == 400000
+
+    assert engine.upgraded == {
+        'A': [(2015, 'fttdp')],
+        'B': [(2015, 'fttdp')],
+        'C': [(2020, 'fttdp')],
+        'D': [(2020, 'fttdp')],
+    }
+
+    # nothing is left to upgrade, so the budget keeps accumulating
+    delta = engine.step(2025)
+
+    assert delta['interventions'] == []
+    assert delta['carried_budget'] == 900000
+    assert len(engine.history) == 3
+
+    with pytest.raises(ValueError):
+        engine.step(2025)
+
+
+def test_rollout_without_carry_over(exchanges, budget_parameters):
+
+    engine = RolloutEngine(exchanges, {}, budget_parameters,
+        'fttp', 'market_insideout', carry_over=False)
+
+    deltas = engine.run([2015, 2016, 2017])
+
+    assert [[i[0] for i in delta['interventions']] for delta in deltas] == \
+        [['A'], ['B'], ['C']]
+    assert all(delta['carried_budget'] == 0 for delta in deltas)
+
+
+def test_rollout_budget_per_timestep(exchanges, budget_parameters):
+
+    # as in the original runner, each timestep has one year of budget,
+    # however many years it covers
+    engine = RolloutEngine(exchanges, {}, budget_parameters,
+        'fttp', 'market_insideout')
+
+    deltas = engine.run([2015, 2020])
+
+    assert deltas[1]['years'] == 5
+    assert [[i[0] for i in delta['interventions']] for delta in deltas] == \
+        [['A'], ['B']]
+    assert [delta['private_spend'] for delta in deltas] == [100000, 100000]
+    assert deltas[1]['carried_budget'] == 0
+
+    # budgets scaled by the years covered, without carry over
+    engine = RolloutEngine(exchanges, {}, budget_parameters,
+        'fttp', 'market_insideout', scale_budgets=True)
+
+    deltas = engine.run([2015, 2020])
+
+    assert [[i[0] for i in delta['interventions']] for delta in deltas] == \
+        [['A'], ['B', 'C', 'D']]
+    assert [delta['private_spend'] for delta in deltas] == [100000, 300000]
+    assert deltas[1]['carried_budget'] == 0
+
+
+def test_rollout_subsidy_carry_over(exchanges, budget_parameters):
+
+    budget_parameters = dict(budget_parameters, annual_subsidy=1e5)
+
+    engine = RolloutEngine(exchanges, {}, budget_parameters,
+        'fttp', 'subsidy_rural', carry_over=True)
+
+    deltas = engine.run([2015, 2016, 2017])
+
+    assert [[i[0] for i in delta['interventions']] for delta in deltas] == \
+        [['D', 'B'], ['C', 'A'], []]
+
+    # the private share of a subsidised upgrade is private spend, but is
+    # not drawn from the annual budget
+    assert [delta['market_spend'] for delta in deltas] == [100000, 100000, 0]
+    assert [delta['private_spend'] for delta in deltas] == [108000, 109000, 0]
+    assert [delta['subsidy_spend'] for delta in deltas] == [92000, 91000, 0]
+
+    assert [delta['carried_budget'] for delta in deltas] == [0, 0, 100000]
+    assert [delta['carried_subsidy'] for delta in deltas] == [8000, 17000, 117000]
+
+
+def test_rollout_from_dwellings_data(tmpdir, budget_parameters):
+
+    from scripts.fixed_run import (
+        read_data, exchange_data_by_timestep, exchange_dwellings_by_timestep
+        )
+
+    path = str(tmpdir.join('arc_dwellings.csv'))
+    with open(path, 'w') as dwellings_file:
+        dwellings_file.write(
+            'timestep,dwellings,lad16nm,lad_uk_2016\n'
+            '2015,1000,Cherwell,E07000177\n'
+            '2015,2000,Oxford,E07000178\n'
+            '2020,1200,Cherwell,E07000177\n'
+            '2020,3000,Oxford,E07000178\n'
+        )
+
+    lads = [
+        {
+        'id': lad_id,
+        'name': name,
+        'area': 100,
+        'fttp_availability': 10,
+        'fttc_availability': 90,
+        'adsl_availability': 100,
+        }
+        for lad_id, name in [('E07000177', 'Cherwell'), ('E07000178', 'Oxford')]
+    ]
+    exchanges = [{'id': 'A', 'area': 50}, {'id': 'B', 'area': 50}]
+
+    # dwellings are read as a one-shot iterator, as in fixed_run
+    exchanges_by_timestep = exchange_data_by_timestep(
+        exchanges, lads, read_data(path), [2015, 2020])
+
+    # one record per exchange and LAD, so each exchange id appears twice
+    assert [e['exchange_dwellings'] for e in exchanges_by_timestep[2015]] == \
+        [500, 500, 1000, 1000]
+    assert [e['exchange_dwellings'] for e in exchanges_by_timestep[2020]] == \
+        [600, 600, 1500, 1500]
+
+    dwellings = exchange_dwellings_by_timestep(exchanges_by_timestep)
+
+    engine = RolloutEngine(exchanges_by_timestep[2015], dwellings, budget_parameters,
+        'fttdp', 'market_insideout')
+
+    deltas = engine.run([2015, 2020])
+
+    # growth reaches every record, not only the first with each id
+    assert deltas[0]['changed_exchanges'] == []
+    assert deltas[1]['changed_exchanges'] == [
+        ('A', 'E07000177'), ('B', 'E07000177'),
+        ('A', 'E07000178'), ('B', 'E07000178'),
+    ]
+    assert deltas[1]['new_dwellings'] == 1200
+    assert [e.total_prems for e in engine.system.find_exchanges('A')] == [600, 1500]
+    assert sum(item['sum_of_premises'] for item in engine.system.coverage()) == 4200
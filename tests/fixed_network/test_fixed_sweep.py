@@ -0,0 +1,65 @@
+import pytest
+
+from digital_comms.fixed_network.model import NetworkManager
+from digital_comms.fixed_network.interventions import decide_interventions
+from digital_comms.fixed_network.sweep import (
+    PolicySweep, parameter_grid, run_sweep
+    )
+
+
+def test_parameter_grid(budget_parameters):
+
+    points = parameter_grid(budget_parameters, annual_budget=[0, 1e6],
+        annual_subsidy=[0, 1e5, 1e7])
+
+    assert len(points) == 6
+    assert points[0]['annual_budget'] == 0
+    assert points[0]['annual_subsidy'] == 0
+    assert points[-1]['annual_budget'] == 1e6
+    assert points[-1]['annual_subsidy'] == 1e7
+    assert all(point['market_match_funding'] == 1e7 for point in points)
+
+
+@pytest.mark.parametrize('policy', [
+    'market_insideout', 'subsidy_rural', 'subsidy_outsidein'])
+def test_sweep_matches_decide_interventions(exchanges, budget_parameters, policy):
+
+    points = parameter_grid({}, annual_budget=[0, 1e5, 3e5, 1e7],
+        annual_subsidy=[0, 1e5, 1e7],
+        subsidy_rural_percentile=[0, 0.5, 1])
+
+    sweep = PolicySweep(exchanges, 'fttp', policy, budget_parameters)
+
+    for point, row in zip(points, sweep.run(points)):
+
+        system = NetworkManager(exchanges, budget_parameters)
+        interventions = decide_interventions(
+            system, 'fttp', policy, dict(budget_parameters, **point))
+        system.upgrade(interventions)
+
+        assert row['upgrades'] == len(interventions)
+        assert row['total_cost'] == sum(item[4] for item in interventions)
+        assert row['total_private_investment'] == sum(
+            item[5] for item in interventions)
+        assert row['total_subsidy'] == sum(item[6] for item in interventions)
+
+        total_premises = sum(item['sum_of_premises'] for item in system.coverage())
+        assert row['percentage_of_premises_with_fttp'] == pytest.approx(sum(
+            item['percentage_of_premises_with_fttp'] * item['sum_of_premises']
+            for item in system.coverage()) / total_premises)
+        assert row['average_capacity'] == pytest.approx(sum(
+            item['average_capacity'] * exchange.total_prems
+            for item, exchange in zip(system.capacity(), system._exchanges)) /
+            total_premises)
+
+
+def test_run_sweep_in_parallel(exchanges, budget_parameters):
+
+    points = parameter_grid({}, annual_budget=[0, 1e5, 3e5, 1e7],
+        annual_subsidy=[0, 1e7])
+
+    serial = run_sweep(exchanges, 'fttp', 'subsidy_rural', budget_parameters, points)
+    parallel = run_sweep(exchanges, 'fttp', 'subsidy_rural', budget_parameters, points,
+        workers=2, chunksize=3)
+
+    assert parallel == serial
@@ -8,6 +8,7 @@ import pytest
 from digital_comms.mobile_network.costs import(
     calculate_costs
     )
+from digital_comms.mobile_network.model import Asset
 
 
 def test_costs():
@@ -75,3 +76,27 @@ def test_costs():
 
     assert round(output_data[0]['capex'], 0) == 30
     assert round(output_data[0]['opex'], 0) == 7
+
+
+def test_costs_of_assets():
+
+    data = {
+        'capex': 200,
+        'opex': 50,
+        'build_date': 2020,
+        'pcd_sector': 'CB11',
+        'ran_type': 'macro',
+        'site_ngr': 'site_1',
+        'frequency': ['800', '2600'],
+        'bandwidth': '2x10MHz',
+        'sectors': 3,
+        'technology': 'LTE',
+        'type': 'macrocell_site',
+        'item': 'upgrade',
+        'mast_height': 30,
+        'lad': 'E07000008',
+    }
+
+    # an Asset costs the same as the dict it replaces
+    assert calculate_costs([Asset.from_dict(data)], 0.05, 2019, 2021) == \
+        calculate_costs([data], 0.05, 2019, 2021)
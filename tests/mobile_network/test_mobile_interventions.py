@@ -6,7 +6,9 @@ Written by Ed Oughton
 
 """
 import pytest
-from digital_comms.mobile_network.interventions import decide_interventions, _area_satisfied
+from digital_comms.mobile_network.interventions import (
+    decide_interventions, _area_satisfied, _small_cells_required
+    )
 from digital_comms.mobile_network.model import NetworkManager, PostcodeSector
 
 @pytest.fixture
@@ -102,3 +104,78 @@ def test_decide_interventions(non_4g_system, basic_system,
 
     assert len(actual_result[0]) == 4
     assert actual_result[1] == 0
+
+
+def test_small_cells_required(mixed_system, setup_simulation_parameters):
+
+    area = mixed_system.postcode_sectors['CB11']
+
+    # 1 existing small cell in 2 km^2, 4 Mbps/km^2 from the macrocell layer
+    number_of_small_cells = _small_cells_required(
+        area, [], 8, setup_simulation_parameters)
+
+    # 4 Mbps/km^2 more needs 1.2 small cells per km^2, so ceil(2.4) = 3 in
+    # total, of which 2 are to be added to the existing one
+    assert number_of_small_cells == 2
+
+    small_cell = {
+        'site_ngr': 'small_cell_site',
+        'frequency': '3700',
+        'technology': '5G',
+        'type': 'small_cell',
+        'bandwidth': '2x25MHz',
+        'build_date': 2020,
+        'pcd_sector': 'CB11',
+    }
+
+    assert _area_satisfied(area, [small_cell] * number_of_small_cells,
+        8, setup_simulation_parameters)
+    assert not _area_satisfied(area, [small_cell] * (number_of_small_cells - 1),
+        8, setup_simulation_parameters)
+
+    # the small cell layer tops out at 10 Mbps/km^2
+    assert _small_cells_required(
+        area, [], 100, setup_simulation_parameters) == float('inf')
+
+
+def test_decide_interventions_priority(non_4g_system, mixed_system,
+    setup_simulation_parameters):
+
+    actual_result = decide_interventions(
+        'minimal', 250000, 0,
+        mixed_system, 2020, setup_simulation_parameters, mode='priority'
+    )
+
+    assert actual_result == ([], 250000, [])
+
+    # an upgrade on its own adds no capacity, but unlocks new carriers
+    actual_result = decide_interventions(
+        'macrocell', 142446 + 50917, 10,
+        non_4g_system, 2020, setup_simulation_parameters, mode='priority'
+    )
+
+    items = [item for _, _, item, _ in actual_result[2]]
+    assert items[0] == 'upgrade_to_lte'
+    assert actual_result[1] >= 0
+
+    # #50917 * 4 = 203668
+    actual_result = decide_interventions(
+        'macrocell', 203668, 10,
+        mixed_system, 2020, setup_simulation_parameters, mode='priority'
+    )
+
+    # the budget is never exceeded
+    assert actual_result[1] >= 0
+    assert sum(cost for _, _, _, cost in actual_result[2]) == \
+        203668 - actual_result[1]
+
+    # carriers already built at a site are not bought again
+    built = [(asset['site_ngr'], tuple(asset['frequency']))
+        for asset in actual_result[0]]
+    assert len(built) == len(set(built))
+
+    with pytest.raises(ValueError):
+        decide_interventions(
+            'macrocell', 203668, 10,
+            mixed_system, 2020, setup_simulation_parameters, mode='unknown'
+        )
@@ -4,12 +4,15 @@ Test Mobile Network model.py
 Written by Edward J. Oughton
 
 """
+import pickle
+
 import pytest
 
 from digital_comms.mobile_network.model import (
-    NetworkManager, LAD, PostcodeSector,
-    lookup_clutter_geotype, lookup_capacity,
-    interpolate, find_frequency_bandwidth
+    NetworkManager, LAD, PostcodeSector, Asset, SiteIndex,
+    lookup_clutter_geotype, lookup_capacity, lookup_capacities,
+    calculate_capacities, interpolate, find_frequency_bandwidth,
+    CapacityLookupTable
     )
 
 
@@ -23,6 +26,95 @@ class TestNetworkManager():
             setup_capacity_lookup, setup_clutter_lookup,
             setup_simulation_parameters)
 
+    def test_apply_interventions(self, setup_lad, setup_pcd_sector,
+        setup_assets, setup_mixed_assets, setup_capacity_lookup,
+        setup_clutter_lookup, setup_simulation_parameters):
+
+        manager = NetworkManager(setup_lad, setup_pcd_sector, setup_assets,
+            setup_capacity_lookup, setup_clutter_lookup,
+            setup_simulation_parameters)
+
+        new_assets = [
+            asset for asset in setup_mixed_assets
+            if asset['type'] == 'small_cell'
+        ] + [{
+            'pcd_sector': 'CB11',
+            'site_ngr': 'site_100',
+            'frequency': ['700'],
+            'technology': '5G',
+            'type': 'macrocell_site',
+            'bandwidth': '2x10MHz',
+            'build_date': 2020,
+        }, {
+            'pcd_sector': 'XX99',
+            'site_ngr': 'site_999',
+            'frequency': ['700'],
+            'technology': '5G',
+            'type': 'macrocell_site',
+            'bandwidth': '2x10MHz',
+            'build_date': 2020,
+        }]
+
+        initial_lad_capacity = manager.lads[1].capacity()
+
+        manager.apply_interventions(new_assets)
+
+        rebuilt_manager = NetworkManager(setup_lad, setup_pcd_sector,
+            setup_assets + new_assets, setup_capacity_lookup,
+            setup_clutter_lookup, setup_simulation_parameters)
+
+        for pcd_sector_id, rebuilt_pcd_sector in \
+                rebuilt_manager.postcode_sectors.items():
+            pcd_sector = manager.postcode_sectors[pcd_sector_id]
+            assert pcd_sector.assets == rebuilt_pcd_sector.assets
+            assert pcd_sector.capacity == rebuilt_pcd_sector.capacity
+            assert pcd_sector.site_density_small_cells == \
+                rebuilt_pcd_sector.site_density_small_cells
+
+        assert manager.postcode_sectors['CB11'].capacity > 4
+
+        assert manager.lads[1].capacity() > initial_lad_capacity
+        assert manager.lads[1].capacity() == rebuilt_manager.lads[1].capacity()
+
+    def test_update_demand(self, setup_lad, setup_pcd_sector,
+        setup_assets, setup_capacity_lookup, setup_clutter_lookup,
+        setup_simulation_parameters):
+
+        # allow postcode sectors to become urban
+        capacity_lookup = dict(setup_capacity_lookup)
+        capacity_lookup[('urban', '1800', '10', '4G')] = [(0, 0), (1, 3)]
+        capacity_lookup[('urban', '3500', '40', '5G')] = [(0, 0), (1, 4)]
+        capacity_lookup[('urban', '26000', '100', '5G')] = [(0, 0), (1, 5)]
+
+        manager = NetworkManager(setup_lad, setup_pcd_sector, setup_assets,
+            capacity_lookup, setup_clutter_lookup,
+            setup_simulation_parameters)
+
+        manager.lads[1].demand()
+
+        setup_pcd_sector[0]['population'] = 20000
+        setup_pcd_sector[1]['user_throughput'] = 10
+
+        manager.update_demand(setup_pcd_sector)
+
+        rebuilt_manager = NetworkManager(setup_lad, setup_pcd_sector,
+            setup_assets, capacity_lookup, setup_clutter_lookup,
+            setup_simulation_parameters)
+
+        for pcd_sector_id, rebuilt_pcd_sector in \
+                rebuilt_manager.postcode_sectors.items():
+            pcd_sector = manager.postcode_sectors[pcd_sector_id]
+            assert pcd_sector.demand == rebuilt_pcd_sector.demand
+            assert pcd_sector.demand_density == rebuilt_pcd_sector.demand_density
+            assert pcd_sector.clutter_environment == \
+                rebuilt_pcd_sector.clutter_environment
+            assert pcd_sector.capacity == rebuilt_pcd_sector.capacity
+
+        assert manager.postcode_sectors['CB11'].clutter_environment == 'urban'
+
+        assert manager.lads[1].population == rebuilt_manager.lads[1].population
+        assert manager.lads[1].demand() == rebuilt_manager.lads[1].demand()
+
 
 class TestLAD():
 
@@ -94,6 +186,45 @@ class TestLAD():
         assert testCoverage == 1
 
 
+    def test_aggregates(self, setup_lad, setup_pcd_sector,
+        setup_assets, setup_capacity_lookup,
+        setup_clutter_lookup, setup_simulation_parameters):
+
+        testLAD = LAD(setup_lad[0],
+            setup_simulation_parameters
+        )
+
+        testPostcode = PostcodeSector(setup_pcd_sector[0], setup_assets,
+            setup_capacity_lookup, setup_clutter_lookup,
+            setup_simulation_parameters, 0)
+        testLAD.add_pcd_sector(testPostcode)
+
+        assert testLAD.population == 500
+        assert testLAD.coverage(setup_simulation_parameters) == 1
+
+        # running totals are kept up to date as postcode sectors are added
+        testPostcode = PostcodeSector(setup_pcd_sector[1], setup_assets,
+            setup_capacity_lookup, setup_clutter_lookup,
+            setup_simulation_parameters, 0)
+        testLAD.add_pcd_sector(testPostcode)
+
+        assert testLAD.population == 700
+        assert testLAD.area == 4
+        assert testLAD.coverage(setup_simulation_parameters) == 1
+
+        # changes to nested postcode sectors are picked up once invalidated
+        testPostcode.population = 300
+        testPostcode.capacity = 1
+        assert testLAD.population == 700
+
+        testLAD.invalidate_aggregates()
+
+        assert testLAD.population == 800
+        assert testLAD.population_density == 200
+        assert testLAD.capacity() == 2.5
+        assert testLAD.coverage(setup_simulation_parameters) == 500 / 800
+
+
 class TestPostcode():
 
     def test_capacity(self, setup_lad, setup_pcd_sector,
@@ -125,6 +256,50 @@ class TestPostcode():
         assert round(testCapacity,2) == 4
 
 
+    def test_capacity_with(self, setup_pcd_sector, setup_mixed_assets,
+        setup_capacity_lookup, setup_clutter_lookup,
+        setup_simulation_parameters):
+
+        assets = [
+            asset for asset in setup_mixed_assets
+            if asset['pcd_sector'] == 'CB11'
+        ]
+
+        testPostcode = PostcodeSector(setup_pcd_sector[0], assets,
+            setup_capacity_lookup, setup_clutter_lookup,
+            setup_simulation_parameters, 0)
+
+        assert testPostcode.capacity_with([]) == testPostcode.capacity
+
+        extra_assets = [{
+            'pcd_sector': 'CB11',
+            'site_ngr': 'site_100',
+            'frequency': ['700'],
+            'technology': '5G',
+            'type': 'macrocell_site',
+            'bandwidth': '2x10MHz',
+            'build_date': 2020,
+        }, {
+            'pcd_sector': 'CB11',
+            'site_ngr': 'small_cell_site',
+            'frequency': '3700',
+            'technology': '5G',
+            'type': 'small_cell',
+            'bandwidth': '2x25MHz',
+            'build_date': 2020,
+        }]
+
+        expected_capacity = PostcodeSector(setup_pcd_sector[0],
+            assets + extra_assets, setup_capacity_lookup,
+            setup_clutter_lookup, setup_simulation_parameters, 0).capacity
+
+        assert testPostcode.capacity_with(extra_assets) == expected_capacity
+        assert testPostcode.capacity_with(extra_assets) > testPostcode.capacity
+
+        # the sector itself is unchanged
+        assert testPostcode.capacity_with([]) == testPostcode.capacity
+
+
 def test_lookup_clutter_geotype():
 
     clutter_lookup = [
@@ -179,3 +354,184 @@ def test_find_frequency_bandwidth(setup_simulation_parameters):
 
     with pytest.raises(KeyError, match='channel_bandwidth_1000'):
         find_frequency_bandwidth(1000, setup_simulation_parameters)
+
+
+def test_lookup_capacities(setup_capacity_lookup):
+
+    site_densities = [-1, 0, 0.1, 0.25, 0.6, 1, 1.5, 2, 2.5, 3, 10]
+    clutter_environments = ['rural'] * len(site_densities)
+
+    actual_result = lookup_capacities(setup_capacity_lookup,
+        clutter_environments, '800', '10', '4G', site_densities)
+
+    expected_result = [
+        lookup_capacity(setup_capacity_lookup,
+            'rural', '800', '10', '4G', site_density, 0)
+        for site_density in site_densities
+    ]
+
+    assert actual_result.tolist() == expected_result
+
+    actual_result = lookup_capacities(setup_capacity_lookup,
+        ['urban', 'rural', 'urban', 'rural'], '700', '10', '5G',
+        [0.5, 0.5, 3, 3])
+
+    assert actual_result.tolist() == [1, 1, 4, 2]
+
+    with pytest.raises(KeyError):
+        lookup_capacities(setup_capacity_lookup,
+            ['suburban'], '800', '10', '4G', [1])
+
+
+def test_calculate_capacities(setup_pcd_sector, setup_mixed_assets,
+    setup_capacity_lookup, setup_clutter_lookup,
+    setup_simulation_parameters):
+
+    pcd_sectors = [
+        PostcodeSector(pcd_sector_data,
+            [asset for asset in setup_mixed_assets
+                if asset['pcd_sector'] == pcd_sector_data['id']],
+            setup_capacity_lookup, setup_clutter_lookup,
+            setup_simulation_parameters, 0)
+        for pcd_sector_data in setup_pcd_sector
+    ]
+
+    actual_result = calculate_capacities(pcd_sectors,
+        setup_capacity_lookup, setup_simulation_parameters)
+
+    assert actual_result.tolist() == [
+        pcd_sector.capacity for pcd_sector in pcd_sectors]
+
+
+def test_capacity_lookup_table(setup_capacity_lookup):
+
+    lookup_table = CapacityLookupTable(setup_capacity_lookup)
+
+    assert ('rural', '800', '10', '4G') in lookup_table
+    assert ('rural', '100', '50', '2') not in lookup_table
+
+    site_densities = [-1, 0, 0.1, 0.25, 0.6, 1, 1.5, 2, 2.5, 3, 10]
+
+    for key in setup_capacity_lookup.keys():
+        expected_result = [
+            lookup_capacity(setup_capacity_lookup, *key, site_density, 0)
+            for site_density in site_densities
+        ]
+
+        actual_result = [
+            lookup_capacity(lookup_table, *key, site_density, 0)
+            for site_density in site_densities
+        ]
+        assert actual_result == expected_result
+
+        actual_result = lookup_table.lookup_array(key, site_densities)
+        assert actual_result.tolist() == expected_result
+
+    with pytest.raises(KeyError):
+        lookup_capacity(lookup_table, 'rural', '100', '50', '2', 1, 0)
+
+    # curves are sorted by density when compiled
+    lookup_table = CapacityLookupTable({
+        ('urban', '800', '10', '4G'): [(2, 4), (0, 0), (1, 2)]
+    })
+
+    assert lookup_table.lookup(('urban', '800', '10', '4G'), 1.5) == 3
+
+
+def test_minimum_density(setup_capacity_lookup):
+
+    lookup_table = CapacityLookupTable(setup_capacity_lookup)
+
+    key = ('rural', '2600', '10', '4G')
+
+    assert lookup_table.minimum_density(key, 0) == 0
+    assert lookup_table.minimum_density(key, 3) == 1.5
+    assert lookup_table.minimum_density(key, 5) == 3
+    assert lookup_table.minimum_density(key, 6) is None
+
+    for capacity in [0.5, 1, 2.5, 4, 4.5]:
+        site_density = lookup_table.minimum_density(key, capacity)
+        assert lookup_table.lookup(key, site_density) == pytest.approx(capacity)
+
+    # on a long curve with a plateau, the first density reaching a capacity
+    curve = [(density, min(density, 50) * 2) for density in range(100)]
+    lookup_table = CapacityLookupTable({key: curve})
+
+    assert lookup_table.minimum_density(key, 51) == 25.5
+    assert lookup_table.minimum_density(key, 100) == 50
+    assert lookup_table.minimum_density(key, 101) is None
+
+
+def test_asset(setup_mixed_assets):
+
+    data = setup_mixed_assets[0]
+    asset = Asset.from_dict(data)
+
+    # indexed like the dict it replaces
+    assert asset['site_ngr'] == 'site_100'
+    assert asset['opex'] == 10000
+    assert asset.get('capex') is None
+    assert 'sectors' in asset
+    with pytest.raises(KeyError):
+        asset['capex']
+
+    # lists of frequencies are held as a shared tuple
+    assert asset.frequency == ('800', '2600')
+    assert Asset.from_dict(data).frequency is asset.frequency
+
+    assert asset.to_dict() == data
+    assert asset == data
+    assert pickle.loads(pickle.dumps(asset)) == asset
+
+    with pytest.raises(AttributeError):
+        asset.site_ngr = 'site_200'
+
+    small_cell = Asset.from_dict(setup_mixed_assets[2], build_date=2020)
+    assert small_cell.frequency == '3700'
+    assert small_cell.build_date == 2020
+    assert small_cell != setup_mixed_assets[2]
+
+
+def test_network_manager_assets(setup_lad, setup_pcd_sector,
+    setup_mixed_assets, setup_capacity_lookup, setup_clutter_lookup,
+    setup_simulation_parameters):
+
+    manager = NetworkManager(setup_lad, setup_pcd_sector,
+        setup_mixed_assets, setup_capacity_lookup, setup_clutter_lookup,
+        setup_simulation_parameters)
+
+    dict_capacities = {
+        pcd_sector.id: pcd_sector.capacity
+        for pcd_sector in manager.postcode_sectors.values()
+    }
+
+    manager = NetworkManager(setup_lad, setup_pcd_sector,
+        [Asset.from_dict(asset) for asset in setup_mixed_assets],
+        setup_capacity_lookup, setup_clutter_lookup,
+        setup_simulation_parameters)
+
+    for pcd_sector in manager.postcode_sectors.values():
+        assert all(isinstance(asset, Asset) for asset in pcd_sector.assets)
+        assert pcd_sector.capacity == dict_capacities[pcd_sector.id]
+
+
+def test_site_index(setup_mixed_assets):
+
+    index = SiteIndex(setup_mixed_assets)
+
+    assert index.macrocell_sites == {'site_100', 'site_200'}
+    assert index.num_small_cells == 4
+    assert index.sites_by_frequency['800'] == {'site_100', 'site_200'}
+    assert index.sites_by_frequency['700'] == set()
+    assert index.site_technologies['site_100'] == {'LTE'}
+    assert index.site_frequencies['site_100'] == [['800', '2600']]
+
+    # updated incrementally as assets are added
+    incremental_index = SiteIndex(setup_mixed_assets[:3])
+    incremental_index.add(setup_mixed_assets[3:])
+
+    assert incremental_index.site_technologies == index.site_technologies
+    assert incremental_index.site_frequencies == index.site_frequencies
+    assert incremental_index.macrocell_sites == index.macrocell_sites
+    assert incremental_index.sites_by_frequency == index.sites_by_frequency
+    assert incremental_index.num_small_cells == index.num_small_cells
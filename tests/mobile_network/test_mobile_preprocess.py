@@ -0,0 +1,33 @@
+import pytest
+
+from shapely.geometry import Point
+from shapely.ops import unary_union
+
+
+def test_process_asset_data():
+
+    from scripts.mobile_preprocess import process_asset_data
+
+    # three masts in an L, so the buffer union centroid is not their mean,
+    # and one mast standing alone
+    coordinates = [(0, 0), (80, 0), (0, 80), (1000, 1000)]
+    data = [
+        {
+        'type': 'Feature',
+        'geometry': {'type': 'Point', 'coordinates': coordinates},
+        'properties': {'name': 'mast_{}'.format(i), 'Opref': i},
+        }
+        for i, coordinates in enumerate(coordinates)
+    ]
+
+    output = process_asset_data(data)
+
+    assert [site['properties']['name'] for site in output] == ['mast_0', 'mast_3']
+
+    centroid = unary_union(
+        [Point(point).buffer(50) for point in coordinates[:3]]).centroid
+    x, y = output[0]['geometry']['coordinates']
+    assert (x, y) == pytest.approx((centroid.x, centroid.y))
+    assert x != pytest.approx(80 / 3)
+
+    assert output[1]['geometry']['coordinates'] == [1000, 1000]
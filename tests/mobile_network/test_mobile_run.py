@@ -0,0 +1,58 @@
+import argparse
+import multiprocessing
+import queue
+
+import pytest
+
+
+def test_workers_argument():
+
+    from scripts.mobile_run import _workers
+
+    assert _workers('4') == 4
+
+    for value in ['0', '-1']:
+        with pytest.raises(argparse.ArgumentTypeError):
+            _workers(value)
+
+
+class PoolResults():
+    """Scenarios completing in turn, as from Pool.imap_unordered, with a
+    wait before each."""
+    def __init__(self, scenarios):
+        self.scenarios = list(scenarios)
+        self.waited = False
+
+    def next(self, timeout=None):
+        if not self.waited:
+            self.waited = True
+            raise multiprocessing.TimeoutError
+        self.waited = False
+        return self.scenarios.pop(0)
+
+
+def test_report_progress(capsys):
+
+    from scripts.mobile_run import _report_progress, TIMESTEPS
+
+    first = ('baseline', 'high', 'minimal')
+    second = ('baseline', 'low', 'minimal')
+
+    # years of both scenarios reported by workers, interleaved
+    progress_queue = queue.Queue()
+    for year in TIMESTEPS:
+        progress_queue.put((second, year, 2e6))
+        progress_queue.put((first, year, 1e6))
+
+    _report_progress(PoolResults([first, second]), 2, progress_queue)
+
+    lines = capsys.readouterr().out.splitlines()
+
+    assert len(lines) == 2 * len(TIMESTEPS) + 2
+    assert lines[0] == '- {} base_low_minimal: population written is 2.0'.format(
+        TIMESTEPS[0])
+
+    # every year of a scenario is printed before its completion
+    completed = lines.index('Completed 1 of 2: base_high_minimal')
+    assert completed == len(lines) - 2
+    assert lines[-1] == 'Completed 2 of 2: base_low_minimal'
@@ -0,0 +1,94 @@
+import datetime
+import os
+
+import fiona
+import pytest
+
+from digital_comms import feature_cache
+from digital_comms.feature_cache import FeatureCache, read_features
+
+SCHEMA = {'geometry': 'Polygon', 'properties': {'name': 'str', 'value': 'int'}}
+
+
+def write_shapefile(path, names):
+    with fiona.open(path, 'w', driver='ESRI Shapefile', schema=SCHEMA) as sink:
+        for i, name in enumerate(names):
+            sink.write({
+                'geometry': {
+                    'type': 'Polygon',
+                    'coordinates': [[(i, 0), (i + 1, 0), (i + 1, 1), (i, 1), (i, 0)]],
+                },
+                'properties': {'name': name, 'value': i},
+            })
+
+
+def test_feature_cache(tmpdir, monkeypatch):
+
+    path = str(tmpdir.join('areas.shp'))
+    write_shapefile(path, ['A', 'B'])
+
+    cache = FeatureCache(str(tmpdir.join('cache.sqlite')))
+
+    features = cache.read(path)
+
+    assert [f['properties'] for f in features] == [
+        {'name': 'A', 'value': 0}, {'name': 'B', 'value': 1}]
+    assert features[1]['geometry']['type'] == 'Polygon'
+
+    # an unchanged source is read from the cache, not through fiona
+    def fail(*args, **kwargs):
+        raise AssertionError('source read again')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(feature_cache.fiona, 'open', fail)
+        cached = cache.read(path)
+
+    assert cached == features
+
+    # a changed source is read again
+    write_shapefile(path, ['A', 'B', 'C'])
+    os.utime(path, ns=(0, 0))
+
+    assert [f['properties']['name'] for f in cache.read(path)] == ['A', 'B', 'C']
+
+    cache.invalidate(path)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(feature_cache.fiona, 'open', fail)
+        with pytest.raises(AssertionError):
+            cache.read(path)
+
+
+def test_read_features(tmpdir):
+
+    path = str(tmpdir.join('areas.shp'))
+    write_shapefile(path, ['A'])
+
+    # the cache, and its directory, are made where given, not by the source
+    cache_path = str(tmpdir.join('intermediate', 'feature_cache.sqlite'))
+
+    assert read_features(path, cache_path) == read_features(path, cache_path)
+    assert os.path.exists(cache_path)
+    assert not os.path.exists(str(tmpdir.join('feature_cache.sqlite')))
+
+
+def test_feature_cache_properties(tmpdir, monkeypatch):
+
+    path = str(tmpdir.join('areas.shp'))
+    write_shapefile(path, ['A'])
+
+    cache = FeatureCache(str(tmpdir.join('cache.sqlite')))
+
+    # properties JSON cannot hold fail loudly, rather than as strings
+    def read_source(path):
+        return [{
+            'type': 'Feature',
+            'id': '0',
+            'geometry': None,
+            'properties': {'name': 'A', 'date': datetime.date(2018, 1, 1)},
+        }]
+
+    monkeypatch.setattr(feature_cache, '_read_source', read_source)
+
+    with pytest.raises(TypeError):
+        cache.read(path)
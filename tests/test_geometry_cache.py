@@ -0,0 +1,43 @@
+from shapely.geometry import Point, mapping
+
+from digital_comms.geometry_cache import GeometryCache
+
+
+def square(x, y, size):
+    return {
+        'type': 'Polygon',
+        'coordinates': [[
+            (x, y), (x + size, y), (x + size, y + size), (x, y + size), (x, y)
+        ]],
+    }
+
+
+def test_geometry_cache():
+
+    areas = [
+        {'geometry': square(0, 0, 10), 'properties': {'name': 'A'}},
+        {'geometry': square(10, 0, 10), 'properties': {'name': 'B'}},
+    ]
+
+    cache = GeometryCache()
+
+    assert cache.bounds(areas[0]) == (0, 0, 10, 10)
+    assert cache.shape(areas[1]).area == 100
+    assert cache.prepared(areas[0]).intersects(Point(5, 5))
+    assert not cache.prepared(areas[1]).intersects(Point(5, 5))
+
+    # features rebuilt around the same geometry share an entry
+    rebuilt = {'geometry': areas[0]['geometry'], 'properties': {}}
+
+    assert cache.shape(rebuilt) is cache.shape(areas[0])
+    assert cache.prepared(rebuilt) is cache.prepared(areas[0])
+    assert len(cache) == 2
+
+    idx = cache.index(areas)
+
+    assert sorted(idx.intersection((12, 2, 13, 3))) == [1]
+    assert sorted(idx.intersection((9, 2, 11, 3))) == [0, 1]
+
+    cache.clear()
+
+    assert len(cache) == 0